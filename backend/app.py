@@ -17,7 +17,13 @@ from routes.exercise import router as exercise_router
 from routes.admin import router as admin_router
 
 # 导入数据库
-from models.database import engine, Base
+from models.database import engine, Base, SessionLocal
+
+# 导入共享服务
+from services.http_pool import http_pool
+from services.pdf_jobs import pdf_job_manager
+from services.ai_call_logger import ai_call_log_writer
+from services.pregeneration import pregeneration_pool
 
 # 创建数据库表
 Base.metadata.create_all(bind=engine)
@@ -59,6 +65,23 @@ app.include_router(ai_router, prefix="/api/ai", tags=["AI功能"])
 app.include_router(exercise_router, prefix="/api/exercise", tags=["练习题目"])
 app.include_router(admin_router, prefix="/api/admin", tags=["超级管理员"])
 
+@app.on_event("startup")
+async def startup_event():
+    """应用启动时把上次退出时中断的PDF渲染任务标记为失败，轮询的客户端不会一直等待"""
+    db = SessionLocal()
+    try:
+        pdf_job_manager.reconcile(db)
+    finally:
+        db.close()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """应用关闭时停止题目预生成、释放上游AI接口连接池、结束PDF渲染任务并写完积压的调用日志"""
+    await pregeneration_pool.stop()
+    await http_pool.close()
+    await pdf_job_manager.shutdown()
+    await ai_call_log_writer.drain()
+
 @app.get("/")
 async def root():
     return {"message": "精准动态教辅系统API", "version": "1.0.0"}
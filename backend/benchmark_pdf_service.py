@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PDF服务初始化开销基准测试
+对比每次渲染都重新解析字体、构建样式（旧方式）与使用进程级字体注册表、
+共享样式和单例服务（新方式）时的单份PDF准备耗时。
+
+用法: python benchmark_pdf_service.py [迭代次数]
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+
+from services import pdf_service
+from services.pdf_service import get_pdf_service, CHINESE_FONT_NAME, CHINESE_FONT_PATH
+
+SAMPLE_EXERCISE = {
+    "subject": "数学",
+    "title": "七年级数学练习 - 10题",
+    "question_count": 10,
+    "question_type": "choice",
+    "difficulty_level": 2,
+    "generated_content": {
+        "questions": [
+            {
+                "id": i,
+                "type": "choice",
+                "content": f"第{i}题：计算 {i} + {i * 2} 的结果是多少？",
+                "options": ["A. 1", "B. 2", "C. 3", f"D. {i * 3}"],
+                "answer": "D",
+                "knowledge_point": "有理数加法"
+            }
+            for i in range(1, 11)
+        ]
+    }
+}
+
+
+def legacy_setup():
+    """旧方式：每次构造服务都解析TTF并重建样式表"""
+    if os.path.exists(CHINESE_FONT_PATH):
+        pdfmetrics.registerFont(TTFont(CHINESE_FONT_NAME, CHINESE_FONT_PATH))
+        font_name = CHINESE_FONT_NAME
+    else:
+        font_name = 'Helvetica'
+    styles = getSampleStyleSheet()
+    for name, parent in (('CustomTitle', 'Heading1'), ('CustomHeading', 'Heading2'),
+                         ('CustomNormal', 'Normal'), ('QuestionStyle', 'Normal')):
+        ParagraphStyle(name, parent=styles[parent], fontName=font_name, fontSize=12)
+
+
+def cached_setup():
+    """新方式：复用进程级单例服务"""
+    get_pdf_service()
+
+
+def measure(func, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+
+    if not os.path.exists(CHINESE_FONT_PATH):
+        print(f"⚠️  未找到中文字体 {CHINESE_FONT_PATH}，字体解析开销将无法体现")
+
+    print(f"🔍 迭代次数: {iterations}")
+    legacy_ms = measure(legacy_setup, iterations)
+    print(f"📊 旧方式单次初始化: {legacy_ms:.2f} ms")
+
+    # 首次调用包含一次性的字体加载
+    pdf_service._shared_service = None
+    first_start = time.perf_counter()
+    cached_setup()
+    first_ms = (time.perf_counter() - first_start) * 1000
+    cached_ms = measure(cached_setup, iterations)
+    print(f"📊 新方式首次初始化: {first_ms:.2f} ms")
+    print(f"📊 新方式单次初始化: {cached_ms:.4f} ms")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output_path = os.path.join(tmp_dir, "bench.pdf")
+        render_ms = measure(
+            lambda: get_pdf_service().generate_exercise_pdf(SAMPLE_EXERCISE, output_path),
+            iterations
+        )
+    print(f"📊 单份PDF渲染耗时(不含初始化): {render_ms:.2f} ms")
+    print(f"✅ 每份PDF节省初始化开销约 {legacy_ms - cached_ms:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
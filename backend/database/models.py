@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, ForeignKey, Float, JSON
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, ForeignKey, Float, JSON, Index, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -23,6 +23,7 @@ class User(Base):
     real_name = Column(String(100), nullable=False)
     hashed_password = Column(String(255), nullable=False)
     role = Column(String(20), nullable=False, default=UserRole.student)
+    school = Column(String(100), nullable=True)  # 所属学校/机构，限流时同一机构的账号共享份额
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
@@ -62,10 +63,31 @@ class AICallLog(Base):
     response_time = Column(Float, nullable=False)  # 响应时间（秒）
     success = Column(Boolean, default=True)
     error_message = Column(Text, nullable=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
     
     user = relationship("User")
 
+class AICallRollup(Base):
+    __tablename__ = "ai_call_rollups"
+    __table_args__ = (
+        UniqueConstraint("granularity", "bucket_start", "model_name", "function_type",
+                         name="uq_ai_call_rollup_bucket"),
+        Index("ix_ai_call_rollups_window", "granularity", "bucket_start"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    granularity = Column(String(10), nullable=False)  # minute, hour, day
+    bucket_start = Column(DateTime, nullable=False)  # 时间桶起点（UTC）
+    model_name = Column(String(100), nullable=False)
+    function_type = Column(String(100), nullable=False)
+    call_count = Column(Integer, default=0)
+    success_count = Column(Integer, default=0)
+    prompt_tokens = Column(Integer, default=0)
+    completion_tokens = Column(Integer, default=0)
+    total_tokens = Column(Integer, default=0)
+    total_response_time = Column(Float, default=0.0)  # 响应时间合计（秒）
+    latency_histogram = Column(JSON)  # 各延迟区间的调用次数，区间见 services/ai_analytics.py
+
 class ErrorRecord(Base):
     __tablename__ = "error_records"
     
@@ -103,6 +125,78 @@ class Exercise(Base):
     
     user = relationship("User", back_populates="exercises")
 
+class PDFJob(Base):
+    __tablename__ = "pdf_jobs"
+    
+    id = Column(String(36), primary_key=True, index=True)  # 任务ID (UUID)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    exercise_id = Column(Integer, ForeignKey("exercises.id"), nullable=False)
+    job_type = Column(String(20), nullable=False)  # exercise, answer, preview
+    include_answers = Column(Boolean, default=False)
+    status = Column(String(20), default="queued", index=True)  # queued, running, done, failed
+    file_path = Column(String(500), nullable=True)  # 生成的PDF路径
+    error_message = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)  # 渲染期间定期刷新，判断所在进程是否仍在运行
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    
+    user = relationship("User")
+    exercise = relationship("Exercise")
+
+class QuestionBankItem(Base):
+    __tablename__ = "question_bank"
+    __table_args__ = (
+        Index("ix_question_bank_lookup", "subject", "grade", "knowledge_point",
+              "question_type", "difficulty_level"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    subject = Column(String(100), nullable=False)  # 学科
+    grade = Column(String(20), nullable=True)  # 年级
+    knowledge_point = Column(String(200), nullable=False)  # 知识点
+    question_type = Column(String(20), nullable=False)  # choice, fill, solve
+    difficulty_level = Column(Integer, default=1)  # 难度等级
+    content = Column(Text, nullable=False)  # 题目内容
+    options = Column(JSON, nullable=True)  # 选择题选项
+    answer = Column(Text, nullable=True)  # 正确答案
+    content_hash = Column(String(64), unique=True, index=True, nullable=False)  # 规范化题干哈希
+    signature = Column(Text, nullable=True)  # 近似去重的MinHash签名
+    source = Column(String(20), default="ai")  # ai, manual
+    model_name = Column(String(100), nullable=True)  # 生成该题的模型
+    usage_count = Column(Integer, default=0)  # 被组卷次数
+    last_served_at = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class ExerciseDemand(Base):
+    __tablename__ = "exercise_demands"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    combo_key = Column(String(64), unique=True, index=True, nullable=False)  # 组卷参数哈希
+    subject = Column(String(100), nullable=False)
+    grade = Column(String(20), nullable=True)
+    knowledge_points = Column(JSON, nullable=False)
+    question_type = Column(String(20), nullable=False)
+    question_count = Column(Integer, nullable=False)
+    difficulty_level = Column(Integer, default=1)
+    request_count = Column(Integer, default=0)  # 累计请求次数
+    score = Column(Float, default=0.0)  # 按时间衰减的热度
+    last_requested_at = Column(DateTime, nullable=True)  # UTC
+
+class PregeneratedSet(Base):
+    __tablename__ = "pregenerated_sets"
+    __table_args__ = (
+        Index("ix_pregenerated_sets_claim", "combo_key", "status"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    combo_key = Column(String(64), nullable=False)
+    questions = Column(JSON, nullable=False)  # 预生成的整套题目
+    status = Column(String(20), default="ready")  # ready, claimed
+    claimed_by = Column(Integer, ForeignKey("users.id"), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    claimed_at = Column(DateTime(timezone=True), nullable=True)
+
 class UserGameData(Base):
     __tablename__ = "user_game_data"
     
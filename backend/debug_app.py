@@ -12,6 +12,9 @@ import json
 # 添加当前目录到Python路径
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
+from services.image_preprocess import image_preprocessor
+from services.vision_client import vision_client, VisionConfig, default_vision_config
+
 # 默认AI配置 - 通义千问视觉模型
 DEFAULT_AI_CONFIG = {
     "provider": "tongyi",
@@ -70,158 +73,46 @@ async def test_ai_connection():
     测试AI模型连通性
     """
     try:
-        print(f"
-🔍 ===== 开始AI连通性测试 =====")
+        print(f"\n🔍 ===== 开始AI连通性测试 =====")
         print(f"🤖 测试模型: {DEFAULT_AI_CONFIG['model_name']}")
         print(f"🔑 API Key: {DEFAULT_AI_CONFIG['api_key'][:20]}...")
         
-        headers = {
-            "Authorization": f"Bearer {DEFAULT_AI_CONFIG['api_key']}",
-            "Content-Type": "application/json",
-            "X-DashScope-SSE": "disable"
-        }
-        
-        # 简单的文本测试请求
-        payload = {
-            "model": "qwen-plus",  # 使用文本模型进行连通性测试
-            "input": {
-                "messages": [
-                    {
-                        "role": "user", 
-                        "content": "你好，请回复'连接正常'"
-                    }
-                ]
-            },
-            "parameters": {
-                "result_format": "message",
-                "max_tokens": 50
-            }
-        }
-        
-        print(f"📡 发送连通性测试请求...")
-        
-        async with httpx.AsyncClient(
-            timeout=httpx.Timeout(30.0, connect=10.0)
-        ) as client:
-            response = await client.post(
-                "https://dashscope.aliyuncs.com/api/v1/services/aigc/text-generation/generation",
-                headers=headers,
-                json=payload
-            )
-            
-            print(f"📡 连通性测试响应状态码: {response.status_code}")
-            
-            if response.status_code == 200:
-                result = response.json()
-                print(f"✅ AI连通性测试成功")
-                print(f"📋 测试响应: {json.dumps(result, ensure_ascii=False, indent=2)}")
-                
-                return {
-                    "success": True, 
-                    "message": "qwen-vl-max模型连通正常",
-                    "model": DEFAULT_AI_CONFIG['model_name'],
-                    "status": "connected"
-                }
-            else:
-                error_text = response.text
-                print(f"❌ AI连通性测试失败: {response.status_code}")
-                print(f"❌ 错误详情: {error_text}")
-                return {
-                    "success": False, 
-                    "message": f"AI模型连通失败: {response.status_code} - {error_text}",
-                    "status": "disconnected"
-                }
-                
-    except Exception as e:
-        print(f"❌ AI连通性测试异常: {str(e)}")
-        import traceback
-        print(f"❌ 异常堆栈: {traceback.format_exc()}")
-        return {
-            "success": False, 
-            "message": f"连通性测试异常: {str(e)}",
-            "status": "error"
-        }
-
-# 调用通义千问视觉API
-async def call_tongyi_vision_api(prompt: str, image_url: str):
-    """
-    调用通义千问视觉API - 支持图像输入 (qwen-vl-max)
-    """
-    try:
-        print(f"🔍 开始调用视觉API")
-        print(f"📝 提示词长度: {len(prompt)}")
-        print(f"🖼️ 图片数据长度: {len(image_url)}")
-        print(f"🖼️ 图片数据类型: {type(image_url)}")
-        print(f"🖼️ 图片数据开头: {str(image_url)[:50]}...")
-        
-        headers = {
-            "Authorization": f"Bearer {DEFAULT_AI_CONFIG['api_key']}",
-            "Content-Type": "application/json",
-            "X-DashScope-SSE": "disable"
-        }
-        
         # 构建多模态消息
-        content = [
-            {
-                "text": prompt
-            },
+        messages = [
             {
-                "image": image_url
-            }
-        ]
-        
-        payload = {
-            "model": DEFAULT_AI_CONFIG['model_name'],
-            "input": {
-                "messages": [
-                    {
-                        "role": "user", 
-                        "content": content
-                    }
+                "role": "user",
+                "content": [
+                    {"text": prompt},
+                    {"image": image_url}
                 ]
-            },
-            "parameters": {
-                "result_format": "message",
-                "max_tokens": 2000,
-                "temperature": 0.7
             }
-        }
+        ]
         
         print(f"🤖 调用通义千问视觉API: {DEFAULT_AI_CONFIG['api_endpoint']}")
         print(f"📝 使用模型: {DEFAULT_AI_CONFIG['model_name']}")
         print(f"🔑 API Key: {DEFAULT_AI_CONFIG['api_key'][:20]}...")
         
-        async with httpx.AsyncClient(
-            timeout=httpx.Timeout(120.0, connect=15.0),
-            limits=httpx.Limits(max_connections=10, max_keepalive_connections=5)
-        ) as client:
-            print(f"📡 发送请求到API...")
-            response = await client.post(
-                DEFAULT_AI_CONFIG['api_endpoint'],
-                headers=headers,
-                json=payload
-            )
-            
-            print(f"📡 API响应状态码: {response.status_code}")
-            print(f"📡 API响应头: {dict(response.headers)}")
-            
-            if response.status_code == 200:
-                result = response.json()
-                print(f"📋 API响应内容: {json.dumps(result, ensure_ascii=False, indent=2)}")
-                
-                if result.get("output") and result["output"].get("choices"):
-                    content = result["output"]["choices"][0]["message"]["content"]
-                    print(f"✅ 通义千问视觉API调用成功，生成内容长度: {len(content)}")
-                    print(f"📝 生成内容预览: {content[:200]}...")
-                    return {"success": True, "content": content}
-                else:
-                    print(f"❌ 通义千问视觉API返回格式异常: {result}")
-                    return {"success": False, "error": "API返回格式异常"}
-            else:
-                error_text = response.text
-                print(f"❌ 通义千问视觉API调用失败: {response.status_code}")
-                print(f"❌ 错误详情: {error_text}")
-                return {"success": False, "error": f"API调用失败: {response.status_code} - {error_text}"}
+        print(f"📡 发送请求到API...")
+        result = await vision_client.call(
+            messages,
+            VisionConfig(
+                model_name=DEFAULT_AI_CONFIG['model_name'],
+                api_endpoint=DEFAULT_AI_CONFIG['api_endpoint'],
+                api_key=DEFAULT_AI_CONFIG['api_key'],
+                model_params=default_vision_config().model_params
+            ),
+            timeout=120,
+            parameters={"max_tokens": 2000, "temperature": 0.7}
+        )
+        
+        if result["success"]:
+            content = result["content"]
+            print(f"✅ 通义千问视觉API调用成功，耗时 {result['response_time']:.1f} 秒，生成内容长度: {len(content)}")
+            print(f"📝 生成内容预览: {content[:200]}...")
+            return {"success": True, "content": content}
+        else:
+            print(f"❌ 通义千问视觉API调用失败: {result['error']}")
+            return {"success": False, "error": result["error"]}
                 
     except Exception as e:
         print(f"❌ 通义千问视觉API调用异常: {str(e)}")
@@ -332,6 +223,9 @@ async def photo_correction(request_data: dict):
             print(f"❌ 图片数据格式不正确，不是data:image格式")
             return {"success": False, "message": "图片数据格式不正确"}
         
+        image_data, preprocess_info = await image_preprocessor.prepare(image_data)
+        print(f"🗜️ 图片预处理: {preprocess_info}")
+        
         print(f"🖼️ 开始调用qwen-vl-max模型...")
         
         # 调用通义千问视觉API
@@ -375,5 +269,10 @@ async def photo_correction(request_data: dict):
         print(f"❌ 异常堆栈: {traceback.format_exc()}")
         return {"success": False, "message": f"批阅失败: {str(e)}"}
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    image_preprocessor.shutdown()
+    await vision_client.close()
+
 if __name__ == "__main__":
     uvicorn.run("debug_app:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
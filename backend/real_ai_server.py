@@ -1,17 +1,19 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """
-真实的AI拍照批阅后端服务 - 使用Dashscope SDK
+真实的AI拍照批阅后端服务 - 使用异步视觉客户端
 """
 
+import os
 import uvicorn
 import json
-import dashscope
-from http import HTTPStatus
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import List, Dict, Union, Any
+from services.vision_client import (
+    vision_client, default_vision_config, cancel_on_disconnect, ClientDisconnected
+)
 
 # --- 配置 ---
 # 加载环境变量
@@ -28,10 +30,8 @@ if not DASHSCOPE_API_KEY:
     print("Please set it in your .env file")
     DASHSCOPE_API_KEY = "your-api-key-not-set"
 
-dashscope.api_key = DASHSCOPE_API_KEY
-
 # --- FastAPI 应用设置 ---
-app = FastAPI(title="AI拍照批阅服务 (Dashscope SDK)")
+app = FastAPI(title="AI拍照批阅服务")
 
 app.add_middleware(
     CORSMiddleware,
@@ -49,35 +49,34 @@ class PhotoCorrectionRequest(BaseModel):
 # --- API 端点 ---
 @app.get("/")
 async def root():
-    return {"message": "AI拍照批阅服务运行正常", "model": "qwen-vl-max", "sdk": "dashscope"}
+    return {"message": "AI拍照批阅服务运行正常", "model": "qwen-vl-max"}
 
 @app.get("/api/ai/test-connection")
 async def test_connection():
-    """使用Dashscope SDK测试AI模型连通性"""
+    """测试AI模型连通性"""
     try:
-        print("--- 正在测试 qwen-vl-max 连通性 (SDK) ---")
+        print("--- 正在测试 qwen-vl-max 连通性 ---")
         messages = [{'role': 'user', 'content': [{'text': "你好，请回复'连接正常'以确认连接。"}]}]
         
-        response = dashscope.MultiModalConversation.call(
-            model='qwen-vl-max',
-            messages=messages
-        )
+        result = await vision_client.call(messages, default_vision_config(DASHSCOPE_API_KEY), timeout=30)
 
-        if response.status_code == HTTPStatus.OK:
+        if result['success']:
             print("✅ 连通性测试成功")
             return {
                 "success": True,
                 "status": "success",
-                "message": "qwen-vl-max 模型连通正常 (SDK)",
+                "message": "qwen-vl-max 模型连通正常",
                 "model": "qwen-vl-max"
             }
         else:
-            print(f"❌ 连通性测试失败: {response.code} - {response.message}")
+            print(f"❌ 连通性测试失败: {result['error']}")
             raise HTTPException(
                 status_code=500, 
-                detail=f"API返回错误: {response.code} - {response.message}"
+                detail=f"API返回错误: {result['error']}"
             )
             
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ 连通性测试异常: {str(e)}")
         raise HTTPException(
@@ -86,12 +85,12 @@ async def test_connection():
         )
 
 @app.post("/api/ai/photo-correction")
-async def photo_correction(request: PhotoCorrectionRequest):
-    """使用Dashscope SDK进行AI拍照批阅"""
+async def photo_correction(request: PhotoCorrectionRequest, http_request: Request):
+    """AI拍照批阅"""
     try:
         print(f"📸 收到批阅请求, 类型: {request.correction_type}, 图片数据长度: {len(request.image)}")
 
-        # Dashscope SDK可以直接处理带有 "data:image/jpeg;base64," 前缀的base64字符串
+        # 视觉接口可以直接处理带有 "data:image/jpeg;base64," 前缀的base64字符串
         # 无需手动去除
         image_data = request.image
         
@@ -152,16 +151,16 @@ async def photo_correction(request: PhotoCorrectionRequest):
             }
         ]
         
-        print("📡 正在通过 Dashscope SDK 调用 qwen-vl-max API...")
-        response = dashscope.MultiModalConversation.call(
-            model='qwen-vl-max',
-            messages=messages
+        print("📡 正在调用 qwen-vl-max API...")
+        # 异步调用，不阻塞其他用户的请求；客户端断开时取消调用
+        result = await cancel_on_disconnect(
+            http_request, vision_client.call(messages, default_vision_config(DASHSCOPE_API_KEY))
         )
         
-        if response.status_code == HTTPStatus.OK:
-            print("✅ API 调用成功")
+        if result['success']:
+            print(f"✅ API 调用成功，耗时 {result['response_time']:.1f} 秒")
             # 提取模型返回的文本内容
-            ai_response_text = response.output.choices[0].message.content[0]['text']
+            ai_response_text = result['content']
             print(f"🤖 AI 原始回复: \n{ai_response_text}")
             
             # 尝试解析AI返回的JSON字符串
@@ -192,17 +191,30 @@ async def photo_correction(request: PhotoCorrectionRequest):
                 }
 
         else:
-            error_msg = f"Dashscope API 调用失败: {response.code} - {response.message}"
+            error_msg = f"Dashscope API 调用失败: {result['error']}"
             print(f"❌ {error_msg}")
-            raise HTTPException(status_code=500, detail=error_msg)
+            raise HTTPException(status_code=504 if result.get('timeout') else 500, detail=error_msg)
             
+    except ClientDisconnected:
+        print("🔌 客户端已断开，批阅已取消")
+        raise HTTPException(status_code=499, detail="客户端已断开")
+    except HTTPException:
+        raise
     except Exception as e:
         error_msg = f"服务器内部错误: {str(e)}"
         print(f"❌ {error_msg}")
         raise HTTPException(status_code=500, detail=error_msg)
 
+@app.get("/api/ai/vision-stats")
+async def vision_stats():
+    return vision_client.get_stats()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await vision_client.close()
+
 if __name__ == "__main__":
-    print("🚀 启动AI拍照批阅服务 (使用 Dashscope SDK)...")
+    print("🚀 启动AI拍照批阅服务...")
     print(f"🔑 Dashscope API Key: ...{DASHSCOPE_API_KEY[-4:]}")
     print("🧠 使用模型: qwen-vl-max")
     print("🌐 服务地址: http://localhost:8000")
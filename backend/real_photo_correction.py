@@ -1,16 +1,32 @@
 # 真实的AI拍照批阅服务 - 调用通义千问qwen-vl-max模型
 import os
 import json
+import copy
+import asyncio
+import math
 import base64
+import hashlib
 import logging
 from datetime import datetime
-from typing import Dict, Any, List
-from fastapi import FastAPI, HTTPException
+from typing import Dict, Any, List, Optional, Callable
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import uvicorn
 import httpx
 from dotenv import load_dotenv
+from services.image_preprocess import image_preprocessor
+from services.upload_stream import receive_upload, UploadError
+from services.photo_cache import photo_result_cache, cache_namespace
+from services.vision_client import (
+    vision_client, default_vision_config, cancel_on_disconnect, ClientDisconnected
+)
+from services.photo_jobs import (
+    photo_job_manager, PhotoJobError, PhotoJobQueueFull, FINAL_STATUSES
+)
+from services.stream_parser import IncrementalQuestionParser
+from services.photo_layout import split_question_regions, PHOTO_CROP_CONCURRENCY
 
 # 加载环境变量
 load_dotenv()
@@ -151,22 +167,162 @@ async def test_ai_connection():
 
 # 真实的AI拍照批阅接口
 @app.post("/api/ai/photo-correction")
-async def photo_correction(request: PhotoCorrectionRequest):
+async def photo_correction(request: PhotoCorrectionRequest, http_request: Request):
     logger.info("📸 开始真实AI拍照批阅...")
     logger.info(f"📋 批阅类型: {request.type}")
     logger.info(f"⚙️ 配置参数: {request.config}")
     logger.info(f"🖼️ 图片数据长度: {len(request.image)} 字符")
     
+    sha256 = hashlib.sha256(request.image.encode()).hexdigest()
+    # 缩放、校正方向并重新编码，减小上传体积与视觉token
+    image, preprocess_info = await image_preprocessor.prepare(request.image)
+    logger.info(f"🗜️ 图片预处理: {preprocess_info}")
+    return await correct_until_disconnect(
+        http_request, correct_photo(image, request.type, request.config, preprocess_info, sha256)
+    )
+
+# 拍照批阅接口（multipart上传）：字段 image 为图片文件，type 与 config(JSON) 为普通字段
+@app.post("/api/ai/photo-correction/upload")
+async def photo_correction_upload(request: Request):
+    logger.info("📸 开始真实AI拍照批阅（文件上传）...")
+    
+    image, correction_type, config, preprocess_info, sha256 = await receive_photo(request)
+    return await correct_until_disconnect(
+        request, correct_photo(image, correction_type, config, preprocess_info, sha256)
+    )
+
+# 异步批阅任务（multipart上传，字段同上）：立即返回任务ID，批阅在后台工作协程中执行
+@app.post("/api/ai/photo-correction/jobs", status_code=202)
+async def submit_photo_correction_job(request: Request):
+    logger.info("📸 提交AI拍照批阅任务...")
+    
+    image, correction_type, config, preprocess_info, sha256 = await receive_photo(request)
     try:
-        api_key = get_api_key()
-        
-        # 构建AI提示词
-        subject = request.config.get('subject', '数学')
-        grade = request.config.get('grade', '小学')
-        need_explanation = request.config.get('needExplanation', True)
-        need_similar = request.config.get('needSimilarQuestions', False)
+        job_id = await photo_job_manager.submit(correction_type, config, image, sha256, preprocess_info)
+    except PhotoJobQueueFull as e:
+        logger.warning(f"⚠️ {e}")
+        raise HTTPException(status_code=503, detail="批阅任务繁忙，请稍后重试",
+                            headers={"Retry-After": "10"})
+    
+    logger.info(f"🧾 批阅任务已排队: {job_id}")
+    return {
+        "success": True,
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"/api/ai/photo-correction/jobs/{job_id}",
+        "events_url": f"/api/ai/photo-correction/jobs/{job_id}/events"
+    }
+
+@app.get("/api/ai/photo-correction/jobs/{job_id}")
+async def get_photo_correction_job(job_id: str):
+    """查询批阅任务状态；运行中返回已批改完成的题目"""
+    job = await photo_job_manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="批阅任务不存在")
+    return describe_job(job)
+
+@app.get("/api/ai/photo-correction/jobs/{job_id}/events")
+async def photo_correction_job_events(job_id: str, request: Request):
+    """以SSE推送批阅进度：每批改完一道题推送一次 correction 事件，结束时推送 done 或 failed"""
+    job = await photo_job_manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="批阅任务不存在")
+    
+    async def event_stream():
+        sent = 0
+        status = None
+        while not await request.is_disconnected():
+            job = await photo_job_manager.get(job_id)
+            if job is None:
+                break
+            partial = job["partial"] or []
+            if len(partial) < sent:
+                # 任务被限流后重新排队，逐题结果从头开始
+                sent = 0
+            for index in range(sent, len(partial)):
+                yield sse_event("correction", {"index": index, "correction": partial[index]})
+            sent = len(partial)
+            if job["status"] != status:
+                status = job["status"]
+                yield sse_event("status", {"status": status})
+            if status in FINAL_STATUSES:
+                yield sse_event(status, describe_job(job))
+                break
+            await photo_job_manager.wait_for_change()
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def describe_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    partial = job["partial"] or []
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "correction_type": job["correction_type"],
+        "attempts": job["attempts"],
+        "completed_questions": len(partial),
+        "partial_corrections": partial,
+        "result": job["result"],
+        "error": job["error"],
+        "status_code": job["status_code"],
+        "created_at": datetime.fromtimestamp(job["created_at"]).isoformat(),
+        "finished_at": datetime.fromtimestamp(job["finished_at"]).isoformat() if job["finished_at"] else None
+    }
+
+async def run_photo_job(job: Dict[str, Any], report: Callable[[Dict[str, Any]], None]) -> Dict[str, Any]:
+    """后台工作协程执行一个批阅任务；HTTP错误转换为任务错误，限流时稍后重试"""
+    try:
+        return await correct_photo(
+            job["image"], job["correction_type"], job["config"],
+            job["preprocess_info"] or {}, job["sha256"], on_correction=report
+        )
+    except HTTPException as e:
+        retry_after = None
+        if e.status_code == 429:
+            retry_after = float((e.headers or {}).get("Retry-After", 1))
+        raise PhotoJobError(str(e.detail), e.status_code, retry_after)
+
+async def receive_photo(request: Request):
+    """接收multipart上传的图片并预处理，返回 (图片, 批阅类型, 配置, 预处理信息, sha256)"""
+    try:
+        upload = await receive_upload(request)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    
+    try:
+        correction_type = upload.fields.get('type', 'homework')
+        config = upload.json_field("config", {})
+        logger.info(f"📋 批阅类型: {correction_type}")
+        logger.info(f"⚙️ 配置参数: {config}")
+        logger.info(f"🖼️ 图片: {upload.filename} {upload.content_type} {upload.size} 字节 sha256={upload.sha256[:16]}")
         
-        system_prompt = f"""你是一个专业的{subject}老师，正在批改{grade}学生的作业。请仔细分析图片中的题目和学生答案，然后提供详细的批阅结果。
+        image, preprocess_info = await image_preprocessor.prepare_file(
+            upload.file, upload.size, upload.content_type
+        )
+        logger.info(f"🗜️ 图片预处理: {preprocess_info}")
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    finally:
+        upload.close()
+    
+    return image, correction_type, config, preprocess_info, upload.sha256
+
+async def correct_until_disconnect(request: Request, correction):
+    """客户端断开后取消批阅，不再占用视觉模型调用名额"""
+    try:
+        return await cancel_on_disconnect(request, correction)
+    except ClientDisconnected:
+        logger.info("🔌 客户端已断开，批阅已取消")
+        raise HTTPException(status_code=499, detail="客户端已断开")
+
+def build_correction_prompt(subject: str, grade: str, need_explanation: bool) -> str:
+    return f"""你是一个专业的{subject}老师，正在批改{grade}学生的作业。请仔细分析图片中的题目和学生答案，然后提供详细的批阅结果。
 
 请按照以下JSON格式返回结果：
 {{
@@ -191,123 +347,344 @@ async def photo_correction(request: PhotoCorrectionRequest):
 5. 给出学习建议
 """
 
-        # 构建API请求
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
+def build_answer_only_prompt(subject: str, grade: str, need_explanation: bool,
+                             corrections: List[Dict[str, Any]]) -> str:
+    """同一份练习卷已批阅过：题目与标准答案已知，只需识别并批改学生答案"""
+    reference = "\n".join(
+        f"{i}. 题目：{c.get('question', '')}  正确答案：{c.get('correct_answer', '')}"
+        for i, c in enumerate(corrections, 1)
+    )
+    return f"""你是一个专业的{subject}老师，正在批改{grade}学生的作业。这份练习卷的题目和正确答案已经识别如下：
+
+{reference}
+
+请只识别图片中学生对每道题填写的答案，并与正确答案比对。
+
+请按照以下JSON格式返回结果：
+{{
+    "same_worksheet": true/false,
+    "overall_summary": "对整体作业的评价和建议",
+    "answers": [
+        {{
+            "index": 1,
+            "student_answer": "学生的答案",
+            "is_correct": true/false,
+            "explanation": "答错时的{"详细解析" if need_explanation else "简要说明"}，答对时留空"
+        }}
+    ]
+}}
+
+要求：
+1. 如果图片中的题目与上面列出的题目不一致，same_worksheet 返回 false，answers 返回空列表
+2. answers 按题号顺序覆盖全部 {len(corrections)} 道题
+"""
+
+def parse_ai_json(content: str) -> Optional[Dict[str, Any]]:
+    text = content.strip()
+    if "```json" in text:
+        text = text.split("```json")[1].split("```")[0].strip()
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        return None
+    return data if isinstance(data, dict) else None
+
+async def call_vision_model(api_key: str, system_prompt: str, user_text: str, image: str,
+                            on_delta: Optional[Callable[[str], None]] = None) -> str:
+    """调用qwen-vl-max，返回模型输出的文本；提供 on_delta 时增量接收输出"""
+    
+    messages = [
+        {
+            "role": "system",
+            "content": system_prompt
+        },
+        {
+            "role": "user", 
+            "content": [
+                {
+                    "image": image
+                },
+                {
+                    "text": user_text
+                }
+            ]
         }
+    ]
+    
+    logger.info("📡 正在调用通义千问qwen-vl-max模型...")
+    logger.info(f"🎯 使用模型: qwen-vl-max")
+    logger.info(f"📝 提示词长度: {len(system_prompt)} 字符")
+    
+    result = await vision_client.call(messages, default_vision_config(api_key), on_delta=on_delta)
+    
+    if not result['success']:
+        logger.error(f"❌ AI API调用失败: {result['error']}")
+        if result.get('timeout'):
+            raise HTTPException(status_code=504, detail=result['error'])
+        if result.get('rate_limited') or result.get('status') == 429:
+            retry_after = result.get('retry_after') or 1
+            raise HTTPException(status_code=429, detail="AI服务繁忙，请稍后重试",
+                                headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+        raise HTTPException(status_code=500, detail=f"AI模型调用失败: {result['error']}")
+    
+    logger.info(f"✅ AI模型调用成功，耗时 {result['response_time']:.1f} 秒，用量: {result.get('usage')}")
+    logger.info(f"🤖 AI分析结果: {result['content']}")
+    return result['content']
+
+async def regrade_answers(api_key: str, image: str, subject: str, grade: str, need_explanation: bool,
+                          template: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """复用同一份练习卷已识别的题目，只批改学生答案；版面不一致时返回 None"""
+    
+    corrections = template.get("corrections") or []
+    if not corrections:
+        return None
+    
+    system_prompt = build_answer_only_prompt(subject, grade, need_explanation, corrections)
+    ai_content = await call_vision_model(
+        api_key, system_prompt, "请识别图片中学生的答案并批改。", image
+    )
+    data = parse_ai_json(ai_content)
+    answers = (data or {}).get("answers") or []
+    if not data or data.get("same_worksheet") is False or len(answers) != len(corrections):
+        logger.info("📄 与缓存的练习卷不一致，改为完整批阅")
+        return None
+    
+    merged = []
+    for correction, answer in zip(corrections, answers):
+        is_correct = bool(answer.get("is_correct"))
+        merged.append({
+            **correction,
+            "student_answer": answer.get("student_answer", ""),
+            "is_correct": is_correct,
+            "explanation": answer.get("explanation") or ("" if is_correct else correction.get("explanation", ""))
+        })
+    return {
+        **template,
+        "overall_summary": data.get("overall_summary") or template.get("overall_summary", ""),
+        "corrections": merged
+    }
+
+def unreadable_region(index: int, error: str) -> Dict[str, Any]:
+    """无法识别的区域在结果中占位，不影响其他区域的批阅结果"""
+    return {
+        "question": f"第{index}个区域未能识别",
+        "student_answer": "",
+        "correct_answer": "",
+        "is_correct": None,
+        "explanation": f"该区域图片未能识别，请重新拍摄这一部分（{error}）",
+        "knowledge_points": [],
+        "region": index,
+        "unreadable": True
+    }
+
+async def grade_regions(api_key: str, image: str, subject: str, grade: str, need_explanation: bool,
+                        on_correction: Optional[Callable[[Dict[str, Any]], None]] = None
+                        ) -> Optional[Dict[str, Any]]:
+    """按题目区域切分作业照片，并行批阅各区域后按顺序合并
+
+    整体耗时接近最慢的一个区域；某个区域无法识别时只影响该区域。
+    版面无法切分（不足两个区域）或各区域都没有批改出题目（切分不当）时返回 None，
+    由调用方整张批阅；此前不会输出任何逐题进度。
+    """
+    split = await split_question_regions(image)
+    if split is None:
+        return None
+    crops, boxes = split
+    logger.info(f"✂️ 版面分析切分出 {len(crops)} 个题目区域: {boxes}")
+    
+    system_prompt = build_correction_prompt(subject, grade, need_explanation)
+    semaphore = asyncio.Semaphore(PHOTO_CROP_CONCURRENCY)
+    
+    async def grade_region(index: int, crop: str) -> List[Dict[str, Any]]:
+        async with semaphore:
+            ai_content = await call_vision_model(
+                api_key, system_prompt,
+                f"图片是一份{subject}作业中的一部分（第{index}个区域），学生年级：{grade}。"
+                f"请批改其中的题目；如果没有题目，corrections 返回空列表。",
+                crop
+            )
+        data = parse_ai_json(ai_content)
+        if data is None:
+            raise ValueError("AI返回的不是标准JSON")
+        return [{**correction, "region": index} for correction in data.get("corrections") or []
+                if isinstance(correction, dict)]
+    
+    tasks = [asyncio.ensure_future(grade_region(i, crop)) for i, crop in enumerate(crops, 1)]
+    corrections, failed, errors = [], [], []
+    reported = emitted = 0
+    try:
+        pending = set(tasks)
+        while pending:
+            _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            # 按区域顺序输出：前面的区域都完成后才输出后面的区域
+            while reported < len(tasks) and tasks[reported].done():
+                index = reported + 1
+                error = tasks[reported].exception()
+                if error is None:
+                    region_corrections = tasks[reported].result()
+                else:
+                    message = error.detail if isinstance(error, HTTPException) else str(error)
+                    logger.warning(f"⚠️ 第{index}个区域批阅失败: {message}")
+                    failed.append(index)
+                    errors.append(error)
+                    region_corrections = [unreadable_region(index, message)]
+                corrections.extend(region_corrections)
+                reported += 1
+            # 出现第一道批改出的题目后才开始输出，避免改为整张批阅时已输出占位结果
+            if on_correction and any(not c.get("unreadable") for c in corrections):
+                for correction in corrections[emitted:]:
+                    on_correction(correction)
+                emitted = len(corrections)
+    finally:
+        for task in tasks:
+            task.cancel()
+    
+    graded = [c for c in corrections if not c.get("unreadable")]
+    if not graded:
+        if len(failed) == len(tasks) and all(isinstance(e, HTTPException) for e in errors):
+            # 全部区域调用失败通常是服务本身的问题（超时、限流），按整体失败处理
+            raise errors[0]
+        logger.info(f"📄 {len(crops)} 个区域均未批改出题目，改为整张批阅")
+        return None
+    
+    correct_count = sum(1 for c in graded if c.get("is_correct") is True)
+    summary = f"共批改{len(graded)}道题，答对{correct_count}道。"
+    if failed:
+        summary += f"有{len(failed)}个区域未能识别，请重新拍摄这些部分后补充批改。"
+    logger.info(f"✅ 分区域批阅完成: {len(crops)} 个区域，{len(graded)} 道题，失败区域 {failed}")
+    return {
+        "overall_summary": summary,
+        "corrections": corrections,
+        "regions": len(crops),
+        "failed_regions": failed
+    }
+
+def correction_reporter(on_correction: Callable[[Dict[str, Any]], None]) -> Callable[[str], None]:
+    """把视觉模型的增量输出解析为逐题批阅结果，每道题的对象闭合即回调"""
+    parser = IncrementalQuestionParser(array_key="corrections")
+    
+    def on_delta(text: str):
+        for correction in parser.feed(text):
+            on_correction(correction)
+    return on_delta
+
+async def correct_photo(image: str, correction_type: str, config: Dict[str, Any],
+                        preprocess_info: Dict[str, Any], sha256: Optional[str] = None,
+                        on_correction: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """批阅一张已预处理的图片
+
+    原图相同的照片直接返回缓存结果，解题照片感知哈希相近即可复用；
+    作业照片的手写答案可能不同，同一份练习卷只复用已识别的题目，重新批改学生答案。
+    多题作业照片按题目区域切分后并行批阅，版面无法切分时整张批阅。
+    提供 on_correction 时，批阅过程中每批改完一道题即回调（异步任务的逐题进度）。
+    """
+    
+    try:
+        api_key = get_api_key()
         
-        payload = {
-            "model": "qwen-vl-max",
-            "input": {
-                "messages": [
-                    {
-                        "role": "system",
-                        "content": system_prompt
-                    },
-                    {
-                        "role": "user", 
-                        "content": [
-                            {
-                                "image": request.image
-                            },
-                            {
-                                "text": f"请批改这份{subject}作业，学生年级：{grade}。请仔细分析图片中的题目和答案，给出准确的批阅结果。"
-                            }
-                        ]
-                    }
-                ]
-            },
-            "parameters": {
-                "result_format": "message"
+        # 构建AI提示词
+        subject = config.get('subject', '数学')
+        grade = config.get('grade', '小学')
+        need_explanation = config.get('needExplanation', True)
+        need_similar = config.get('needSimilarQuestions', False)
+        
+        namespace = cache_namespace(correction_type, config)
+        phash = preprocess_info.get("dhash")
+        cached = photo_result_cache.lookup(namespace, sha256, phash,
+                                           allow_near=correction_type != "homework")
+        if cached:
+            ai_result, distance = cached
+            logger.info(f"♻️ 命中批阅结果缓存，感知哈希距离: {distance}")
+            return {
+                "success": True,
+                "status": "completed",
+                "message": "AI拍照批阅完成 - 相同照片的已有结果",
+                "result": copy.deepcopy(ai_result),
+                "model_used": "qwen-vl-max",
+                "processing_time": "缓存命中",
+                "timestamp": datetime.now().isoformat(),
+                "api_call_success": True,
+                "cached": True,
+                "cache_distance": distance,
+                "image_preprocess": preprocess_info
             }
-        }
         
-        logger.info("📡 正在调用通义千问qwen-vl-max模型...")
-        logger.info(f"🎯 使用模型: qwen-vl-max")
-        logger.info(f"📝 提示词长度: {len(system_prompt)} 字符")
+        ai_result = None
+        regraded = False
+        cacheable = True
+        template = photo_result_cache.find_template(namespace, phash) if correction_type == "homework" else None
+        if template:
+            logger.info(f"📄 匹配到已批阅的练习卷，感知哈希距离: {template[1]}")
+            ai_result = await regrade_answers(api_key, image, subject, grade, need_explanation, template[0])
+            regraded = ai_result is not None
         
-        # 调用AI API
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            response = await client.post(
-                "https://dashscope.aliyuncs.com/api/v1/services/aigc/multimodal-generation/generation",
-                headers=headers,
-                json=payload
+        if ai_result is None and correction_type == "homework":
+            ai_result = await grade_regions(api_key, image, subject, grade, need_explanation, on_correction)
+            # 有区域未能识别的结果不缓存，重新拍摄后可完整批阅
+            cacheable = ai_result is None or not ai_result["failed_regions"]
+        
+        if ai_result is None:
+            system_prompt = build_correction_prompt(subject, grade, need_explanation)
+            ai_content = await call_vision_model(
+                api_key, system_prompt,
+                f"请批改这份{subject}作业，学生年级：{grade}。请仔细分析图片中的题目和答案，给出准确的批阅结果。",
+                image,
+                on_delta=correction_reporter(on_correction) if on_correction else None
             )
             
-            logger.info(f"📥 API响应状态码: {response.status_code}")
-            
-            if response.status_code == 200:
-                result = response.json()
-                logger.info("✅ AI模型调用成功")
-                logger.info(f"📊 API响应: {json.dumps(result, ensure_ascii=False, indent=2)}")
-                
-                # 解析AI响应
-                ai_content = result.get("output", {}).get("choices", [{}])[0].get("message", {}).get("content", "")
-                
-                if not ai_content:
-                    logger.error("❌ AI响应内容为空")
-                    raise HTTPException(status_code=500, detail="AI模型返回空响应")
-                
-                logger.info(f"🤖 AI分析结果: {ai_content}")
-                
-                # 尝试解析JSON响应
-                try:
-                    ai_result = json.loads(ai_content)
-                    logger.info("✅ 成功解析AI返回的JSON结果")
-                except json.JSONDecodeError as e:
-                    logger.warning(f"⚠️ AI返回的不是标准JSON，尝试文本解析: {e}")
-                    # 如果不是JSON，创建一个基本的结构
-                    ai_result = {
-                        "overall_summary": ai_content[:200] + "..." if len(ai_content) > 200 else ai_content,
-                        "corrections": [
-                            {
-                                "question": "AI识别的题目内容",
-                                "student_answer": "学生答案",
-                                "correct_answer": "正确答案", 
-                                "is_correct": True,
-                                "explanation": ai_content,
-                                "knowledge_points": [subject, "基础知识"]
-                            }
-                        ]
-                    }
-                
-                # 添加相似题目（如果需要）
-                if need_similar:
-                    ai_result["similarQuestions"] = [
-                        {
-                            "content": f"类似{subject}练习题1",
-                            "answer": "答案1"
-                        },
+            # 尝试解析JSON响应
+            ai_result = parse_ai_json(ai_content)
+            if ai_result is not None:
+                logger.info("✅ 成功解析AI返回的JSON结果")
+                photo_result_cache.put(namespace, sha256, phash, ai_result)
+            else:
+                logger.warning("⚠️ AI返回的不是标准JSON，尝试文本解析")
+                # 如果不是JSON，创建一个基本的结构
+                ai_result = {
+                    "overall_summary": ai_content[:200] + "..." if len(ai_content) > 200 else ai_content,
+                    "corrections": [
                         {
-                            "content": f"类似{subject}练习题2", 
-                            "answer": "答案2"
+                            "question": "AI识别的题目内容",
+                            "student_answer": "学生答案",
+                            "correct_answer": "正确答案", 
+                            "is_correct": True,
+                            "explanation": ai_content,
+                            "knowledge_points": [subject, "基础知识"]
                         }
                     ]
-                
-                final_result = {
-                    "success": True,
-                    "status": "completed",
-                    "message": "AI拍照批阅完成 - 真实模型分析",
-                    "result": ai_result,
-                    "model_used": "qwen-vl-max",
-                    "processing_time": "真实AI处理",
-                    "timestamp": datetime.now().isoformat(),
-                    "api_call_success": True
                 }
-                
-                logger.info("🎉 拍照批阅完成，返回真实AI结果")
-                return final_result
-                
-            else:
-                error_msg = f"AI API调用失败，状态码: {response.status_code}"
-                logger.error(f"❌ {error_msg}")
-                logger.error(f"❌ 错误响应: {response.text}")
-                
-                raise HTTPException(
-                    status_code=500, 
-                    detail=f"AI模型调用失败: {error_msg}"
-                )
+        elif cacheable:
+            photo_result_cache.put(namespace, sha256, phash, ai_result)
+        
+        ai_result = copy.deepcopy(ai_result)
+        # 添加相似题目（如果需要）
+        if need_similar:
+            ai_result["similarQuestions"] = [
+                {
+                    "content": f"类似{subject}练习题1",
+                    "answer": "答案1"
+                },
+                {
+                    "content": f"类似{subject}练习题2", 
+                    "answer": "答案2"
+                }
+            ]
+        
+        final_result = {
+            "success": True,
+            "status": "completed",
+            "message": "AI拍照批阅完成 - 真实模型分析",
+            "result": ai_result,
+            "model_used": "qwen-vl-max",
+            "processing_time": "真实AI处理",
+            "timestamp": datetime.now().isoformat(),
+            "api_call_success": True,
+            "regraded_from_template": regraded,
+            "image_preprocess": preprocess_info
+        }
+        
+        logger.info("🎉 拍照批阅完成，返回真实AI结果")
+        return final_result
                 
     except HTTPException:
         raise
@@ -333,6 +710,36 @@ async def root():
 async def health_check():
     return {"status": "healthy", "message": "真实AI服务运行正常"}
 
+@app.get("/api/ai/image-preprocess-stats")
+async def image_preprocess_stats():
+    """图片预处理统计（处理前后体积、耗时）"""
+    return image_preprocessor.get_stats()
+
+@app.get("/api/ai/photo-cache-stats")
+async def photo_cache_stats():
+    """批阅结果缓存统计（精确/近似命中、练习卷复用）"""
+    return photo_result_cache.get_stats()
+
+@app.get("/api/ai/vision-stats")
+async def vision_stats():
+    """视觉模型调用统计（耗时、超时、排队、取消）"""
+    return vision_client.get_stats()
+
+@app.get("/api/ai/photo-job-stats")
+async def photo_job_stats():
+    """异步批阅任务统计（各状态任务数、重试、恢复）"""
+    return await photo_job_manager.get_stats()
+
+@app.on_event("startup")
+async def startup_event():
+    await photo_job_manager.start(run_photo_job)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await photo_job_manager.shutdown()
+    image_preprocessor.shutdown()
+    await vision_client.close()
+
 # 基础认证接口（保持兼容性）
 @app.post("/auth/login")
 @app.post("/api/auth/login")
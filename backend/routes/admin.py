@@ -18,6 +18,21 @@ from ..database.models import User, AIModelConfig, Exercise, ErrorRecord
 from .auth import get_current_user
 from ..utils.security import encrypt_api_key, decrypt_api_key
 from ..services.ai_service import AIService
+from ..services.http_pool import http_pool
+from ..services.ai_cache import response_cache
+from ..services.single_flight import ai_call_flight
+from ..services.ai_call_logger import ai_call_log_writer
+from ..services.ai_router import ai_router
+from ..services.rate_limiter import rate_limiter
+from ..services.model_registry import model_registry
+from ..services.question_bank import question_bank
+from ..services.pregeneration import pregeneration_pool
+from ..services.local_generator import local_question_generator
+from ..services.variant_engine import variant_engine
+from ..services.ai_analytics import (
+    WINDOWS as ANALYTICS_WINDOWS, window_stats, total_aggregate, summarize,
+    local_period_start, rebuild_rollups
+)
 
 router = APIRouter(prefix="/admin", tags=["超级管理员"])
 
@@ -137,6 +152,7 @@ async def create_ai_model(
     db.add(new_model)
     db.commit()
     db.refresh(new_model)
+    model_registry.invalidate()
     
     return {
         "success": True,
@@ -169,6 +185,7 @@ async def update_ai_model(
     
     # 更新字段
     update_data = model_data.dict(exclude_unset=True)
+    old_endpoint = model.api_endpoint
     
     # 处理API密钥加密
     if "api_key" in update_data and update_data["api_key"]:
@@ -179,6 +196,9 @@ async def update_ai_model(
         setattr(model, field, value)
     
     db.commit()
+    model_registry.invalidate()
+    # 旧端点的连接池按旧配置创建，关闭后下次调用按新配置重建
+    await http_pool.close(old_endpoint)
     
     return {
         "success": True,
@@ -208,6 +228,7 @@ async def toggle_model_status(
         model.is_default = False
     
     db.commit()
+    model_registry.invalidate()
     
     return {
         "success": True,
@@ -244,6 +265,7 @@ async def set_default_model(
     # 设置当前模型为默认
     model.is_default = True
     db.commit()
+    model_registry.invalidate()
     
     return {
         "success": True,
@@ -324,8 +346,11 @@ async def delete_ai_model(
             detail="不能删除默认模型，请先设置其他模型为默认"
         )
     
+    api_endpoint = model.api_endpoint
     db.delete(model)
     db.commit()
+    model_registry.invalidate()
+    await http_pool.close(api_endpoint)
     
     return {
         "success": True,
@@ -334,42 +359,160 @@ async def delete_ai_model(
 
 @router.get("/ai-stats")
 async def get_ai_stats(
+    window: str = "24h",
     current_user: User = Depends(check_admin_permission),
     db: Session = Depends(get_db)
 ):
-    """获取AI使用统计"""
-    
-    # 计算今日统计
-    today = datetime.now().date()
-    daily_usage = db.query(func.sum(AIModelConfig.usage_count)).filter(
-        func.date(AIModelConfig.last_used) == today
-    ).scalar() or 0
+    """获取AI使用统计（基于调用日志汇总表）
+
+    window 可选 1h / 6h / 24h / 7d / 30d，返回该窗口内按模型、按功能的
+    p50/p95/p99 延迟、成功率和token用量。
+    """
     
-    # 计算本月统计
-    month_start = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    monthly_usage = db.query(func.sum(AIModelConfig.usage_count)).filter(
-        AIModelConfig.last_used >= month_start
-    ).scalar() or 0
+    if window not in ANALYTICS_WINDOWS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"不支持的统计窗口，可选: {', '.join(ANALYTICS_WINDOWS)}"
+        )
     
-    # 计算总使用次数
-    total_usage = db.query(func.sum(AIModelConfig.usage_count)).scalar() or 0
+    # 今日/本月按本地日期统计，使用小时粒度汇总
+    daily = summarize(total_aggregate(db, "hour", local_period_start("day")))
+    monthly = summarize(total_aggregate(db, "hour", local_period_start("month")))
+    total = total_aggregate(db, "day")
     
     # 活跃模型数量
     active_models = db.query(AIModelConfig).filter(AIModelConfig.is_active == True).count()
     
-    # 模拟成功率和响应时间（实际项目中应该从日志或监控系统获取）
-    success_rate = 95.5
-    avg_response_time = 1200
+    analytics = window_stats(db, window)
+    overall = analytics["overall"]
     
     return {
-        "daily": {"calls": daily_usage},
-        "monthly": {"calls": monthly_usage},
-        "total_usage": total_usage,
+        "daily": daily,
+        "monthly": monthly,
+        "total_usage": total["call_count"],
         "active_models": active_models,
-        "success_rate": success_rate,
-        "avg_response_time": avg_response_time
+        "success_rate": overall["success_rate"] if overall["calls"] else 0,
+        "avg_response_time": overall["avg_response_time"] if overall["calls"] else 0,
+        "analytics": analytics
+    }
+
+@router.post("/ai-stats/rebuild")
+async def rebuild_ai_stats(
+    days: Optional[int] = None,
+    current_user: User = Depends(check_admin_permission),
+    db: Session = Depends(get_db)
+):
+    """从调用日志重建统计汇总（days 为空时重建全部历史）"""
+    
+    since = datetime.utcnow() - timedelta(days=days) if days else None
+    processed = rebuild_rollups(db, since)
+    
+    return {
+        "message": "AI统计汇总已重建",
+        "processed_logs": processed
+    }
+
+@router.get("/ai-pool-stats")
+async def get_ai_pool_stats(
+    current_user: User = Depends(check_admin_permission)
+):
+    """获取上游AI接口连接池统计"""
+    
+    return http_pool.get_stats()
+
+@router.get("/ai-cache-stats")
+async def get_ai_cache_stats(
+    current_user: User = Depends(check_admin_permission)
+):
+    """获取AI响应缓存与请求合并统计"""
+    
+    return {
+        "cache": await response_cache.get_stats(),
+        "single_flight": ai_call_flight.get_stats()
     }
 
+@router.delete("/ai-cache")
+async def clear_ai_cache(
+    current_user: User = Depends(check_admin_permission)
+):
+    """清空AI响应缓存"""
+    
+    await response_cache.clear()
+    
+    return {
+        "success": True,
+        "message": "AI响应缓存已清空"
+    }
+
+@router.get("/ai-log-stats")
+async def get_ai_log_stats(
+    current_user: User = Depends(check_admin_permission)
+):
+    """获取AI调用日志写入队列统计"""
+    
+    return ai_call_log_writer.get_stats()
+
+@router.get("/ai-router-stats")
+async def get_ai_router_stats(
+    current_user: User = Depends(check_admin_permission)
+):
+    """获取AI模型路由统计（各模型健康度、熔断状态、切换与对冲次数）"""
+    
+    return ai_router.get_stats()
+
+@router.get("/ai-rate-limit-stats")
+async def get_ai_rate_limit_stats(
+    current_user: User = Depends(check_admin_permission)
+):
+    """获取各模型上游调用限流统计（排队深度、并发、令牌、被上游限流次数）"""
+    
+    return rate_limiter.get_stats()
+
+@router.get("/question-bank-stats")
+async def get_question_bank_stats(
+    current_user: User = Depends(check_admin_permission),
+    db: Session = Depends(get_db)
+):
+    """获取题库统计（收录题数、取题命中率）"""
+    
+    return question_bank.get_stats(db)
+
+@router.get("/pregeneration-stats")
+async def get_pregeneration_stats(
+    current_user: User = Depends(check_admin_permission),
+    db: Session = Depends(get_db)
+):
+    """获取题目预生成统计（热门组卷参数、待领取套数、空闲时段）"""
+    
+    return pregeneration_pool.get_stats(db)
+
+@router.get("/local-generator-stats")
+async def get_local_generator_stats(
+    current_user: User = Depends(check_admin_permission)
+):
+    """获取本地模板出题统计（本地生成的请求数与题数）"""
+    
+    return local_question_generator.get_stats()
+
+@router.get("/variant-stats")
+async def get_variant_stats(
+    current_user: User = Depends(check_admin_permission)
+):
+    """获取换数变式统计（可换数的源题比例、派生的变式数）"""
+    
+    return variant_engine.get_stats()
+
+@router.post("/pregeneration/run")
+async def run_pregeneration(
+    current_user: User = Depends(check_admin_permission),
+    db: Session = Depends(get_db)
+):
+    """立即执行一轮题目预生成（不判断是否处于空闲时段）"""
+    
+    pregeneration_pool.configure(db.get_bind())
+    generated = await pregeneration_pool.run_cycle(force=True)
+    return {"message": "预生成完成", "generated": generated}
+
 @router.get("/users")
 async def get_all_users(
     current_user: User = Depends(check_admin_permission),
@@ -1,14 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi.responses import FileResponse, StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from pydantic import BaseModel
 from database.database import get_db
-from database.models import User, AIModelConfig, Exercise, ErrorRecord
+from database.models import User, AIModelConfig, Exercise, ErrorRecord, PDFJob
 from routes.auth import get_current_user
 from services.ai_service import AIService
-from services.pdf_service import PDFService, PDFServiceManager
+from services.model_registry import model_registry
+from services.pdf_service import PDFServiceManager
+from services.stream_parser import IncrementalQuestionParser
+from services.question_utils import MAX_QUESTION_COUNT
+from services.pdf_jobs import pdf_job_manager, PDFJobQueueFull
+from services.pdf_artifacts import pdf_artifact_store
+from services.pdf_batch import (
+    MAX_BATCH_SIZE, MAX_MERGE_SIZE, render_batch, iter_zip_stream, get_or_merge
+)
 import json
+import math
 import os
 
 router = APIRouter(prefix="/ai", tags=["AI功能"])
@@ -20,6 +29,7 @@ class ExerciseGenerateRequest(BaseModel):
     question_type: str  # choice, fill, solve, mixed
     question_count: int
     difficulty_level: int = 1
+    grade: Optional[str] = None  # 年级，用于从题库匹配题目
 
 class AnswerAnalysisRequest(BaseModel):
     exercise_id: int
@@ -27,6 +37,16 @@ class AnswerAnalysisRequest(BaseModel):
 class ErrorAnalysisRequest(BaseModel):
     user_id: Optional[int] = None  # 如果不提供，使用当前用户
 
+class PDFBatchRequest(BaseModel):
+    exercise_ids: List[int]
+    include_answers: bool = False
+    output_format: str = "zip"  # zip 或 pdf（合并为单个文件，最多 MAX_MERGE_SIZE 份）
+
+class PDFJobRequest(BaseModel):
+    exercise_id: int
+    job_type: str = "exercise"  # exercise, answer, preview
+    include_answers: bool = False
+
 # 响应模型
 class ExerciseResponse(BaseModel):
     exercise_id: int
@@ -39,6 +59,67 @@ class AnalysisResponse(BaseModel):
     success: bool
     message: str
 
+def _parse_generated_questions(content: str, request: ExerciseGenerateRequest) -> List[dict]:
+    """解析AI返回的题目内容，非标准JSON时退化为单题"""
+    try:
+        questions_data = json.loads(content)
+        return questions_data.get('questions', [])
+    except json.JSONDecodeError:
+        # 如果AI返回的不是标准JSON，尝试简单解析
+        return [
+            {
+                "id": 1,
+                "type": request.question_type,
+                "content": content,
+                "knowledge_point": request.knowledge_points[0] if request.knowledge_points else request.subject,
+                "difficulty": request.difficulty_level
+            }
+        ]
+
+def _save_exercise(db: Session, user_id: int, request: ExerciseGenerateRequest,
+                   questions: List[dict]) -> Exercise:
+    """保存练习记录到数据库"""
+    exercise = Exercise(
+        user_id=user_id,
+        title=f"{request.subject}练习 - {len(questions)}题",
+        subject=request.subject,
+        question_type=request.question_type,
+        question_count=len(questions),
+        difficulty_level=request.difficulty_level,
+        generated_content={"questions": questions},
+        completion_status="pending"
+    )
+    
+    db.add(exercise)
+    db.commit()
+    db.refresh(exercise)
+    return exercise
+
+def _ai_failure(result: dict, message: str) -> HTTPException:
+    """AI调用失败时的HTTP异常：上游或本地限流返回429并带 Retry-After"""
+    detail = f"{message}: {result.get('error', '未知错误')}"
+    if result.get('retry_after') is not None:
+        return HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=detail,
+            headers={"Retry-After": str(max(1, math.ceil(result['retry_after'])))}
+        )
+    return HTTPException(
+        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        detail=detail
+    )
+
+def _check_question_count(request: ExerciseGenerateRequest):
+    if not 1 <= request.question_count <= MAX_QUESTION_COUNT:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"题目数量需在1到{MAX_QUESTION_COUNT}之间"
+        )
+
+def _sse_event(event: str, data: dict) -> str:
+    """格式化一条Server-Sent Events消息"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
 @router.post("/generate-exercise", response_model=ExerciseResponse)
 async def generate_exercise(
     request: ExerciseGenerateRequest,
@@ -47,6 +128,7 @@ async def generate_exercise(
 ):
     """生成练习题目"""
     
+    _check_question_count(request)
     try:
         async with AIService(db) as ai_service:
             # 调用AI生成题目
@@ -56,46 +138,18 @@ async def generate_exercise(
                 knowledge_points=request.knowledge_points,
                 question_type=request.question_type,
                 question_count=request.question_count,
-                difficulty_level=request.difficulty_level
+                difficulty_level=request.difficulty_level,
+                grade=request.grade
             )
             
             if not result['success']:
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail=f"题目生成失败: {result.get('error', '未知错误')}"
-                )
+                raise _ai_failure(result, "题目生成失败")
             
             # 解析AI返回的题目内容
-            try:
-                questions_data = json.loads(result['content'])
-                questions = questions_data.get('questions', [])
-            except json.JSONDecodeError:
-                # 如果AI返回的不是标准JSON，尝试简单解析
-                questions = [
-                    {
-                        "id": 1,
-                        "type": request.question_type,
-                        "content": result['content'],
-                        "knowledge_point": request.knowledge_points[0] if request.knowledge_points else request.subject,
-                        "difficulty": request.difficulty_level
-                    }
-                ]
+            questions = _parse_generated_questions(result['content'], request)
             
             # 保存练习记录到数据库
-            exercise = Exercise(
-                user_id=current_user.id,
-                title=f"{request.subject}练习 - {len(questions)}题",
-                subject=request.subject,
-                question_type=request.question_type,
-                question_count=len(questions),
-                difficulty_level=request.difficulty_level,
-                generated_content={"questions": questions},
-                completion_status="pending"
-            )
-            
-            db.add(exercise)
-            db.commit()
-            db.refresh(exercise)
+            exercise = _save_exercise(db, current_user.id, request, questions)
             
             return ExerciseResponse(
                 exercise_id=exercise.id,
@@ -104,12 +158,76 @@ async def generate_exercise(
                 message="题目生成成功"
             )
             
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"生成练习时发生错误: {str(e)}"
         )
 
+@router.post("/generate-exercise/stream")
+async def generate_exercise_stream(
+    request: ExerciseGenerateRequest,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """流式生成练习题目（Server-Sent Events）
+    
+    每解析出一道完整题目即推送 question 事件，全部生成后保存练习记录并推送
+    done 事件（包含 exercise_id）；失败时推送 error 事件。
+    """
+    
+    _check_question_count(request)
+    
+    ai_service = AIService(db)
+    
+    async def event_stream():
+        parser = IncrementalQuestionParser()
+        questions = []
+        content_parts = []
+        
+        try:
+            async for delta in ai_service.generate_exercise_questions_stream(
+                user_id=current_user.id,
+                subject=request.subject,
+                knowledge_points=request.knowledge_points,
+                question_type=request.question_type,
+                question_count=request.question_count,
+                difficulty_level=request.difficulty_level
+            ):
+                content_parts.append(delta)
+                for question in parser.feed(delta):
+                    question['id'] = len(questions) + 1
+                    questions.append(question)
+                    yield _sse_event("question", question)
+            
+            # 增量解析未得到题目时，按完整内容兜底解析
+            if not questions:
+                questions = _parse_generated_questions(''.join(content_parts), request)
+                for question in questions:
+                    yield _sse_event("question", question)
+            
+            exercise = _save_exercise(db, current_user.id, request, questions)
+            
+            yield _sse_event("done", {
+                "exercise_id": exercise.id,
+                "question_count": len(questions),
+                "message": "题目生成成功"
+            })
+            
+        except Exception as e:
+            yield _sse_event("error", {"message": f"题目生成失败: {str(e)}"})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
 @router.post("/generate-analysis", response_model=AnalysisResponse)
 async def generate_analysis(
     request: AnswerAnalysisRequest,
@@ -142,10 +260,7 @@ async def generate_analysis(
             )
             
             if not result['success']:
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail=f"解析生成失败: {result.get('error', '未知错误')}"
-                )
+                raise _ai_failure(result, "解析生成失败")
             
             # 解析AI返回的解析内容
             try:
@@ -175,12 +290,86 @@ async def generate_analysis(
                 message="解析生成成功"
             )
             
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"生成解析时发生错误: {str(e)}"
         )
 
+def _parse_byte_range(range_header: str, file_size: int) -> Optional[Tuple[int, int]]:
+    """解析单段 Range 请求头，返回闭区间 (start, end)；无法满足时返回 None"""
+    if not range_header.startswith("bytes="):
+        return None
+    first_range = range_header[6:].split(",")[0].strip()
+    start_text, _, end_text = first_range.partition("-")
+    try:
+        if start_text:
+            start = int(start_text)
+            end = int(end_text) if end_text else file_size - 1
+        else:
+            # 后缀形式 bytes=-N 表示最后N个字节
+            start = max(file_size - int(end_text), 0)
+            end = file_size - 1
+    except ValueError:
+        return None
+    end = min(end, file_size - 1)
+    if start > end:
+        return None
+    return start, end
+
+def _iter_file_range(path: str, start: int, end: int, chunk_size: int = 64 * 1024):
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+def _pdf_file_response(http_request: Request, path: str, filename: Optional[str] = None):
+    """返回PDF文件，支持 ETag/If-None-Match 协商缓存与 Range 分段下载"""
+    etag = f'"{pdf_artifact_store.digest_from_path(path)}"'
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, max-age=3600"
+    }
+    
+    if_none_match = http_request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or
+                          etag in [tag.strip() for tag in if_none_match.split(",")]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    range_header = http_request.headers.get("range")
+    if range_header:
+        file_size = os.path.getsize(path)
+        byte_range = _parse_byte_range(range_header, file_size)
+        if byte_range is None:
+            return Response(
+                status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                headers={"Content-Range": f"bytes */{file_size}"}
+            )
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{file_size}"
+        headers["Content-Length"] = str(end - start + 1)
+        return StreamingResponse(
+            _iter_file_range(path, start, end),
+            status_code=status.HTTP_206_PARTIAL_CONTENT,
+            media_type='application/pdf',
+            headers=headers
+        )
+    
+    return FileResponse(
+        path=path,
+        filename=filename,
+        media_type='application/pdf',
+        headers=headers
+    )
+
 @router.post("/generate-pdf/{exercise_id}")
 async def generate_exercise_pdf(
     exercise_id: int,
@@ -188,7 +377,7 @@ async def generate_exercise_pdf(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """生成练习题PDF"""
+    """生成练习题PDF（内容未变化时直接复用已渲染的文件）"""
     
     # 获取练习记录
     exercise = db.query(Exercise).filter(
@@ -204,21 +393,12 @@ async def generate_exercise_pdf(
     
     try:
         # 准备练习数据
-        exercise_data = {
-            "subject": exercise.subject,
-            "title": exercise.title,
-            "question_count": exercise.question_count,
-            "question_type": exercise.question_type,
-            "difficulty_level": exercise.difficulty_level,
-            "generated_content": exercise.generated_content
-        }
-        
-        # 生成PDF文件路径
-        pdf_path = PDFServiceManager.get_pdf_path(exercise_id, 'exercise')
+        exercise_data = PDFServiceManager.build_exercise_data(exercise)
         
-        # 生成PDF
-        pdf_service = PDFService()
-        pdf_service.generate_exercise_pdf(exercise_data, pdf_path, include_answers)
+        # 按内容哈希获取或渲染PDF
+        pdf_path, digest = await pdf_artifact_store.get_or_render(
+            'exercise', exercise_data, include_answers
+        )
         
         # 更新练习记录的PDF路径
         exercise.pdf_path = pdf_path
@@ -228,6 +408,7 @@ async def generate_exercise_pdf(
             "success": True,
             "message": "PDF生成成功",
             "pdf_path": pdf_path,
+            "etag": digest,
             "download_url": f"/api/ai/download-pdf/{exercise_id}"
         }
         
@@ -243,7 +424,7 @@ async def generate_answer_pdf(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """生成答案解析PDF"""
+    """生成答案解析PDF（内容未变化时直接复用已渲染的文件）"""
     
     # 获取练习记录
     exercise = db.query(Exercise).filter(
@@ -265,25 +446,20 @@ async def generate_answer_pdf(
     
     try:
         # 准备数据
-        exercise_data = {
-            "subject": exercise.subject,
-            "title": exercise.title,
-            "generated_content": exercise.generated_content
-        }
+        exercise_data = PDFServiceManager.build_exercise_data(exercise)
         
         analysis_data = exercise.answer_content
         
-        # 生成PDF文件路径
-        pdf_path = PDFServiceManager.get_pdf_path(exercise_id, 'answer')
-        
-        # 生成PDF
-        pdf_service = PDFService()
-        pdf_service.generate_answer_pdf(exercise_data, analysis_data, pdf_path)
+        # 按内容哈希获取或渲染PDF
+        pdf_path, digest = await pdf_artifact_store.get_or_render(
+            'answer', exercise_data, analysis_data=analysis_data
+        )
         
         return {
             "success": True,
             "message": "答案解析PDF生成成功",
             "pdf_path": pdf_path,
+            "etag": digest,
             "download_url": f"/api/ai/download-answer-pdf/{exercise_id}"
         }
         
@@ -296,6 +472,7 @@ async def generate_answer_pdf(
 @router.get("/download-pdf/{exercise_id}")
 async def download_exercise_pdf(
     exercise_id: int,
+    http_request: Request,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -320,19 +497,51 @@ async def download_exercise_pdf(
         )
     
     filename = f"{exercise.subject}练习_{exercise_id}.pdf"
-    return FileResponse(
-        path=exercise.pdf_path,
-        filename=filename,
-        media_type='application/pdf'
-    )
+    return _pdf_file_response(http_request, exercise.pdf_path, filename)
+
+@router.get("/download-answer-pdf/{exercise_id}")
+async def download_answer_pdf(
+    exercise_id: int,
+    http_request: Request,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """下载答案解析PDF"""
+    
+    exercise = db.query(Exercise).filter(
+        Exercise.id == exercise_id,
+        Exercise.user_id == current_user.id
+    ).first()
+    
+    if not exercise or not exercise.answer_content:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="答案解析PDF不存在"
+        )
+    
+    try:
+        pdf_path, _ = await pdf_artifact_store.get_or_render(
+            'answer',
+            PDFServiceManager.build_exercise_data(exercise),
+            analysis_data=exercise.answer_content
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"答案解析PDF生成失败: {str(e)}"
+        )
+    
+    filename = f"{exercise.subject}答案解析_{exercise_id}.pdf"
+    return _pdf_file_response(http_request, pdf_path, filename)
 
 @router.get("/preview-pdf/{exercise_id}")
 async def preview_exercise_pdf(
     exercise_id: int,
+    http_request: Request,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """预览练习题PDF"""
+    """预览练习题PDF（命中已渲染产物时直接发送文件）"""
     
     # 获取练习记录
     exercise = db.query(Exercise).filter(
@@ -346,36 +555,207 @@ async def preview_exercise_pdf(
             detail="练习记录不存在"
         )
     
-    # 如果没有PDF，先生成一个
+    try:
+        exercise_data = PDFServiceManager.build_exercise_data(exercise)
+        pdf_path, _ = await pdf_artifact_store.get_or_render('preview', exercise_data, False)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"PDF预览生成失败: {str(e)}"
+        )
+    
     if not exercise.pdf_path or not os.path.exists(exercise.pdf_path):
-        try:
-            exercise_data = {
-                "subject": exercise.subject,
-                "title": exercise.title,
-                "question_count": exercise.question_count,
-                "question_type": exercise.question_type,
-                "difficulty_level": exercise.difficulty_level,
-                "generated_content": exercise.generated_content
-            }
-            
-            pdf_path = PDFServiceManager.get_pdf_path(exercise_id, 'preview')
-            pdf_service = PDFService()
-            pdf_service.generate_exercise_pdf(exercise_data, pdf_path, False)
-            
-            exercise.pdf_path = pdf_path
-            db.commit()
-            
-        except Exception as e:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"PDF预览生成失败: {str(e)}"
-            )
+        exercise.pdf_path = pdf_path
+        db.commit()
     
-    return FileResponse(
-        path=exercise.pdf_path,
-        media_type='application/pdf'
+    return _pdf_file_response(http_request, pdf_path)
+
+@router.post("/pdf-batch")
+async def export_pdf_batch(
+    request: PDFBatchRequest,
+    http_request: Request,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """批量导出练习PDF：并行渲染后打包为ZIP流或合并为单个PDF"""
+    
+    exercise_ids = list(dict.fromkeys(request.exercise_ids))
+    if not exercise_ids:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="请选择要导出的练习"
+        )
+    
+    if len(exercise_ids) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"单次最多导出{MAX_BATCH_SIZE}份练习"
+        )
+    
+    if request.output_format not in ('zip', 'pdf'):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="不支持的导出格式"
+        )
+    
+    if request.output_format == 'pdf' and len(exercise_ids) > MAX_MERGE_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"合并为单个PDF最多{MAX_MERGE_SIZE}份练习，更多练习请导出为ZIP"
+        )
+    
+    # 与单份导出一致，只能导出自己的练习
+    exercises = {
+        exercise.id: exercise
+        for exercise in db.query(Exercise).filter(
+            Exercise.id.in_(exercise_ids),
+            Exercise.user_id == current_user.id
+        ).all()
+    }
+    
+    missing = [exercise_id for exercise_id in exercise_ids if exercise_id not in exercises]
+    if missing:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"练习记录不存在: {missing}"
+        )
+    
+    ordered = [exercises[exercise_id] for exercise_id in exercise_ids]
+    
+    try:
+        rendered = await render_batch(
+            [PDFServiceManager.build_exercise_data(exercise) for exercise in ordered],
+            request.include_answers
+        )
+        
+        if request.output_format == 'pdf':
+            merged_path = await get_or_merge(rendered)
+            return _pdf_file_response(http_request, merged_path, f"练习合集_{len(ordered)}份.pdf")
+        
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"批量PDF导出失败: {str(e)}"
+        )
+    
+    entries = [
+        (f"{index:03d}_{exercise.subject}练习_{exercise.id}.pdf", path)
+        for index, (exercise, (path, _)) in enumerate(zip(ordered, rendered), 1)
+    ]
+    
+    return StreamingResponse(
+        iter_zip_stream(entries),
+        media_type="application/zip",
+        headers={"Content-Disposition": f"attachment; filename=exercises_{len(ordered)}.zip"}
     )
 
+@router.post("/pdf-jobs")
+async def create_pdf_job(
+    request: PDFJobRequest,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """提交PDF后台渲染任务"""
+    
+    if request.job_type not in ('exercise', 'answer', 'preview'):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="不支持的PDF类型"
+        )
+    
+    exercise = db.query(Exercise).filter(
+        Exercise.id == request.exercise_id,
+        Exercise.user_id == current_user.id
+    ).first()
+    
+    if not exercise:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="练习记录不存在"
+        )
+    
+    if request.job_type == 'answer' and not exercise.answer_content:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="请先生成答案解析"
+        )
+    
+    try:
+        job = pdf_job_manager.enqueue(
+            db, current_user.id, exercise, request.job_type, request.include_answers
+        )
+    except PDFJobQueueFull:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="PDF渲染任务繁忙，请稍后重试",
+            headers={"Retry-After": "10"}
+        )
+    
+    return {
+        "success": True,
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"/api/ai/pdf-jobs/{job.id}"
+    }
+
+@router.get("/pdf-jobs/{job_id}")
+async def get_pdf_job(
+    job_id: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """查询PDF渲染任务状态"""
+    
+    job = db.query(PDFJob).filter(
+        PDFJob.id == job_id,
+        PDFJob.user_id == current_user.id
+    ).first()
+    
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="PDF任务不存在"
+        )
+    
+    return {
+        "job_id": job.id,
+        "exercise_id": job.exercise_id,
+        "job_type": job.job_type,
+        "status": job.status,
+        "error": job.error_message,
+        "created_at": job.created_at,
+        "finished_at": job.finished_at,
+        "download_url": f"/api/ai/pdf-jobs/{job.id}/download" if job.status == "done" else None
+    }
+
+@router.get("/pdf-jobs/{job_id}/download")
+async def download_pdf_job(
+    job_id: str,
+    http_request: Request,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """下载已完成的PDF渲染结果"""
+    
+    job = db.query(PDFJob).filter(
+        PDFJob.id == job_id,
+        PDFJob.user_id == current_user.id
+    ).first()
+    
+    if not job or job.status != "done":
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="PDF文件尚未生成"
+        )
+    
+    if not job.file_path or not os.path.exists(job.file_path):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="PDF文件已被删除"
+        )
+    
+    return _pdf_file_response(http_request, job.file_path, f"{job.job_type}_{job.exercise_id}.pdf")
+
 @router.get("/models")
 async def get_ai_models(
     current_user: User = Depends(get_current_user),
@@ -383,7 +763,7 @@ async def get_ai_models(
 ):
     """获取可用的AI模型列表"""
     
-    models = db.query(AIModelConfig).filter(AIModelConfig.is_active == True).all()
+    models = model_registry.get_active(db)
     
     return {
         "models": [
@@ -0,0 +1,315 @@
+import bisect
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, List, Optional, Iterable, Tuple
+from sqlalchemy.orm import Session
+from database.models import AICallLog, AICallRollup
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 延迟直方图区间上界（秒），最后一个区间为 >120 秒
+LATENCY_BUCKETS = [0.1, 0.25, 0.5, 0.75, 1, 1.5, 2, 3, 4, 5, 7.5, 10, 15, 20, 30, 45, 60, 90, 120]
+
+# 汇总粒度及各自保留时长（None 表示永久保留）
+GRANULARITIES = {
+    "minute": timedelta(minutes=1),
+    "hour": timedelta(hours=1),
+    "day": timedelta(days=1),
+}
+RETENTION = {
+    "minute": timedelta(days=2),
+    "hour": timedelta(days=90),
+    "day": None,
+}
+
+# 可选统计窗口 -> (时间跨度, 使用的汇总粒度)
+WINDOWS = {
+    "1h": (timedelta(hours=1), "minute"),
+    "6h": (timedelta(hours=6), "minute"),
+    "24h": (timedelta(hours=24), "hour"),
+    "7d": (timedelta(days=7), "hour"),
+    "30d": (timedelta(days=30), "day"),
+}
+
+_COUNTERS = ("call_count", "success_count", "prompt_tokens", "completion_tokens", "total_tokens")
+
+
+def utc_naive(ts: Optional[datetime] = None) -> datetime:
+    """统一为不带时区的UTC时间（汇总表按UTC分桶）"""
+    if ts is None:
+        return datetime.utcnow()
+    if ts.tzinfo is not None:
+        return ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+def floor_time(ts: datetime, granularity: str) -> datetime:
+    if granularity == "minute":
+        return ts.replace(second=0, microsecond=0)
+    if granularity == "hour":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def latency_bucket(seconds: float) -> int:
+    return bisect.bisect_left(LATENCY_BUCKETS, seconds)
+
+
+def _empty_aggregate() -> Dict[str, Any]:
+    return {
+        "call_count": 0,
+        "success_count": 0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "total_tokens": 0,
+        "total_response_time": 0.0,
+        "latency_histogram": [0] * (len(LATENCY_BUCKETS) + 1)
+    }
+
+
+def _merge(target: Dict[str, Any], source: Dict[str, Any]):
+    for field in _COUNTERS:
+        target[field] += source.get(field) or 0
+    target["total_response_time"] += source.get("total_response_time") or 0.0
+    histogram = source.get("latency_histogram") or []
+    for i, count in enumerate(histogram[:len(target["latency_histogram"])]):
+        target["latency_histogram"][i] += count
+
+
+def aggregate_records(records: Iterable[Dict[str, Any]]) -> Dict[Tuple[str, datetime, str, str], Dict[str, Any]]:
+    """把一批调用日志聚合到 (粒度, 时间桶, 模型, 功能) 键上"""
+    aggregates = {}
+    for record in records:
+        ts = utc_naive(record.get("created_at"))
+        response_time = record.get("response_time") or 0.0
+        for granularity in GRANULARITIES:
+            key = (granularity, floor_time(ts, granularity),
+                   record["model_name"], record["function_type"])
+            agg = aggregates.get(key)
+            if agg is None:
+                agg = aggregates[key] = _empty_aggregate()
+            agg["call_count"] += 1
+            agg["success_count"] += 1 if record.get("success", True) else 0
+            agg["prompt_tokens"] += record.get("prompt_tokens") or 0
+            agg["completion_tokens"] += record.get("completion_tokens") or 0
+            agg["total_tokens"] += record.get("total_tokens") or 0
+            agg["total_response_time"] += response_time
+            agg["latency_histogram"][latency_bucket(response_time)] += 1
+    return aggregates
+
+
+def apply_rollups(db: Session, records: List[Dict[str, Any]]):
+    """将一批日志累加到汇总表（由调用方提交事务）"""
+    aggregates = aggregate_records(records)
+    if not aggregates:
+        return
+
+    # 每种粒度一次查询取出已有的汇总行
+    existing = {}
+    for granularity in GRANULARITIES:
+        starts = {key[1] for key in aggregates if key[0] == granularity}
+        rows = db.query(AICallRollup).filter(
+            AICallRollup.granularity == granularity,
+            AICallRollup.bucket_start.in_(starts)
+        ).all()
+        for row in rows:
+            existing[(row.granularity, row.bucket_start, row.model_name, row.function_type)] = row
+
+    for key, agg in aggregates.items():
+        row = existing.get(key)
+        if row is None:
+            granularity, bucket_start, model_name, function_type = key
+            db.add(AICallRollup(
+                granularity=granularity,
+                bucket_start=bucket_start,
+                model_name=model_name,
+                function_type=function_type,
+                **agg
+            ))
+            continue
+
+        merged = _row_aggregate(row)
+        _merge(merged, agg)
+        for field, value in merged.items():
+            # JSON列需要整体重新赋值才会被标记为已修改
+            setattr(row, field, value)
+
+
+def prune_rollups(db: Session, now: Optional[datetime] = None) -> int:
+    """删除超过保留时长的细粒度汇总（由调用方提交事务）"""
+    now = utc_naive(now)
+    removed = 0
+    for granularity, retention in RETENTION.items():
+        if retention is None:
+            continue
+        removed += db.query(AICallRollup).filter(
+            AICallRollup.granularity == granularity,
+            AICallRollup.bucket_start < now - retention
+        ).delete(synchronize_session=False)
+    return removed
+
+
+def rebuild_rollups(db: Session, since: Optional[datetime] = None, chunk_size: int = 1000) -> int:
+    """从 ai_call_logs 重建汇总（用于补齐启用汇总前的历史日志）
+
+    重建期间新写入的日志会同时进入汇总，建议在低峰期执行。
+    """
+    query = db.query(AICallRollup)
+    log_query = db.query(AICallLog).order_by(AICallLog.id)
+    if since is not None:
+        since = floor_time(utc_naive(since), "day")
+        query = query.filter(AICallRollup.bucket_start >= since)
+        log_query = log_query.filter(AICallLog.created_at >= since)
+    query.delete(synchronize_session=False)
+
+    processed = 0
+    batch = []
+    for log in log_query.yield_per(chunk_size):
+        batch.append({
+            "model_name": log.model_name,
+            "function_type": log.function_type,
+            "prompt_tokens": log.prompt_tokens,
+            "completion_tokens": log.completion_tokens,
+            "total_tokens": log.total_tokens,
+            "response_time": log.response_time,
+            "success": log.success,
+            "created_at": log.created_at
+        })
+        if len(batch) >= chunk_size:
+            apply_rollups(db, batch)
+            processed += len(batch)
+            batch = []
+    if batch:
+        apply_rollups(db, batch)
+        processed += len(batch)
+
+    db.commit()
+    return processed
+
+
+def _row_aggregate(row: AICallRollup) -> Dict[str, Any]:
+    agg = _empty_aggregate()
+    _merge(agg, {
+        "call_count": row.call_count,
+        "success_count": row.success_count,
+        "prompt_tokens": row.prompt_tokens,
+        "completion_tokens": row.completion_tokens,
+        "total_tokens": row.total_tokens,
+        "total_response_time": row.total_response_time,
+        "latency_histogram": row.latency_histogram
+    })
+    return agg
+
+
+def histogram_percentile(histogram: List[int], q: float) -> Optional[float]:
+    """根据延迟直方图估算分位数（秒），区间内按线性插值"""
+    total = sum(histogram)
+    if total == 0:
+        return None
+
+    target = q * total
+    cumulative = 0
+    for i, count in enumerate(histogram):
+        if count and cumulative + count >= target:
+            if i >= len(LATENCY_BUCKETS):
+                return float(LATENCY_BUCKETS[-1])
+            lower = LATENCY_BUCKETS[i - 1] if i > 0 else 0.0
+            upper = LATENCY_BUCKETS[i]
+            return lower + (upper - lower) * (target - cumulative) / count
+        cumulative += count
+    return float(LATENCY_BUCKETS[-1])
+
+
+def summarize(agg: Dict[str, Any]) -> Dict[str, Any]:
+    """把聚合值转换为展示用指标（延迟单位毫秒，成功率为百分比）"""
+    calls = agg["call_count"]
+
+    def ms(value):
+        return round(value * 1000) if value is not None else None
+
+    histogram = agg["latency_histogram"]
+    return {
+        "calls": calls,
+        "successes": agg["success_count"],
+        "success_rate": round(agg["success_count"] / calls * 100, 2) if calls else None,
+        "avg_response_time": ms(agg["total_response_time"] / calls) if calls else None,
+        "p50_ms": ms(histogram_percentile(histogram, 0.50)),
+        "p95_ms": ms(histogram_percentile(histogram, 0.95)),
+        "p99_ms": ms(histogram_percentile(histogram, 0.99)),
+        "prompt_tokens": agg["prompt_tokens"],
+        "completion_tokens": agg["completion_tokens"],
+        "total_tokens": agg["total_tokens"]
+    }
+
+
+def _load(db: Session, granularity: str, since: Optional[datetime] = None) -> List[AICallRollup]:
+    query = db.query(AICallRollup).filter(AICallRollup.granularity == granularity)
+    if since is not None:
+        query = query.filter(AICallRollup.bucket_start >= since)
+    return query.all()
+
+
+def total_aggregate(db: Session, granularity: str, since: Optional[datetime] = None) -> Dict[str, Any]:
+    agg = _empty_aggregate()
+    for row in _load(db, granularity, since):
+        _merge(agg, _row_aggregate(row))
+    return agg
+
+
+def window_stats(db: Session, window: str = "24h", now: Optional[datetime] = None) -> Dict[str, Any]:
+    """按窗口统计：整体、按模型、按功能、按模型+功能，以及按模型的时间序列"""
+    if window not in WINDOWS:
+        raise ValueError(f"不支持的统计窗口: {window}")
+
+    span, granularity = WINDOWS[window]
+    now = utc_naive(now)
+    since = floor_time(now - span, granularity)
+    rows = _load(db, granularity, since)
+
+    overall = _empty_aggregate()
+    by_model, by_function, by_pair, timeline = {}, {}, {}, {}
+    for row in rows:
+        agg = _row_aggregate(row)
+        _merge(overall, agg)
+        for groups, key in (
+            (by_model, row.model_name),
+            (by_function, row.function_type),
+            (by_pair, (row.model_name, row.function_type)),
+            (timeline, (row.model_name, row.bucket_start)),
+        ):
+            if key not in groups:
+                groups[key] = _empty_aggregate()
+            _merge(groups[key], agg)
+
+    series = {}
+    for (model_name, bucket_start), agg in sorted(timeline.items(), key=lambda item: item[0][1]):
+        point = summarize(agg)
+        series.setdefault(model_name, []).append({
+            "bucket_start": bucket_start.isoformat(),
+            "calls": point["calls"],
+            "success_rate": point["success_rate"],
+            "p95_ms": point["p95_ms"]
+        })
+
+    return {
+        "window": window,
+        "granularity": granularity,
+        "since": since.isoformat(),
+        "overall": summarize(overall),
+        "by_model": {name: summarize(agg) for name, agg in by_model.items()},
+        "by_function": {name: summarize(agg) for name, agg in by_function.items()},
+        "by_model_function": [
+            {"model_name": model_name, "function_type": function_type, **summarize(agg)}
+            for (model_name, function_type), agg in sorted(by_pair.items())
+        ],
+        "timeline": series
+    }
+
+
+def local_period_start(period: str, now: Optional[datetime] = None) -> datetime:
+    """本地时间的今日/本月起点，转换为UTC（配合小时粒度汇总按本地日期统计）"""
+    local_now = (now or datetime.now()).astimezone()
+    start = local_now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if period == "month":
+        start = start.replace(day=1)
+    return utc_naive(start)
@@ -0,0 +1,209 @@
+import os
+import json
+import time
+import random
+import sqlite3
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Any
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CachePolicy:
+    """单个功能的缓存策略"""
+    ttl: int = 3600           # 缓存有效期（秒）
+    variety: float = 0.0      # 命中时仍重新生成的概率，用于补充新的题目变体
+    max_variants: int = 1     # 每个键最多保留的不同结果数
+
+
+# 按 function_type 选择性开启缓存，未列出的功能不走缓存
+DEFAULT_CACHE_POLICIES = {
+    "generate_exercise": CachePolicy(ttl=6 * 3600, variety=0.2, max_variants=5),
+    "generate_analysis": CachePolicy(ttl=24 * 3600, variety=0.0, max_variants=1)
+}
+
+
+def make_request_key(model_config, messages: List[Dict], **overrides) -> str:
+    """根据消息内容与模型参数计算规范化哈希键"""
+    normalized_messages = [
+        {
+            "role": message.get("role"),
+            "content": "\n".join(
+                line.strip() for line in str(message.get("content", "")).strip().splitlines()
+            )
+        }
+        for message in messages
+    ]
+    material = {
+        "model": model_config.model_name,
+        "endpoint": model_config.api_endpoint,
+        "max_tokens": model_config.max_tokens,
+        "temperature": float(model_config.temperature or 0),
+        "params": model_config.model_params or {},
+        "messages": normalized_messages,
+        **overrides
+    }
+    raw = json.dumps(material, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class MemoryLRUCache:
+    """进程内LRU缓存"""
+
+    blocking = False
+
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[List[Dict]]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: List[Dict], ttl: int):
+        with self._lock:
+            self._data[key] = (time.time() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def size(self) -> int:
+        return len(self._data)
+
+
+class SQLiteCache:
+    """基于SQLite文件的持久化缓存，多进程部署时可共享"""
+
+    blocking = True
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS ai_response_cache ("
+            "cache_key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_ai_response_cache_expires ON ai_response_cache (expires_at)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[List[Dict]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM ai_response_cache WHERE cache_key = ?", (key,)
+            ).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return json.loads(row[0])
+
+    def set(self, key: str, value: List[Dict], ttl: int):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO ai_response_cache (cache_key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), time.time() + ttl)
+            )
+            self._conn.execute("DELETE FROM ai_response_cache WHERE expires_at < ?", (time.time(),))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM ai_response_cache")
+            self._conn.commit()
+
+    def size(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM ai_response_cache").fetchone()[0]
+
+
+class AIResponseCache:
+    """AI调用结果缓存，按功能策略决定是否缓存及变体数量"""
+
+    def __init__(self, backend, policies: Optional[Dict[str, CachePolicy]] = None):
+        self.backend = backend
+        self.policies = dict(DEFAULT_CACHE_POLICIES if policies is None else policies)
+        self.stats = {"hits": 0, "misses": 0, "variety_bypass": 0, "stores": 0}
+
+    def policy_for(self, function_type: str) -> Optional[CachePolicy]:
+        return self.policies.get(function_type)
+
+    async def _run(self, func, *args):
+        if self.backend.blocking:
+            return await asyncio.to_thread(func, *args)
+        return func(*args)
+
+    async def get(self, key: str, policy: CachePolicy) -> Optional[Dict[str, Any]]:
+        """命中时随机返回一个已缓存的变体；按 variety 概率放行以生成新变体"""
+        variants = await self._run(self.backend.get, key)
+        if not variants:
+            self.stats["misses"] += 1
+            return None
+        if policy.variety > 0 and random.random() < policy.variety:
+            self.stats["variety_bypass"] += 1
+            return None
+        self.stats["hits"] += 1
+        return random.choice(variants)
+
+    async def put(self, key: str, result: Dict[str, Any], policy: CachePolicy):
+        entry = {"content": result.get("content"), "usage": result.get("usage", {})}
+        variants = await self._run(self.backend.get, key) or []
+        if entry not in variants:
+            variants.append(entry)
+        variants = variants[-policy.max_variants:]
+        await self._run(self.backend.set, key, variants, policy.ttl)
+        self.stats["stores"] += 1
+
+    async def clear(self):
+        await self._run(self.backend.clear)
+
+    async def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["misses"] + self.stats["variety_bypass"]
+        return {
+            **self.stats,
+            "hit_rate": round(self.stats["hits"] / lookups * 100, 1) if lookups else 0,
+            "backend": type(self.backend).__name__,
+            "entries": await self._run(self.backend.size),
+            "functions": {name: vars(policy) for name, policy in self.policies.items()}
+        }
+
+
+def create_response_cache() -> AIResponseCache:
+    """根据环境变量创建缓存实例"""
+    backend_name = os.getenv("AI_CACHE_BACKEND", "memory")
+    if backend_name == "sqlite":
+        backend = SQLiteCache(os.getenv("AI_CACHE_PATH", "ai_response_cache.db"))
+    else:
+        backend = MemoryLRUCache(int(os.getenv("AI_CACHE_MAX_ENTRIES", "1000")))
+
+    policies = None
+    enabled_functions = os.getenv("AI_CACHE_FUNCTIONS")
+    if enabled_functions is not None:
+        names = [name.strip() for name in enabled_functions.split(",") if name.strip()]
+        policies = {name: DEFAULT_CACHE_POLICIES.get(name, CachePolicy()) for name in names}
+
+    logger.info(f"AI响应缓存后端: {type(backend).__name__}")
+    return AIResponseCache(backend, policies)
+
+
+# 进程级共享实例
+response_cache = create_response_cache()
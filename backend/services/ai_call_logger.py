@@ -0,0 +1,162 @@
+import os
+import time
+import asyncio
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+from database.models import AICallLog
+from services.ai_analytics import apply_rollups, prune_rollups
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 批量写入参数
+LOG_BATCH_SIZE = int(os.getenv("AI_LOG_BATCH_SIZE", "200"))
+LOG_FLUSH_INTERVAL = float(os.getenv("AI_LOG_FLUSH_INTERVAL", "1.0"))
+LOG_MAX_BACKLOG = int(os.getenv("AI_LOG_MAX_BACKLOG", "10000"))
+
+# 清理过期汇总数据的最小间隔（秒）
+ROLLUP_PRUNE_INTERVAL = 3600
+
+# 后台写入任务的停止信号
+_STOP = object()
+
+
+class AICallLogWriter:
+    """AI调用日志异步批量写入器
+
+    请求路径只把日志放入进程内队列，后台任务按条数或时间阈值批量插入，
+    数据库写入在线程中执行，不占用事件循环。同一事务内增量更新
+    分钟/小时/天汇总表，统计接口不再扫描日志表。
+    """
+
+    def __init__(self, batch_size: int = LOG_BATCH_SIZE, flush_interval: float = LOG_FLUSH_INTERVAL,
+                 max_backlog: int = LOG_MAX_BACKLOG):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_backlog = max_backlog
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._session_factory = None
+        self._last_prune = 0.0
+        self.stats = {
+            "enqueued": 0,
+            "written": 0,
+            "dropped": 0,
+            "flushes": 0,
+            "failed_flushes": 0,
+            "last_flush_at": None
+        }
+
+    def configure(self, bind):
+        """绑定数据库引擎（首次记录日志时由请求会话提供）"""
+        if self._session_factory is None:
+            self._session_factory = sessionmaker(autocommit=False, autoflush=False, bind=bind)
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            if self._queue is None:
+                self._queue = asyncio.Queue(maxsize=self.max_backlog)
+            self._task = asyncio.create_task(self._run())
+
+    def enqueue(self, record: Dict[str, Any]):
+        """放入一条日志记录，不等待写入"""
+        self._ensure_started()
+        record.setdefault("created_at", datetime.utcnow())
+        try:
+            self._queue.put_nowait(record)
+            self.stats["enqueued"] += 1
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+            logger.warning("AI调用日志队列已满，丢弃一条记录")
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            stopping = False
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+            if stopping:
+                return
+
+    async def _flush(self, batch: List[Dict[str, Any]]):
+        try:
+            await asyncio.to_thread(self._write, batch)
+            self.stats["written"] += len(batch)
+            self.stats["flushes"] += 1
+            self.stats["last_flush_at"] = datetime.utcnow().isoformat()
+        except Exception as e:
+            self.stats["failed_flushes"] += 1
+            logger.error(f"AI调用日志批量写入失败({len(batch)}条): {e}")
+
+    def _write(self, batch: List[Dict[str, Any]]):
+        db = self._session_factory()
+        try:
+            try:
+                self._write_batch(db, batch)
+            except IntegrityError:
+                # 其他工作进程刚创建了同一时间桶的汇总行，重试一次即可累加到该行
+                db.rollback()
+                self._write_batch(db, batch)
+
+            if time.time() - self._last_prune >= ROLLUP_PRUNE_INTERVAL:
+                self._last_prune = time.time()
+                prune_rollups(db)
+                db.commit()
+        finally:
+            db.close()
+
+    @staticmethod
+    def _write_batch(db, batch: List[Dict[str, Any]]):
+        db.bulk_insert_mappings(AICallLog, batch)
+        apply_rollups(db, batch)
+        db.commit()
+
+    async def drain(self):
+        """写完队列中积压的日志后停止后台任务（应用关闭时调用）"""
+        if self._task is not None and not self._task.done():
+            await self._queue.put(_STOP)
+            await self._task
+        self._task = None
+
+        if self._queue is None or self._session_factory is None:
+            return
+
+        # 停止信号之后才入队的记录
+        pending = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not _STOP:
+                pending.append(item)
+        for start in range(0, len(pending), self.batch_size):
+            await self._flush(pending[start:start + self.batch_size])
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "backlog": self._queue.qsize() if self._queue else 0,
+            "max_backlog": self.max_backlog,
+            "batch_size": self.batch_size,
+            "flush_interval": self.flush_interval
+        }
+
+
+# 进程级共享实例
+ai_call_log_writer = AICallLogWriter()
@@ -0,0 +1,315 @@
+import time
+import asyncio
+import aiohttp
+from collections import deque
+from typing import Dict, Any, List, Optional, Callable, Awaitable, Tuple
+from services.http_pool import HTTPClientPool
+from services.rate_limiter import RateLimitExceeded
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 路由默认参数，可通过 AIModelConfig.model_params["routing"] 按模型覆盖
+DEFAULT_ROUTING_OPTIONS = {
+    "timeout": 60,                # 单次非流式调用总超时（秒），长输出生成较慢；可按模型调低
+    "stream_idle_timeout": 30,    # 流式调用两段数据之间的最长等待（秒）
+    "failover": True,             # 失败后是否切换到下一个可用模型
+    "failure_threshold": 5,       # 连续失败多少次打开熔断
+    "error_rate_threshold": 0.5,  # 错误率EWMA超过该值且样本足够时打开熔断
+    "min_samples": 10,            # 按错误率熔断所需的最少调用次数
+    "open_seconds": 30,           # 熔断打开后多久允许一次探测调用
+    "hedge": False,               # 是否对慢请求发起对冲调用
+    "hedge_delay": 3.0,           # 延迟样本不足时的对冲等待（秒）
+    "hedge_min_delay": 0.5,
+    "hedge_max_delay": 10.0
+}
+
+# 延迟/错误率EWMA平滑系数
+EWMA_ALPHA = 0.2
+
+# 估算p95所需的最少成功样本数
+MIN_LATENCY_SAMPLES = 20
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+def routing_options(model_config) -> Dict[str, Any]:
+    """合并默认参数与模型配置中的路由参数"""
+    options = dict(DEFAULT_ROUTING_OPTIONS)
+    model_params = model_config.model_params or {}
+    options.update(model_params.get("routing") or {})
+    return options
+
+
+def client_timeout(model_config, stream: bool = False) -> aiohttp.ClientTimeout:
+    """单次上游调用的超时设置"""
+    options = routing_options(model_config)
+    connect_timeout = HTTPClientPool.pool_options(model_config)["connect_timeout"]
+    if stream:
+        return aiohttp.ClientTimeout(total=None, sock_connect=connect_timeout,
+                                     sock_read=options["stream_idle_timeout"])
+    return aiohttp.ClientTimeout(total=options["timeout"], sock_connect=connect_timeout)
+
+
+class ProviderHealth:
+    """单个模型提供方的健康状态与熔断器"""
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self.state = CLOSED
+        self.latency_ewma: Optional[float] = None
+        self.error_ewma = 0.0
+        self.samples = 0
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.latencies = deque(maxlen=200)
+        self.stats = {"calls": 0, "failures": 0, "opened": 0, "hedged": 0, "cancelled": 0}
+
+    def available(self, options: Dict[str, Any]) -> bool:
+        """是否可以向该提供方发起调用（不占用探测名额）"""
+        if self.state == OPEN and time.monotonic() - self.opened_at >= options["open_seconds"]:
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN:
+            return not self.probing
+        return self.state == CLOSED
+
+    def begin(self):
+        if self.state == HALF_OPEN:
+            self.probing = True
+
+    def record(self, success: bool, latency: Optional[float], options: Dict[str, Any]):
+        self.stats["calls"] += 1
+        self.samples += 1
+        self.error_ewma = EWMA_ALPHA * (0.0 if success else 1.0) + (1 - EWMA_ALPHA) * self.error_ewma
+
+        if success:
+            if latency is not None:
+                self.latencies.append(latency)
+                self.latency_ewma = latency if self.latency_ewma is None else \
+                    EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * self.latency_ewma
+            self.consecutive_failures = 0
+            if self.state != CLOSED:
+                logger.info(f"模型 {self.model_name} 探测成功，熔断关闭")
+            self.state = CLOSED
+            self.probing = False
+            return
+
+        self.stats["failures"] += 1
+        self.consecutive_failures += 1
+        tripped = (
+            self.state == HALF_OPEN
+            or self.consecutive_failures >= options["failure_threshold"]
+            or (self.samples >= options["min_samples"]
+                and self.error_ewma >= options["error_rate_threshold"])
+        )
+        self.probing = False
+        if tripped and self.state != OPEN:
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+            self.stats["opened"] += 1
+            logger.warning(f"模型 {self.model_name} 连续失败 {self.consecutive_failures} 次，熔断打开")
+        elif tripped:
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        """调用被取消（对冲落败）或本地限流时释放探测名额，不计入健康统计"""
+        self.probing = False
+
+    def p95(self) -> Optional[float]:
+        if len(self.latencies) < MIN_LATENCY_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def score(self) -> float:
+        """排序用得分，越小越优先"""
+        latency = self.latency_ewma if self.latency_ewma is not None else 0.0
+        return latency * (1 + 4 * self.error_ewma)
+
+    def get_stats(self) -> Dict[str, Any]:
+        p95 = self.p95()
+        return {
+            **self.stats,
+            "state": self.state,
+            "latency_ewma_ms": round(self.latency_ewma * 1000) if self.latency_ewma is not None else None,
+            "p95_ms": round(p95 * 1000) if p95 is not None else None,
+            "error_rate": round(self.error_ewma * 100, 1),
+            "consecutive_failures": self.consecutive_failures
+        }
+
+
+class ModelRouter:
+    """多模型路由：按健康度排序、熔断、失败切换与对冲请求"""
+
+    def __init__(self):
+        self._health: Dict[str, ProviderHealth] = {}
+        self.stats = {"routed": 0, "failovers": 0, "hedges": 0, "hedge_wins": 0, "rejected": 0}
+
+    def health_for(self, model_name: str) -> ProviderHealth:
+        health = self._health.get(model_name)
+        if health is None:
+            health = self._health[model_name] = ProviderHealth(model_name)
+        return health
+
+    def candidates(self, primary, active_models: List[Any]) -> List[Any]:
+        """首选模型在前，其余可用模型按健康得分排序；熔断中的模型被跳过"""
+        options = routing_options(primary)
+        ordered = [primary]
+        if options["failover"]:
+            others = [m for m in active_models if m.model_name != primary.model_name]
+            others.sort(key=lambda m: self.health_for(m.model_name).score())
+            ordered.extend(others)
+        return [m for m in ordered if self.health_for(m.model_name).available(routing_options(m))]
+
+    def hedge_delay(self, model_config) -> float:
+        """对冲等待时间：取该模型近期p95延迟，样本不足时使用配置值"""
+        options = routing_options(model_config)
+        p95 = self.health_for(model_config.model_name).p95()
+        delay = options["hedge_delay"] if p95 is None else p95
+        return min(max(delay, options["hedge_min_delay"]), options["hedge_max_delay"])
+
+    async def _attempt(self, model_config, attempt: Callable[[Any], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        health = self.health_for(model_config.model_name)
+        options = routing_options(model_config)
+        health.begin()
+        start = time.monotonic()
+        try:
+            result = await attempt(model_config)
+        except asyncio.CancelledError:
+            health.release()
+            health.stats["cancelled"] += 1
+            raise
+        except Exception as e:
+            result = {'success': False, 'error': f"API调用异常: {e}"}
+        if result.get('rate_limited'):
+            # 本地限流排队失败不代表提供方故障，不计入健康统计
+            health.release()
+        else:
+            health.record(bool(result.get('success')), time.monotonic() - start, options)
+        result.setdefault('model_name', model_config.model_name)
+        return result
+
+    async def _hedged(self, primary, backup, attempt) -> Tuple[Dict[str, Any], bool]:
+        """先调用首选模型，超过对冲等待仍未返回时并发调用备选模型，先成功者胜出
+
+        返回 (结果, 是否已调用备选模型)。
+        """
+        first = asyncio.ensure_future(self._attempt(primary, attempt))
+        tasks = {first}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay(primary))
+            if done:
+                return first.result(), False
+
+            self.stats["hedges"] += 1
+            self.health_for(primary.model_name).stats["hedged"] += 1
+            second = asyncio.ensure_future(self._attempt(backup, attempt))
+            tasks.add(second)
+
+            pending = set(tasks)
+            result = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    result = task.result()
+                    if result.get('success'):
+                        if task is second:
+                            self.stats["hedge_wins"] += 1
+                        return result, True
+            return result, True
+        finally:
+            # 取消落败或仍在进行的调用
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def call(self, primary, active_models: List[Any],
+                   attempt: Callable[[Any], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """按路由顺序调用，返回首个成功结果或汇总的失败信息"""
+        self.stats["routed"] += 1
+        candidates = self.candidates(primary, active_models)
+        if not candidates:
+            self.stats["rejected"] += 1
+            return {
+                'success': False,
+                'error': '所有AI模型暂时不可用，请稍后重试'
+            }
+
+        errors = []
+        index = 0
+        while index < len(candidates):
+            model_config = candidates[index]
+            backup = candidates[index + 1] if index + 1 < len(candidates) else None
+            if backup is not None and routing_options(model_config)["hedge"]:
+                result, used_backup = await self._hedged(model_config, backup, attempt)
+                index += 2 if used_backup else 1
+            else:
+                result = await self._attempt(model_config, attempt)
+                index += 1
+
+            if result.get('success'):
+                return result
+
+            errors.append(f"{result.get('model_name')}: {result.get('error')}")
+            if index < len(candidates):
+                self.stats["failovers"] += 1
+                logger.warning(f"模型 {result.get('model_name')} 调用失败，切换到下一个模型")
+
+        return {
+            **result,
+            'error': result.get('error') if len(errors) == 1 else '所有AI模型调用失败',
+            'details': result.get('details') if len(errors) == 1 else errors
+        }
+
+    async def stream(self, primary, active_models: List[Any],
+                     open_stream: Callable[[Any], Any]):
+        """流式调用：在产出第一段内容之前失败可切换模型，之后的失败直接抛出"""
+        self.stats["routed"] += 1
+        candidates = self.candidates(primary, active_models)
+        if not candidates:
+            self.stats["rejected"] += 1
+            raise RuntimeError('所有AI模型暂时不可用，请稍后重试')
+
+        last_error = None
+        for index, model_config in enumerate(candidates):
+            health = self.health_for(model_config.model_name)
+            options = routing_options(model_config)
+            health.begin()
+            started = False
+            try:
+                async for delta in open_stream(model_config):
+                    if not started:
+                        started = True
+                        # 首段内容到达即视为调用成功；流式耗时不计入对冲延迟样本
+                        health.record(True, None, options)
+                    yield delta
+                if not started:
+                    health.record(True, None, options)
+                return
+            except asyncio.CancelledError:
+                if not started:
+                    health.release()
+                raise
+            except Exception as e:
+                if started:
+                    raise
+                if isinstance(e, RateLimitExceeded):
+                    health.release()
+                else:
+                    health.record(False, None, options)
+                last_error = e
+                if index + 1 < len(candidates):
+                    self.stats["failovers"] += 1
+                    logger.warning(f"模型 {model_config.model_name} 流式调用失败，切换到下一个模型")
+        raise last_error
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "providers": {name: health.get_stats() for name, health in self._health.items()}
+        }
+
+
+# 进程级共享实例
+ai_router = ModelRouter()
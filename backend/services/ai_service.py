@@ -2,9 +2,26 @@ import json
 import time
 import asyncio
 import aiohttp
-from typing import Dict, List, Optional, Any
+from dataclasses import replace
+from typing import Dict, List, Optional, Any, AsyncIterator, Callable
 from sqlalchemy.orm import Session
-from database.models import AIModelConfig, AICallLog, User
+from database.models import AIModelConfig, User
+from utils.security import encrypt_api_key
+from services.http_pool import http_pool
+from services.ai_cache import response_cache, make_request_key
+from services.single_flight import ai_call_flight
+from services.ai_call_logger import ai_call_log_writer
+from services.ai_router import ai_router, client_timeout
+from services.rate_limiter import rate_limiter, RateLimitExceeded, priority_for, parse_retry_after, tenant_key
+from services.model_registry import model_registry, ModelSnapshot
+from services.question_utils import (
+    plan_exercise_chunks, estimate_max_tokens, parse_questions, merge_question_sets,
+    FANOUT_MAX_CHUNKS
+)
+from services.question_bank import question_bank, student_history, QUESTION_BANK_ENABLED
+from services.pregeneration import pregeneration_pool
+from services.local_generator import local_question_generator
+from services.variant_engine import variant_engine
 import logging
 
 # 加载环境变量
@@ -16,45 +33,57 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+# model_params 中仅供服务端使用、不透传给上游API的配置项
+RUNTIME_PARAM_KEYS = ("pool", "routing", "rate_limit")
+
 class AIService:
     """AI服务类，支持多种AI模型"""
     
     def __init__(self, db: Session):
         self.db = db
-        self.session = None
+        self._tenants: Dict[Optional[int], str] = {}
     
     async def __aenter__(self):
-        """异步上下文管理器入口"""
-        self.session = aiohttp.ClientSession()
+        """异步上下文管理器入口（HTTP连接由进程级连接池提供）"""
         return self
     
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        """异步上下文管理器出口"""
-        if self.session:
-            await self.session.close()
+        """异步上下文管理器出口（共享连接池随应用关闭，此处不释放）"""
+        pass
+    
+    @staticmethod
+    def _request_params(model_config: ModelSnapshot) -> Dict[str, Any]:
+        """透传给上游API的模型参数（剔除服务端运行配置）"""
+        model_params = model_config.model_params or {}
+        return {k: v for k, v in model_params.items() if k not in RUNTIME_PARAM_KEYS}
     
-    def get_default_model(self) -> Optional[AIModelConfig]:
-        """获取默认AI模型配置"""
-        return self.db.query(AIModelConfig).filter(
-            AIModelConfig.is_default == True,
-            AIModelConfig.is_active == True
-        ).first()
+    def tenant_for(self, user_id: Optional[int]) -> str:
+        """限流公平队列中的租户：按用户所属机构，未设置时按用户"""
+        if user_id not in self._tenants:
+            school = self.db.query(User.school).filter(User.id == user_id).scalar() if user_id else None
+            self._tenants[user_id] = tenant_key(user_id, school)
+        return self._tenants[user_id]
     
-    def get_model_by_name(self, model_name: str) -> Optional[AIModelConfig]:
-        """根据名称获取AI模型配置"""
-        return self.db.query(AIModelConfig).filter(
-            AIModelConfig.model_name == model_name,
-            AIModelConfig.is_active == True
-        ).first()
+    def get_default_model(self) -> Optional[ModelSnapshot]:
+        """获取默认AI模型配置（来自进程内注册表）"""
+        return model_registry.get_default(self.db)
     
-    async def call_tongyi_api(self, model_config: AIModelConfig, messages: List[Dict], 
+    def get_model_by_name(self, model_name: str) -> Optional[ModelSnapshot]:
+        """根据名称获取AI模型配置（来自进程内注册表）"""
+        return model_registry.get_by_name(self.db, model_name)
+    
+    def get_active_models(self) -> List[ModelSnapshot]:
+        """获取全部启用的AI模型配置（用于失败切换）"""
+        return model_registry.get_active(self.db)
+    
+    async def call_tongyi_api(self, model_config: ModelSnapshot, messages: List[Dict], 
                              function_type: str, user_id: int) -> Dict[str, Any]:
         """调用通义千问API"""
         start_time = time.time()
         
         try:
-            # 解密API密钥
-            api_key = decrypt_api_key(model_config.api_key)
+            # 注册表中的密钥已解密
+            api_key = model_config.api_key
             
             headers = {
                 'Authorization': f'Bearer {api_key}',
@@ -69,15 +98,16 @@ class AIService:
                 "parameters": {
                     "max_tokens": model_config.max_tokens,
                     "temperature": model_config.temperature,
-                    **model_config.model_params if model_config.model_params else {}
+                    **self._request_params(model_config)
                 }
             }
             
-            async with self.session.post(
+            session = await http_pool.get_session(model_config)
+            async with session.post(
                 model_config.api_endpoint,
                 headers=headers,
                 json=payload,
-                timeout=aiohttp.ClientTimeout(total=60)
+                timeout=client_timeout(model_config)
             ) as response:
                 response_time = time.time() - start_time
                 
@@ -116,7 +146,9 @@ class AIService:
                     return {
                         'success': False,
                         'error': f"API调用失败: HTTP {response.status}",
-                        'details': error_text
+                        'details': error_text,
+                        'status': response.status,
+                        'retry_after': parse_retry_after(response.headers.get('Retry-After'))
                     }
                     
         except Exception as e:
@@ -138,14 +170,14 @@ class AIService:
                 'error': f"API调用异常: {error_msg}"
             }
     
-    async def call_deepseek_api(self, model_config: AIModelConfig, messages: List[Dict], 
+    async def call_deepseek_api(self, model_config: ModelSnapshot, messages: List[Dict], 
                                function_type: str, user_id: int) -> Dict[str, Any]:
         """调用DeepSeek API"""
         start_time = time.time()
         
         try:
-            # 解密API密钥
-            api_key = decrypt_api_key(model_config.api_key)
+            # 注册表中的密钥已解密
+            api_key = model_config.api_key
             
             headers = {
                 'Authorization': f'Bearer {api_key}',
@@ -157,14 +189,15 @@ class AIService:
                 "messages": messages,
                 "max_tokens": model_config.max_tokens,
                 "temperature": model_config.temperature,
-                **model_config.model_params if model_config.model_params else {}
+                **self._request_params(model_config)
             }
             
-            async with self.session.post(
+            session = await http_pool.get_session(model_config)
+            async with session.post(
                 model_config.api_endpoint,
                 headers=headers,
                 json=payload,
-                timeout=aiohttp.ClientTimeout(total=60)
+                timeout=client_timeout(model_config)
             ) as response:
                 response_time = time.time() - start_time
                 
@@ -203,7 +236,9 @@ class AIService:
                     return {
                         'success': False,
                         'error': f"API调用失败: HTTP {response.status}",
-                        'details': error_text
+                        'details': error_text,
+                        'status': response.status,
+                        'retry_after': parse_retry_after(response.headers.get('Retry-After'))
                     }
                     
         except Exception as e:
@@ -226,8 +261,16 @@ class AIService:
             }
     
     async def call_ai_model(self, messages: List[Dict], function_type: str, 
-                           user_id: int, model_name: Optional[str] = None) -> Dict[str, Any]:
-        """统一的AI模型调用接口"""
+                           user_id: int, model_name: Optional[str] = None,
+                           use_cache: bool = True, priority: Optional[int] = None,
+                           max_tokens: Optional[int] = None,
+                           validate: Optional[Callable[[str], Any]] = None) -> Dict[str, Any]:
+        """统一的AI模型调用接口
+
+        priority 为空时按功能类型确定（学生交互请求优先于报告等后台任务）；
+        max_tokens 用于按本次请求的输出规模覆盖模型配置；
+        validate 校验返回内容，未通过校验的结果不写入缓存（如无法解析的题目JSON）。
+        """
         
         # 获取模型配置
         if model_name:
@@ -241,28 +284,287 @@ class AIService:
                 'error': '未找到可用的AI模型配置'
             }
         
-        # 根据模型类型调用相应的API
+        if max_tokens:
+            model_config = replace(model_config, max_tokens=max_tokens)
+        
+        request_key = make_request_key(model_config, messages)
+        
+        # 按功能策略查询响应缓存
+        cache_policy = response_cache.policy_for(function_type) if use_cache else None
+        if cache_policy:
+            cached = await response_cache.get(request_key, cache_policy)
+            if cached:
+                return {
+                    'success': True,
+                    'content': cached['content'],
+                    'usage': cached.get('usage', {}),
+                    'response_time': 0,
+                    'cached': True
+                }
+        
+        async def attempt(candidate: ModelSnapshot) -> Dict[str, Any]:
+            if max_tokens:
+                candidate = replace(candidate, max_tokens=max_tokens)
+            return await self._dispatch_model_call(candidate, messages, function_type, user_id, priority)
+        
+        async def invoke():
+            # 首选模型失败或熔断时切换到其他启用的模型
+            result = await ai_router.call(model_config, self.get_active_models(), attempt)
+            if cache_policy and result.get('success') and (
+                validate is None or validate(result.get('content') or '')
+            ):
+                await response_cache.put(request_key, result, cache_policy)
+            return result
+        
+        # 相同提示词的并发请求合并为一次上游调用
+        result = await ai_call_flight.do(f"{function_type}:{request_key}", invoke)
+        return dict(result)
+    
+    async def _dispatch_model_call(self, model_config: ModelSnapshot, messages: List[Dict],
+                                   function_type: str, user_id: int,
+                                   priority: Optional[int] = None) -> Dict[str, Any]:
+        """根据模型类型调用相应的API（经过该模型的限流队列）"""
         if model_config.model_name == 'tongyi':
-            return await self.call_tongyi_api(model_config, messages, function_type, user_id)
+            call_api = self.call_tongyi_api
         elif model_config.model_name == 'deepseek':
-            return await self.call_deepseek_api(model_config, messages, function_type, user_id)
+            call_api = self.call_deepseek_api
         else:
             return {
                 'success': False,
                 'error': f'不支持的模型类型: {model_config.model_name}'
             }
+        
+        if priority is None:
+            priority = priority_for(function_type)
+        try:
+            async with rate_limiter.slot(model_config, priority, self.tenant_for(user_id)):
+                result = await call_api(model_config, messages, function_type, user_id)
+        except RateLimitExceeded as e:
+            return {
+                'success': False,
+                'error': str(e),
+                'retry_after': e.retry_after,
+                'rate_limited': True
+            }
+        
+        if result.get('status') == 429:
+            rate_limiter.throttle(model_config, result.get('retry_after'))
+        return result
     
-    async def generate_exercise_questions(self, user_id: int, subject: str, 
-                                        knowledge_points: List[str], question_type: str, 
-                                        question_count: int, difficulty_level: int = 1) -> Dict[str, Any]:
-        """生成练习题目"""
+    async def stream_ai_model(self, messages: List[Dict], function_type: str,
+                              user_id: int, model_name: Optional[str] = None,
+                              priority: Optional[int] = None,
+                              validate: Optional[Callable[[str], Any]] = None) -> AsyncIterator[str]:
+        """流式调用AI模型，逐段产出生成的文本；validate 含义同 call_ai_model"""
+        
+        if model_name:
+            model_config = self.get_model_by_name(model_name)
+        else:
+            model_config = self.get_default_model()
+        
+        if not model_config:
+            raise ValueError('未找到可用的AI模型配置')
+        
+        # 缓存命中时一次性返回完整内容
+        request_key = make_request_key(model_config, messages)
+        cache_policy = response_cache.policy_for(function_type)
+        if cache_policy:
+            cached = await response_cache.get(request_key, cache_policy)
+            if cached:
+                yield cached['content']
+                return
+        
+        if priority is None:
+            priority = priority_for(function_type)
+        tenant = self.tenant_for(user_id)
+        
+        async def open_stream(candidate: ModelSnapshot) -> AsyncIterator[str]:
+            if candidate.model_name == 'tongyi':
+                stream = self._stream_tongyi_api(candidate, messages, function_type, user_id)
+            elif candidate.model_name == 'deepseek':
+                stream = self._stream_deepseek_api(candidate, messages, function_type, user_id)
+            else:
+                raise ValueError(f'不支持的模型类型: {candidate.model_name}')
+            
+            # 整个流式响应期间占用一个上游调用名额
+            async with rate_limiter.slot(candidate, priority, tenant):
+                async for delta in stream:
+                    yield delta
+        
+        chunks = []
+        async for delta in ai_router.stream(model_config, self.get_active_models(), open_stream):
+            chunks.append(delta)
+            yield delta
+        
+        content = ''.join(chunks)
+        if cache_policy and (validate is None or validate(content)):
+            await response_cache.put(request_key, {'content': content}, cache_policy)
+    
+    async def _stream_tongyi_api(self, model_config: ModelSnapshot, messages: List[Dict],
+                                 function_type: str, user_id: int) -> AsyncIterator[str]:
+        """以SSE增量输出方式调用通义千问API"""
+        start_time = time.time()
+        usage = {}
+        
+        try:
+            headers = {
+                'Authorization': f'Bearer {model_config.api_key}',
+                'Content-Type': 'application/json',
+                'Accept': 'text/event-stream',
+                'X-DashScope-SSE': 'enable'
+            }
+            
+            payload = {
+                "model": "qwen-turbo",
+                "input": {
+                    "messages": messages
+                },
+                "parameters": {
+                    "max_tokens": model_config.max_tokens,
+                    "temperature": model_config.temperature,
+                    **self._request_params(model_config),
+                    "incremental_output": True
+                }
+            }
+            
+            session = await http_pool.get_session(model_config)
+            async with session.post(
+                model_config.api_endpoint,
+                headers=headers,
+                json=payload,
+                timeout=client_timeout(model_config, stream=True)
+            ) as response:
+                if response.status != 200:
+                    error_text = await response.text()
+                    if response.status == 429:
+                        rate_limiter.throttle(
+                            model_config, parse_retry_after(response.headers.get('Retry-After'))
+                        )
+                    raise RuntimeError(f"HTTP {response.status}: {error_text}")
+                
+                async for data in self._iter_sse_data(response):
+                    event = json.loads(data)
+                    usage = event.get('usage') or usage
+                    output = event.get('output', {})
+                    text = output.get('text')
+                    if text is None and output.get('choices'):
+                        text = output['choices'][0].get('message', {}).get('content')
+                    if text:
+                        yield text
+        
+        except Exception as e:
+            await self._log_api_call(
+                user_id=user_id,
+                model_name=model_config.model_name,
+                function_type=function_type,
+                response_time=time.time() - start_time,
+                success=False,
+                error_message=str(e)
+            )
+            logger.error(f"通义千问流式API调用异常: {e}")
+            raise
+        
+        await self._log_api_call(
+            user_id=user_id,
+            model_name=model_config.model_name,
+            function_type=function_type,
+            prompt_tokens=usage.get('input_tokens', 0),
+            completion_tokens=usage.get('output_tokens', 0),
+            total_tokens=usage.get('total_tokens', 0),
+            response_time=time.time() - start_time,
+            success=True
+        )
+    
+    async def _stream_deepseek_api(self, model_config: ModelSnapshot, messages: List[Dict],
+                                   function_type: str, user_id: int) -> AsyncIterator[str]:
+        """以SSE流式方式调用DeepSeek API"""
+        start_time = time.time()
+        usage = {}
+        
+        try:
+            headers = {
+                'Authorization': f'Bearer {model_config.api_key}',
+                'Content-Type': 'application/json',
+                'Accept': 'text/event-stream'
+            }
+            
+            payload = {
+                "model": "deepseek-chat",
+                "messages": messages,
+                "max_tokens": model_config.max_tokens,
+                "temperature": model_config.temperature,
+                **self._request_params(model_config),
+                "stream": True,
+                "stream_options": {"include_usage": True}
+            }
+            
+            session = await http_pool.get_session(model_config)
+            async with session.post(
+                model_config.api_endpoint,
+                headers=headers,
+                json=payload,
+                timeout=client_timeout(model_config, stream=True)
+            ) as response:
+                if response.status != 200:
+                    error_text = await response.text()
+                    if response.status == 429:
+                        rate_limiter.throttle(
+                            model_config, parse_retry_after(response.headers.get('Retry-After'))
+                        )
+                    raise RuntimeError(f"HTTP {response.status}: {error_text}")
+                
+                async for data in self._iter_sse_data(response):
+                    event = json.loads(data)
+                    usage = event.get('usage') or usage
+                    choices = event.get('choices') or [{}]
+                    text = choices[0].get('delta', {}).get('content')
+                    if text:
+                        yield text
+        
+        except Exception as e:
+            await self._log_api_call(
+                user_id=user_id,
+                model_name=model_config.model_name,
+                function_type=function_type,
+                response_time=time.time() - start_time,
+                success=False,
+                error_message=str(e)
+            )
+            logger.error(f"DeepSeek流式API调用异常: {e}")
+            raise
+        
+        await self._log_api_call(
+            user_id=user_id,
+            model_name=model_config.model_name,
+            function_type=function_type,
+            prompt_tokens=usage.get('prompt_tokens', 0),
+            completion_tokens=usage.get('completion_tokens', 0),
+            total_tokens=usage.get('total_tokens', 0),
+            response_time=time.time() - start_time,
+            success=True
+        )
+    
+    @staticmethod
+    async def _iter_sse_data(response: aiohttp.ClientResponse) -> AsyncIterator[str]:
+        """逐条读取SSE响应中的data字段"""
+        async for raw_line in response.content:
+            line = raw_line.decode('utf-8').strip()
+            if not line.startswith('data:'):
+                continue
+            data = line[5:].strip()
+            if data and data != '[DONE]':
+                yield data
+    
+    def _build_exercise_messages(self, subject: str, knowledge_points: List[str],
+                                 question_type: str, question_count: int,
+                                 difficulty_level: int, batch_hint: str = "") -> List[Dict]:
+        """构建题目生成的对话消息"""
         
-        # 构建提示词
         prompt = self._build_exercise_prompt(
-            subject, knowledge_points, question_type, question_count, difficulty_level
+            subject, knowledge_points, question_type, question_count, difficulty_level, batch_hint
         )
         
-        messages = [
+        return [
             {
                 "role": "system",
                 "content": "你是一个专业的教育AI助手，擅长根据学生的学习情况生成个性化的练习题目。请严格按照要求的格式输出题目。"
@@ -272,8 +574,235 @@ class AIService:
                 "content": prompt
             }
         ]
+    
+    async def generate_exercise_questions(self, user_id: int, subject: str, 
+                                        knowledge_points: List[str], question_type: str, 
+                                        question_count: int, difficulty_level: int = 1,
+                                        grade: Optional[str] = None) -> Dict[str, Any]:
+        """生成练习题目
+
+        算术、分数、小数、简易方程等公式化知识点直接由本地模板生成；
+        其余优先领取空闲时段为热门组卷参数预生成的整套题目，否则先从题库取题，
+        只为不足的部分调用AI模型，新生成的题目校验后收录进题库。
+        题库题目与模型题目都可换数派生变式，一次模型调用可提供多道练习题。
+        """
+        
+        start_time = time.time()
+        # 学生近期做过的题目（含改写后的近似题）不再出现
+        history = student_history.index_for(self.db, user_id)
+        
+        # 多生成一倍，去掉学生做过的题目后仍够数
+        local_questions = local_question_generator.generate(
+            subject, grade, knowledge_points, question_type, question_count * 2, difficulty_level
+        )
+        if local_questions:
+            questions = merge_question_sets([local_questions], limit=question_count, history=history)
+            if len(questions) >= question_count:
+                return {
+                    'success': True,
+                    'content': json.dumps({"questions": questions}, ensure_ascii=False),
+                    'usage': {},
+                    'response_time': time.time() - start_time,
+                    'local_generated': True
+                }
+        
+        pregeneration_pool.configure(self.db.get_bind())
+        pool_key = pregeneration_pool.record_demand(
+            subject, grade, knowledge_points, question_type, question_count, difficulty_level
+        )
+        pooled = pregeneration_pool.claim(self.db, pool_key, user_id, history=history)
+        if pooled:
+            return {
+                'success': True,
+                'content': json.dumps({"questions": merge_question_sets([pooled])}, ensure_ascii=False),
+                'usage': {},
+                'response_time': time.time() - start_time,
+                'pregenerated': True
+            }
+        
+        bank_questions = []
+        if QUESTION_BANK_ENABLED:
+            bank_questions = question_bank.draw(
+                self.db, subject, grade, knowledge_points, question_type,
+                difficulty_level, question_count, history=history
+            )
+        
+        variants = []
+        
+        def bank_result(note: Optional[str] = None) -> Dict[str, Any]:
+            result = {
+                'success': True,
+                'content': json.dumps({"questions": merge_question_sets([bank_questions, variants])},
+                                      ensure_ascii=False),
+                'usage': {},
+                'response_time': time.time() - start_time,
+                'from_bank': len(bank_questions)
+            }
+            if variants:
+                result['variants'] = len(variants)
+            if note:
+                result['warning'] = note
+            return result
         
-        return await self.call_ai_model(messages, "generate_exercise", user_id)
+        shortfall = question_count - len(bank_questions)
+        if shortfall > 0 and bank_questions:
+            # 题库题目换数派生变式补足，不调用模型
+            variants = variant_engine.expand(bank_questions, shortfall, subject=subject, history=history)
+            shortfall -= len(variants)
+        if shortfall <= 0:
+            self._ingest_questions(variants, subject, grade, knowledge_points, question_type,
+                                   difficulty_level, source="variant")
+            return bank_result()
+        
+        # 模型生成的题目也可派生变式，按可换数比例少要一些源题
+        model_count = variant_engine.source_count(subject, shortfall)
+        result = await self._generate_questions_with_model(
+            user_id, subject, knowledge_points, question_type, model_count, difficulty_level
+        )
+        generated = parse_questions(result['content']) if result.get('success') else None
+        if not generated:
+            # 模型调用失败时，题库中已有的题目仍可返回
+            return bank_result(result.get('error')) if bank_questions or variants else result
+        
+        sets = [bank_questions, variants, generated]
+        generated_variants = variant_engine.expand(
+            generated, shortfall - len(generated), subject=subject, history=history
+        )
+        questions = merge_question_sets(sets + [generated_variants], limit=question_count,
+                                        history=history)
+        missing = question_count - len(questions)
+        if missing > 0 and model_count < shortfall:
+            # 源题换数后仍不够（部分题目无法换数），按缺口再生成一次
+            extra = await self._generate_questions_with_model(
+                user_id, subject, knowledge_points, question_type, missing, difficulty_level
+            )
+            if extra.get('success'):
+                result = self._merge_exercise_results([result, extra], model_count + missing)
+                generated = parse_questions(result['content']) or generated
+                sets = [bank_questions, variants, generated]
+                questions = merge_question_sets(sets + [generated_variants], limit=question_count,
+                                                history=history)
+        
+        self._ingest_questions(generated, subject, grade, knowledge_points, question_type,
+                               difficulty_level, model_name=result.get('model_name'))
+        self._ingest_questions(variants + generated_variants, subject, grade, knowledge_points,
+                               question_type, difficulty_level, source="variant")
+        
+        if not questions:
+            return bank_result() if bank_questions else result
+        response = {
+            **result,
+            'content': json.dumps({"questions": questions}, ensure_ascii=False),
+            'from_bank': len(bank_questions)
+        }
+        if variants or generated_variants:
+            response['variants'] = len(variants) + len(generated_variants)
+        return response
+    
+    def _ingest_questions(self, questions: List[Dict[str, Any]], subject: str, grade: Optional[str],
+                          knowledge_points: List[str], question_type: str, difficulty_level: int,
+                          source: str = "ai", model_name: Optional[str] = None):
+        """校验后收录进题库；收录失败不影响本次组卷"""
+        if not questions:
+            return
+        try:
+            question_bank.ingest(
+                self.db, questions, subject, grade, knowledge_points, question_type,
+                difficulty_level, source=source, model_name=model_name
+            )
+        except Exception as e:
+            self.db.rollback()
+            logger.error(f"题目收录题库失败: {e}")
+    
+    async def _generate_questions_with_model(self, user_id: int, subject: str,
+                                             knowledge_points: List[str], question_type: str,
+                                             question_count: int, difficulty_level: int,
+                                             function_type: str = "generate_exercise") -> Dict[str, Any]:
+        """调用AI模型生成题目
+
+        题量较大时拆分为多组并发生成（最多 FANOUT_MAX_CHUNKS 组同时进行），
+        合并去重后重新编号，耗时取决于最慢的一轮而不是总输出长度。
+        """
+        
+        chunks = plan_exercise_chunks(knowledge_points, question_type, question_count)
+        if len(chunks) == 1:
+            messages = self._build_exercise_messages(
+                subject, knowledge_points, question_type, question_count, difficulty_level
+            )
+            return await self.call_ai_model(messages, function_type, user_id,
+                                            validate=parse_questions)
+        
+        concurrency = asyncio.Semaphore(FANOUT_MAX_CHUNKS)
+        
+        async def generate_chunk(chunk) -> Dict[str, Any]:
+            batch_hint = (
+                f"本次为第{chunk.index + 1}组（共{chunk.total}组）题目，"
+                f"请侧重与其他组不同的考查角度，避免出现常见的重复题目"
+            )
+            messages = self._build_exercise_messages(
+                subject, chunk.knowledge_points, chunk.question_type,
+                chunk.question_count, difficulty_level, batch_hint
+            )
+            async with concurrency:
+                return await self.call_ai_model(
+                    messages, function_type, user_id,
+                    max_tokens=estimate_max_tokens(chunk.question_type, chunk.question_count),
+                    validate=parse_questions
+                )
+        
+        results = await asyncio.gather(*[generate_chunk(chunk) for chunk in chunks])
+        return self._merge_exercise_results(results, question_count)
+    
+    @staticmethod
+    def _merge_exercise_results(results: List[Dict[str, Any]], question_count: int) -> Dict[str, Any]:
+        """合并各组生成结果，部分组失败时返回其余组的题目"""
+        
+        question_sets = []
+        usage = {}
+        failed = []
+        for result in results:
+            questions = parse_questions(result['content']) if result.get('success') else None
+            if not questions:
+                failed.append(result)
+                continue
+            question_sets.append(questions)
+            for key, value in (result.get('usage') or {}).items():
+                if isinstance(value, (int, float)):
+                    usage[key] = usage.get(key, 0) + value
+        
+        if not question_sets:
+            return failed[0] if failed[0].get('success') is False else {
+                'success': False,
+                'error': 'AI返回的题目无法解析'
+            }
+        
+        questions = merge_question_sets(question_sets, limit=question_count)
+        if failed or len(questions) < question_count:
+            logger.warning(f"拆分生成题目不足: 需要{question_count}题，得到{len(questions)}题，"
+                           f"{len(failed)}组失败")
+        
+        return {
+            'success': True,
+            'content': json.dumps({"questions": questions}, ensure_ascii=False),
+            'usage': usage,
+            'response_time': max(result.get('response_time', 0) for result in results),
+            'chunks': len(results),
+            'failed_chunks': len(failed)
+        }
+    
+    async def generate_exercise_questions_stream(self, user_id: int, subject: str,
+                                                 knowledge_points: List[str], question_type: str,
+                                                 question_count: int,
+                                                 difficulty_level: int = 1) -> AsyncIterator[str]:
+        """流式生成练习题目，逐段产出模型输出的文本"""
+        
+        messages = self._build_exercise_messages(
+            subject, knowledge_points, question_type, question_count, difficulty_level
+        )
+        
+        async for delta in self.stream_ai_model(messages, "generate_exercise", user_id,
+                                                validate=parse_questions):
+            yield delta
     
     async def generate_answer_analysis(self, user_id: int, questions: List[Dict]) -> Dict[str, Any]:
         """生成答案解析"""
@@ -312,7 +841,8 @@ class AIService:
         return await self.call_ai_model(messages, "analyze_errors", user_id)
     
     def _build_exercise_prompt(self, subject: str, knowledge_points: List[str], 
-                              question_type: str, question_count: int, difficulty_level: int) -> str:
+                              question_type: str, question_count: int, difficulty_level: int,
+                              batch_hint: str = "") -> str:
         """构建题目生成提示词"""
         
         type_map = {
@@ -342,7 +872,7 @@ class AIService:
 4. 如果是选择题，提供4个选项（A、B、C、D）
 5. 如果是填空题，用下划线表示空白处
 6. 如果是解答题，要求有明确的解题步骤
-
+{f"7. {batch_hint}" if batch_hint else ""}
 请按照以下JSON格式输出：
 {{
     "questions": [
@@ -430,22 +960,20 @@ class AIService:
                            response_time: float, success: bool, prompt_tokens: int = 0,
                            completion_tokens: int = 0, total_tokens: int = 0,
                            error_message: str = None):
-        """记录API调用日志"""
-        
-        log_entry = AICallLog(
-            user_id=user_id,
-            model_name=model_name,
-            function_type=function_type,
-            prompt_tokens=prompt_tokens,
-            completion_tokens=completion_tokens,
-            total_tokens=total_tokens,
-            response_time=response_time,
-            success=success,
-            error_message=error_message
-        )
+        """记录API调用日志（放入异步批量写入队列，不阻塞调用方）"""
         
-        self.db.add(log_entry)
-        self.db.commit()
+        ai_call_log_writer.configure(self.db.get_bind())
+        ai_call_log_writer.enqueue({
+            "user_id": user_id,
+            "model_name": model_name,
+            "function_type": function_type,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": total_tokens,
+            "response_time": response_time,
+            "success": success,
+            "error_message": error_message
+        })
 
 
 # AI服务管理类
@@ -492,5 +1020,6 @@ class AIServiceManager:
         db.add(tongyi_config)
         db.add(deepseek_config)
         db.commit()
+        model_registry.invalidate()
         
         logger.info("默认AI模型配置已初始化")
\ No newline at end of file
@@ -0,0 +1,143 @@
+import json
+import time
+import asyncio
+import hashlib
+import aiohttp
+from typing import Dict, Any, Optional
+from urllib.parse import urlsplit
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 连接池默认参数，可通过 AIModelConfig.model_params["pool"] 按模型覆盖
+DEFAULT_POOL_OPTIONS = {
+    "limit": 100,             # 单个端点连接总数上限
+    "limit_per_host": 20,     # 单个主机的并发连接上限
+    "keepalive_timeout": 60,  # 空闲连接保活时间（秒）
+    "ttl_dns_cache": 300,     # DNS缓存时间（秒）
+    "connect_timeout": 10     # 建立连接超时（秒）
+}
+
+
+class HTTPClientPool:
+    """进程级HTTP连接池，按上游端点（及连接池参数）复用 aiohttp.ClientSession"""
+
+    def __init__(self):
+        self._sessions: Dict[str, aiohttp.ClientSession] = {}
+        self._options: Dict[str, Dict[str, Any]] = {}
+        self._stats: Dict[str, Dict[str, Any]] = {}
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def endpoint_key(api_endpoint: str) -> str:
+        """按 scheme://host:port 区分连接池"""
+        parts = urlsplit(api_endpoint)
+        return f"{parts.scheme}://{parts.netloc}"
+
+    @classmethod
+    def session_key(cls, api_endpoint: str, options: Dict[str, Any]) -> str:
+        """默认参数直接按端点区分；自定义连接池参数的模型单独建池，参数修改后自动换用新池"""
+        key = cls.endpoint_key(api_endpoint)
+        if options == DEFAULT_POOL_OPTIONS:
+            return key
+        digest = hashlib.sha1(json.dumps(options, sort_keys=True).encode()).hexdigest()[:8]
+        return f"{key}#{digest}"
+
+    @staticmethod
+    def pool_options(model_config) -> Dict[str, Any]:
+        """合并默认参数与模型配置中的连接池参数"""
+        options = dict(DEFAULT_POOL_OPTIONS)
+        model_params = model_config.model_params or {}
+        options.update(model_params.get("pool") or {})
+        return options
+
+    async def get_session(self, model_config) -> aiohttp.ClientSession:
+        """获取模型端点对应的共享会话，不存在时创建"""
+        options = self.pool_options(model_config)
+        key = self.session_key(model_config.api_endpoint, options)
+        session = self._sessions.get(key)
+        if session is not None and not session.closed:
+            return session
+
+        async with self._lock:
+            session = self._sessions.get(key)
+            if session is None or session.closed:
+                session = self._create_session(key, options)
+                self._sessions[key] = session
+                self._options[key] = options
+                logger.info(f"已创建上游连接池: {key} {options}")
+        return session
+
+    def _create_session(self, key: str, options: Dict[str, Any]) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(
+            limit=options["limit"],
+            limit_per_host=options["limit_per_host"],
+            keepalive_timeout=options["keepalive_timeout"],
+            ttl_dns_cache=options["ttl_dns_cache"]
+        )
+
+        stats = self._stats.setdefault(key, {
+            "requests": 0,
+            "connections_created": 0,
+            "connections_reused": 0,
+            "created_at": time.time()
+        })
+
+        trace_config = aiohttp.TraceConfig()
+
+        async def on_request_start(session, context, params):
+            stats["requests"] += 1
+
+        async def on_connection_create_end(session, context, params):
+            stats["connections_created"] += 1
+
+        async def on_connection_reuseconn(session, context, params):
+            stats["connections_reused"] += 1
+
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+
+        return aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(sock_connect=options["connect_timeout"]),
+            trace_configs=[trace_config]
+        )
+
+    def get_stats(self) -> Dict[str, Any]:
+        """返回各端点连接池的运行统计"""
+        endpoints = {}
+        for key, session in self._sessions.items():
+            connector = session.connector
+            stats = self._stats.get(key, {})
+            requests = stats.get("requests", 0)
+            endpoints[key] = {
+                **stats,
+                "reuse_rate": round(stats.get("connections_reused", 0) / requests * 100, 1) if requests else 0,
+                "closed": session.closed,
+                "limit": connector.limit if connector else None,
+                "limit_per_host": connector.limit_per_host if connector else None,
+                "in_use": len(getattr(connector, "_acquired", ())) if connector else 0,
+                "idle": sum(len(conns) for conns in getattr(connector, "_conns", {}).values()) if connector else 0,
+                "options": self._options.get(key, {})
+            }
+        return {"endpoints": endpoints}
+
+    async def close(self, api_endpoint: Optional[str] = None):
+        """关闭连接池；指定端点时只关闭该端点的所有连接池（配置变更后重建）"""
+        if api_endpoint:
+            endpoint = self.endpoint_key(api_endpoint)
+            keys = [key for key in self._sessions if key == endpoint or key.startswith(f"{endpoint}#")]
+        else:
+            keys = list(self._sessions.keys())
+
+        for key in keys:
+            session = self._sessions.pop(key, None)
+            self._options.pop(key, None)
+            if session and not session.closed:
+                await session.close()
+                logger.info(f"已关闭上游连接池: {key}")
+
+
+# 进程级共享实例
+http_pool = HTTPClientPool()
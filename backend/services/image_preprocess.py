@@ -0,0 +1,232 @@
+import io
+import os
+import math
+import time
+import base64
+import asyncio
+import binascii
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Dict, Any, Optional, Tuple, Union, BinaryIO
+import logging
+
+# 图片预处理需要 Pillow（可选依赖），未安装时原图直接发送
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = ImageOps = None
+
+logger = logging.getLogger(__name__)
+
+# 视觉模型按 28×28 像素块计费，默认最多约 1280 个块，超出部分会被模型侧缩小
+VISION_MAX_PIXELS = int(os.getenv("VISION_MAX_PIXELS", str(1280 * 28 * 28)))
+
+# 预处理选项：灰度、自动对比度、输出格式与质量
+IMAGE_GRAYSCALE = os.getenv("IMAGE_GRAYSCALE", "false").lower() == "true"
+IMAGE_AUTOCONTRAST = os.getenv("IMAGE_AUTOCONTRAST", "true").lower() == "true"
+IMAGE_OUTPUT_FORMAT = os.getenv("IMAGE_OUTPUT_FORMAT", "jpeg").lower()  # jpeg 或 webp
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "85"))
+
+# 预处理线程数；解码、缩放与编码期间 Pillow 会释放GIL
+IMAGE_PREPROCESS_WORKERS = int(os.getenv("IMAGE_PREPROCESS_WORKERS", "2"))
+
+# 拒绝处理的超大图片（像素数），防止解压炸弹
+IMAGE_MAX_INPUT_PIXELS = 60_000_000
+
+_MIME_TYPES = {"jpeg": "image/jpeg", "webp": "image/webp"}
+
+
+def split_data_url(image: str) -> Tuple[Optional[str], str]:
+    """拆分 data URL，返回 (MIME类型, base64数据)；不带前缀时 MIME 为空"""
+    if image.startswith("data:"):
+        header, _, data = image.partition(",")
+        return header[5:].split(";")[0] or None, data
+    return None, image
+
+
+def target_size(width: int, height: int, max_pixels: int) -> Tuple[int, int]:
+    """等比缩放到不超过 max_pixels 的尺寸"""
+    if width * height <= max_pixels:
+        return width, height
+    scale = math.sqrt(max_pixels / (width * height))
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+def dhash(image, hash_size: int = 8) -> str:
+    """差值感知哈希：缩小为 (hash_size+1)×hash_size 灰度图，比较相邻像素明暗
+
+    对缩放、重新压缩与轻微亮度变化不敏感，返回16位十六进制字符串。
+    """
+    small = image.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            value = (value << 1) | (1 if left > right else 0)
+    return f"{value:0{hash_size * hash_size // 4}x}"
+
+
+def preprocess_image(source: Union[bytes, BinaryIO], max_pixels: int = VISION_MAX_PIXELS,
+                     grayscale: bool = IMAGE_GRAYSCALE, autocontrast: bool = IMAGE_AUTOCONTRAST,
+                     output_format: str = IMAGE_OUTPUT_FORMAT,
+                     quality: int = IMAGE_QUALITY) -> Tuple[bytes, str, Dict[str, Any]]:
+    """解码、按EXIF方向旋转、缩放、归一化后重新编码（在线程池中执行）
+
+    source 可以是图片字节或已定位到开头的文件句柄（如上传的临时文件）。
+    """
+    image = Image.open(io.BytesIO(source) if isinstance(source, bytes) else source)
+    original_size = image.size
+    original_format = image.format
+    if original_size[0] * original_size[1] > IMAGE_MAX_INPUT_PIXELS:
+        raise ValueError(f"图片尺寸过大: {original_size[0]}x{original_size[1]}")
+
+    size = target_size(*original_size, max_pixels)
+    mode = "L" if grayscale else "RGB"
+    if image.format == "JPEG":
+        # JPEG 可在解码时按 1/2、1/4、1/8 缩小，大幅减少解码耗时与内存
+        image.draft(mode, size)
+    image = ImageOps.exif_transpose(image)
+
+    if image.mode in ("RGBA", "LA", "P"):
+        # 透明背景铺白，避免编码为JPEG后变黑
+        rgba = image.convert("RGBA")
+        image = Image.new("RGB", rgba.size, (255, 255, 255))
+        image.paste(rgba, mask=rgba.getchannel("A"))
+    image = image.convert(mode)
+
+    # exif_transpose 可能交换宽高，按当前方向重新计算目标尺寸
+    size = target_size(*image.size, max_pixels)
+    if size != image.size:
+        image = image.resize(size, Image.LANCZOS, reducing_gap=3.0)
+    if autocontrast:
+        image = ImageOps.autocontrast(image, cutoff=1)
+    # 在缩小后的图片上计算感知哈希，用于识别重复提交的照片
+    perceptual_hash = dhash(image)
+
+    output_format = output_format if output_format in _MIME_TYPES else "jpeg"
+    buffer = io.BytesIO()
+    if output_format == "webp":
+        image.save(buffer, "WEBP", quality=quality, method=4)
+    else:
+        image.save(buffer, "JPEG", quality=quality, optimize=True, progressive=True)
+
+    return buffer.getvalue(), _MIME_TYPES[output_format], {
+        "dhash": perceptual_hash,
+        "original_format": original_format,
+        "original_size": list(original_size),
+        "output_size": list(image.size)
+    }
+
+
+class ImagePreprocessor:
+    """视觉模型调用前的图片预处理
+
+    手机拍摄的作业照片通常有数MB，超出模型的有效分辨率。缩放并重新编码后
+    上传更快、视觉token更少，单个请求占用的内存也更小。
+    """
+
+    def __init__(self, workers: int = IMAGE_PREPROCESS_WORKERS):
+        self.workers = workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.stats = {"processed": 0, "passthrough": 0, "failed": 0,
+                      "bytes_in": 0, "bytes_out": 0, "total_ms": 0.0, "max_ms": 0.0}
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                thread_name_prefix="image-preprocess")
+        return self._executor
+
+    async def prepare(self, image: str, **options) -> Tuple[str, Dict[str, Any]]:
+        """处理 data URL 或 base64 图片，返回 (data URL, 处理信息)
+
+        图片链接、无法解码的数据或未安装 Pillow 时原样返回，不影响批阅请求。
+        """
+        if not image or image.startswith(("http://", "https://", "oss://")) or Image is None:
+            self.stats["passthrough"] += 1
+            return image, {"preprocessed": False}
+
+        start = time.perf_counter()
+        _, encoded = split_data_url(image)
+        try:
+            data = base64.b64decode(encoded, validate=False)
+        except (binascii.Error, ValueError) as e:
+            self.stats["failed"] += 1
+            logger.warning(f"图片数据无法解码，使用原图: {e}")
+            return image, {"preprocessed": False, "error": str(e)}
+
+        return await self._process(data, len(data), start, lambda: image, **options)
+
+    async def prepare_file(self, file: BinaryIO, size: int, content_type: str = "image/jpeg",
+                           **options) -> Tuple[str, Dict[str, Any]]:
+        """处理上传的图片文件句柄，返回 (data URL, 处理信息)
+
+        直接从临时文件解码，原图不会以 base64 形式整体驻留内存。
+        """
+        def original() -> str:
+            file.seek(0)
+            return f"data:{content_type};base64,{base64.b64encode(file.read()).decode()}"
+
+        if Image is None:
+            self.stats["passthrough"] += 1
+            return original(), {"preprocessed": False}
+        file.seek(0)
+        return await self._process(file, size, time.perf_counter(), original, **options)
+
+    async def _process(self, source: Union[bytes, BinaryIO], size: int, start: float,
+                       original, **options) -> Tuple[str, Dict[str, Any]]:
+        try:
+            loop = asyncio.get_running_loop()
+            output, mime, info = await loop.run_in_executor(
+                self._get_executor(), partial(preprocess_image, source, **options)
+            )
+        except (ValueError, OSError, Image.DecompressionBombError) as e:
+            # OSError 包含 Pillow 无法识别图片格式的情况
+            self.stats["failed"] += 1
+            logger.warning(f"图片预处理失败，使用原图: {e}")
+            return original(), {"preprocessed": False, "error": str(e)}
+
+        if len(output) >= size and info["output_size"] == info["original_size"]:
+            # 原图已足够小，重新编码反而变大
+            result = original()
+            output_bytes = size
+        else:
+            result = f"data:{mime};base64,{base64.b64encode(output).decode()}"
+            output_bytes = len(output)
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.stats["processed"] += 1
+        self.stats["bytes_in"] += size
+        self.stats["bytes_out"] += output_bytes
+        self.stats["total_ms"] += elapsed_ms
+        self.stats["max_ms"] = max(self.stats["max_ms"], elapsed_ms)
+        info.update({
+            "preprocessed": True,
+            "original_bytes": size,
+            "output_bytes": output_bytes,
+            "elapsed_ms": round(elapsed_ms, 1)
+        })
+        return result, info
+
+    def get_stats(self) -> Dict[str, Any]:
+        processed = self.stats["processed"]
+        bytes_in = self.stats["bytes_in"]
+        return {
+            **{k: v for k, v in self.stats.items() if k not in ("total_ms", "max_ms")},
+            "available": Image is not None,
+            "avg_ms": round(self.stats["total_ms"] / processed, 1) if processed else 0,
+            "max_ms": round(self.stats["max_ms"], 1),
+            "compression_ratio": round(self.stats["bytes_out"] / bytes_in, 3) if bytes_in else None,
+            "max_pixels": VISION_MAX_PIXELS
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+# 进程级共享实例
+image_preprocessor = ImagePreprocessor()
@@ -0,0 +1,630 @@
+import os
+import re
+import math
+import random
+from dataclasses import dataclass
+from decimal import Decimal
+from fractions import Fraction
+from typing import Dict, Any, List, Optional, Callable, Tuple, Union
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 算术等公式化知识点由本地模板生成，不调用AI模型；可通过环境变量关闭
+LOCAL_GENERATOR_ENABLED = os.getenv("LOCAL_GENERATOR_ENABLED", "true").lower() == "true"
+
+# 批次内出现重复题目时的重试上限（按题数的倍数）
+LOCAL_GENERATOR_ATTEMPTS = 20
+
+MIXED_TYPES = ["choice", "fill", "solve"]
+CHOICE_LETTERS = "ABCD"
+
+Number = Union[int, Fraction, Decimal]
+
+_CHINESE_NUMBERS = {"一": 1, "二": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+_GRADE_PATTERN = re.compile(r"([1-9一二三四五六七八九])\s*年级")
+_RANGE_PATTERN = re.compile(r"(?<!\d)(10|20|100|1000|10000|万)以内")
+_STAGE_PATTERN = re.compile(r"(初|高)([一二三123])")
+
+# 知识点前的年级、册次与数的范围，后面的 "计算"、"练习" 等不影响题型，匹配前去掉
+_POINT_PREFIX = re.compile(r"^(?:小学|初中)?(?:[1-9一二三四五六七八九]年级)?(?:[上下]册)?"
+                           r"(?:(?:10|20|100|1000|10000|万)以内(?:的)?)?")
+_POINT_SUFFIX = re.compile(r"(?:的)?(?:计算|练习|口算|笔算|计算题)$")
+
+# 含这些词的知识点是概念、图形或其他题型，即使包含运算名称也交给AI模型
+_EXCLUDED_POINTS = re.compile(r"面积|周长|体积|百分|意义|比较|大小|认识|方程组|比例|单位")
+
+# 整数运算名称前允许的修饰，如 "两位数进位加法"、"有余数的除法"
+_INT_MODIFIERS = (r"(?:表内|整数|口算|笔算|连续|有余数的|(?:不)?进位|(?:不)?退位|"
+                  r"(?:一|两|三|多)位数(?:的)?|(?:除数|因数)是(?:一|两)位数的)*")
+
+# 应用题中的人名，换数变式也用于替换题干中的人名
+NAMES = ["小明", "小红", "小刚", "小丽", "小华", "小芳", "小军", "小雨"]
+_ITEMS = [("个", "苹果"), ("支", "铅笔"), ("本", "故事书"), ("颗", "糖果"),
+          ("张", "贴纸"), ("朵", "红花"), ("块", "饼干"), ("个", "气球")]
+
+
+@dataclass
+class Problem:
+    """一道公式化题目：算式、精确答案、解析、常见错误答案，以及可选的填空与应用题形式"""
+    expression: str
+    answer: str
+    explanation: str
+    distractors: List[str]
+    fill: Optional[Tuple[str, str]] = None      # (题干, 答案)，默认为 "算式 = ____"
+    word: Optional[Tuple[str, str]] = None      # (应用题题干, 带单位的答案)
+    choice_stem: Optional[str] = None           # 选择题题干，默认为 "计算：算式 = ?"
+    option_prefix: str = ""                     # 选项前缀，如解方程的 "x = "
+
+
+@dataclass
+class Topic:
+    """一个可本地生成的知识点"""
+    name: str
+    label: str
+    patterns: Tuple[str, ...]       # 完整匹配知识点名称的正则
+    generator: Callable[[random.Random, int, int, str], Problem]
+    grades: Tuple[int, int]         # 适用年级范围
+    default_grade: int              # 未指定年级时按该年级出题
+
+
+def parse_grade(grade: Optional[str]) -> Optional[int]:
+    """把 "3年级"、"小学三年级"、"初一" 等解析为年级数字（初一为7）"""
+    if not grade:
+        return None
+    match = _GRADE_PATTERN.search(grade)
+    if match:
+        value = match.group(1)
+        return int(value) if value.isdigit() else _CHINESE_NUMBERS[value]
+    match = _STAGE_PATTERN.search(grade)
+    if match:
+        value = match.group(2)
+        number = int(value) if value.isdigit() else _CHINESE_NUMBERS[value]
+        return number + (6 if match.group(1) == "初" else 9)
+    return None
+
+
+def format_number(value: Number) -> str:
+    if isinstance(value, Fraction):
+        if value.denominator == 1:
+            return str(value.numerator)
+        return f"{value.numerator}/{value.denominator}"
+    if isinstance(value, Decimal):
+        return format(value.normalize(), "f")
+    return str(value)
+
+
+def pick_distractors(rng: random.Random, answer: Number, candidates: List[Number],
+                     step: Number = 1, minimum: Number = 0) -> List[str]:
+    """从常见错误答案中选出3个干扰项，不足时用答案附近的数值补足"""
+    chosen: List[Number] = []
+    for candidate in candidates:
+        if candidate is None or candidate == answer or candidate < minimum or candidate in chosen:
+            continue
+        chosen.append(candidate)
+        if len(chosen) == 3:
+            break
+    offsets = [1, -1, 2, -2, 3, -3, 5, -5, 10, -10]
+    rng.shuffle(offsets)
+    for offset in offsets:
+        if len(chosen) == 3:
+            break
+        candidate = answer + step * offset
+        if candidate >= minimum and candidate != answer and candidate not in chosen:
+            chosen.append(candidate)
+    return [format_number(value) for value in chosen]
+
+
+def _operand_range(limit: int) -> int:
+    """操作数下限：20以内从1开始，更大范围时保证位数"""
+    return 1 if limit <= 20 else limit // 10
+
+
+def _has_carry(a: int, b: int) -> bool:
+    while a or b:
+        if a % 10 + b % 10 >= 10:
+            return True
+        a, b = a // 10, b // 10
+    return False
+
+
+def _has_borrow(a: int, b: int) -> bool:
+    while b:
+        if a % 10 < b % 10:
+            return True
+        a, b = a // 10, b // 10
+    return False
+
+
+def _digitwise(a: int, b: int, op: Callable[[int, int], int]) -> int:
+    """逐位计算但忽略进位/退位，对应学生最常见的错误"""
+    result, place = 0, 1
+    while a or b:
+        result += op(a % 10, b % 10) % 10 * place
+        a, b, place = a // 10, b // 10, place * 10
+    return result
+
+
+def _carry_preference(hint: str, difficulty: int) -> Optional[bool]:
+    if "不进位" in hint or "不退位" in hint:
+        return False
+    if "进位" in hint or "退位" in hint:
+        return True
+    if difficulty <= 1:
+        return False
+    return True if difficulty >= 3 else None
+
+
+def _add_limit(grade: int, difficulty: int, hint: str) -> int:
+    """加减法的数范围：知识点写明“20以内”等时以其为准，否则按年级与难度"""
+    match = _RANGE_PATTERN.search(hint)
+    if match:
+        return 10000 if match.group(1) == "万" else int(match.group(1))
+    if grade <= 1:
+        # 10以内没有进位加法和退位减法
+        return 10 if difficulty <= 1 and "进位" not in hint and "退位" not in hint else 20
+    if grade == 2:
+        return 100
+    if grade == 3:
+        return 1000
+    return 10000
+
+
+def _word_context(rng: random.Random) -> Tuple[str, str, str]:
+    name = rng.choice(NAMES)
+    unit, item = rng.choice(_ITEMS)
+    return name, unit, item
+
+
+def addition(rng: random.Random, grade: int, difficulty: int, hint: str) -> Problem:
+    limit = _add_limit(grade, difficulty, hint)
+    low = _operand_range(limit)
+    want_carry = _carry_preference(hint, difficulty)
+    for _ in range(50):
+        a = rng.randint(low, limit - low)
+        b = rng.randint(low, limit - a)
+        if want_carry is None or _has_carry(a, b) == want_carry:
+            break
+    total = a + b
+    carry = _has_carry(a, b)
+    name, unit, item = _word_context(rng)
+    return Problem(
+        expression=f"{a} + {b}",
+        answer=str(total),
+        explanation=f"{a} + {b} = {total}。" + ("相同数位对齐，哪一位相加满十，就向前一位进1。" if carry else ""),
+        distractors=pick_distractors(rng, total, [_digitwise(a, b, int.__add__), total + 10, total - 10, a - b]),
+        fill=rng.choice([(f"{a} + {b} = ____", str(total)), (f"{a} + ____ = {total}", str(b))]),
+        word=(f"{name}有{a}{unit}{item}，又买来{b}{unit}，现在一共有多少{unit}{item}？", f"{total}{unit}{item}")
+    )
+
+
+def subtraction(rng: random.Random, grade: int, difficulty: int, hint: str) -> Problem:
+    limit = _add_limit(grade, difficulty, hint)
+    low = _operand_range(limit)
+    want_borrow = _carry_preference(hint, difficulty)
+    for _ in range(50):
+        a = rng.randint(low * 2, limit)
+        b = rng.randint(low, a - low)
+        if want_borrow is None or _has_borrow(a, b) == want_borrow:
+            break
+    difference = a - b
+    borrow = _has_borrow(a, b)
+    name, unit, item = _word_context(rng)
+    return Problem(
+        expression=f"{a} - {b}",
+        answer=str(difference),
+        explanation=f"{a} - {b} = {difference}。" + ("相同数位对齐，哪一位不够减，就从前一位退1当十再减。" if borrow else ""),
+        distractors=pick_distractors(rng, difference, [
+            _digitwise(a, b, lambda x, y: abs(x - y)), difference + 10, difference - 10, a + b
+        ]),
+        fill=rng.choice([(f"{a} - {b} = ____", str(difference)), (f"{a} - ____ = {difference}", str(b))]),
+        word=(f"{name}有{a}{unit}{item}，送给同学{b}{unit}，还剩多少{unit}{item}？", f"{difference}{unit}{item}")
+    )
+
+
+def add_or_subtract(rng: random.Random, grade: int, difficulty: int, hint: str) -> Problem:
+    return rng.choice([addition, subtraction])(rng, grade, difficulty, hint)
+
+
+def _factors(rng: random.Random, grade: int, difficulty: int) -> Tuple[int, int]:
+    if grade <= 2 or difficulty <= 1:
+        return rng.randint(2, 9), rng.randint(2, 9)
+    if grade == 3:
+        return rng.randint(12, 99), rng.randint(2, 9)
+    if difficulty >= 4:
+        return rng.randint(101, 999), rng.randint(11, 99)
+    return rng.randint(11, 99), rng.randint(11, 99)
+
+
+def multiplication(rng: random.Random, grade: int, difficulty: int, hint: str) -> Problem:
+    a, b = _factors(rng, grade, difficulty)
+    product = a * b
+    name, unit, item = _word_context(rng)
+    explanation = f"{a} × {b} = {product}。"
+    if b >= 10:
+        explanation += f"先算 {a} × {b % 10} = {a * (b % 10)}，再算 {a} × {b - b % 10} = {a * (b - b % 10)}，两部分相加。"
+    return Problem(
+        expression=f"{a} × {b}",
+        answer=str(product),
+        explanation=explanation,
+        distractors=pick_distractors(rng, product, [product + a, product - a, product + b, a + b, product + 10]),
+        fill=rng.choice([(f"{a} × {b} = ____", str(product)), (f"{a} × ____ = {product}", str(b))]),
+        word=(f"每盒装{b}{unit}{item}，{a}盒一共有多少{unit}{item}？", f"{product}{unit}{item}")
+    )
+
+
+def division(rng: random.Random, grade: int, difficulty: int, hint: str) -> Problem:
+    with_remainder = "余数" in hint or (grade == 3 and difficulty >= 3 and "整除" not in hint)
+    divisor = rng.randint(11, 99) if grade >= 4 and difficulty >= 3 else rng.randint(2, 9)
+    if grade <= 2 or difficulty <= 1 or (grade == 3 and with_remainder):
+        quotient = rng.randint(2, 9)
+    else:
+        quotient = rng.randint(11, 99)
+    remainder = rng.randint(1, divisor - 1) if with_remainder else 0
+    dividend = divisor * quotient + remainder
+    name, unit, item = _word_context(rng)
+
+    if remainder:
+        answer = f"{quotient}……{remainder}"
+        distractors = [f"{quotient + 1}……{remainder}", f"{quotient}……{remainder + divisor}",
+                       f"{quotient - 1}……{remainder}" if quotient > 1 else f"{quotient + 2}……{remainder}"]
+        if remainder > 1:
+            distractors[2] = f"{quotient}……{remainder - 1}"
+        return Problem(
+            expression=f"{dividend} ÷ {divisor}",
+            answer=answer,
+            explanation=f"{divisor} × {quotient} = {divisor * quotient}，{dividend} - {divisor * quotient} = {remainder}，"
+                        f"所以 {dividend} ÷ {divisor} = {answer}。余数必须比除数小。",
+            distractors=distractors,
+            fill=(f"{dividend} ÷ {divisor} = ____……____", f"{quotient}，{remainder}"),
+            word=(f"{dividend}{unit}{item}平均分给{divisor}个小朋友，每人分到几{unit}，还剩几{unit}？",
+                  f"每人分到{quotient}{unit}，还剩{remainder}{unit}"),
+            choice_stem=f"{dividend} ÷ {divisor} 的结果是（  ）"
+        )
+
+    return Problem(
+        expression=f"{dividend} ÷ {divisor}",
+        answer=str(quotient),
+        explanation=f"想乘法：{divisor} × {quotient} = {dividend}，所以 {dividend} ÷ {divisor} = {quotient}。",
+        distractors=pick_distractors(rng, quotient, [quotient + 1, quotient - 1, quotient * 10, dividend - divisor]),
+        fill=(f"{dividend} ÷ {divisor} = ____", str(quotient)),
+        word=(f"{dividend}{unit}{item}平均分给{divisor}个小朋友，每人分到几{unit}？", f"{quotient}{unit}")
+    )
+
+
+def multiply_or_divide(rng: random.Random, grade: int, difficulty: int, hint: str) -> Problem:
+    return rng.choice([multiplication, division])(rng, grade, difficulty, hint)
+
+
+def mixed_operations(rng: random.Random, grade: int, difficulty: int, hint: str) -> Problem:
+    """两步混合运算，干扰项为按从左到右顺序计算等常见错误"""
+    limit = 50 if grade <= 3 else 200
+    c = rng.randint(2, 9)
+    form = rng.randrange(4)
+    if form == 0:
+        a, b = rng.randint(2, limit), rng.randint(2, 20)
+        expression, answer, wrong = f"{a} + {b} × {c}", a + b * c, (a + b) * c
+        steps = f"先算乘法：{b} × {c} = {b * c}，再算加法：{a} + {b * c} = {answer}。"
+    elif form == 1:
+        a, b = rng.randint(2, 30), rng.randint(2, 30)
+        expression, answer, wrong = f"({a} + {b}) × {c}", (a + b) * c, a + b * c
+        steps = f"先算括号里的：{a} + {b} = {a + b}，再算乘法：{a + b} × {c} = {answer}。"
+    elif form == 2:
+        b = rng.randint(2, 20)
+        a = rng.randint(b * c + 1, b * c + limit)
+        expression, answer, wrong = f"{a} - {b} × {c}", a - b * c, (a - b) * c
+        steps = f"先算乘法：{b} × {c} = {b * c}，再算减法：{a} - {b * c} = {answer}。"
+    else:
+        quotient = rng.randint(2, 20)
+        a, b = rng.randint(2, limit), quotient * c
+        expression, answer = f"{a} + {b} ÷ {c}", a + quotient
+        wrong = (a + b) // c if (a + b) % c == 0 else None
+        steps = f"先算除法：{b} ÷ {c} = {quotient}，再算加法：{a} + {quotient} = {answer}。"
+    return Problem(
+        expression=expression,
+        answer=str(answer),
+        explanation=steps + "混合运算先算乘除，后算加减，有括号先算括号里的。",
+        distractors=pick_distractors(rng, answer, [wrong, answer + 1, answer - 1, answer + 10])
+    )
+
+
+def _denominator_pair(rng: random.Random) -> Tuple[int, int]:
+    while True:
+        first, second = rng.randint(2, 12), rng.randint(2, 12)
+        if first != second:
+            return first, second
+
+
+def fraction(rng: random.Random, grade: int, difficulty: int, hint: str) -> Problem:
+    subtract = "减" in hint if ("加" in hint) != ("减" in hint) else rng.random() < 0.5
+    multiply = "乘" in hint or (grade >= 6 and difficulty >= 4 and "加" not in hint and "减" not in hint)
+
+    if multiply:
+        x = Fraction(rng.randint(1, 9), rng.randint(2, 10))
+        y = Fraction(rng.randint(1, 9), rng.randint(2, 10))
+        answer = x * y
+        return Problem(
+            expression=f"{format_number(x)} × {format_number(y)}",
+            answer=format_number(answer),
+            explanation=f"分子乘分子、分母乘分母，能约分的要约分：{format_number(x)} × {format_number(y)} = {format_number(answer)}。",
+            distractors=pick_distractors(rng, answer, [
+                Fraction(x.numerator * y.numerator, x.denominator + y.denominator),
+                x + y, x / y, answer * 2
+            ], step=Fraction(1, answer.denominator))
+        )
+
+    if grade <= 4:
+        denominator = rng.randint(3, 12)
+        a, b = rng.sample(range(1, denominator), 2)
+        if subtract and a < b:
+            a, b = b, a
+        x, y = Fraction(a, denominator), Fraction(b, denominator)
+        same_denominator = True
+        shown = (f"{a}/{denominator}", f"{b}/{denominator}")
+    else:
+        while True:
+            first, second = _denominator_pair(rng)
+            x = Fraction(rng.randint(1, first - 1), first)
+            y = Fraction(rng.randint(1, second - 1), second)
+            if x != y:
+                break
+        if subtract and x < y:
+            x, y = y, x
+        same_denominator = x.denominator == y.denominator
+        shown = (format_number(x), format_number(y))
+
+    answer = x - y if subtract else x + y
+    sign = "-" if subtract else "+"
+    if same_denominator:
+        method = "同分母分数相加减，分母不变，分子相加减"
+    else:
+        common = x.denominator * y.denominator // math.gcd(x.denominator, y.denominator)
+        method = f"异分母分数相加减，先通分（公分母为{common}），再按同分母分数计算"
+    # 常见错误：分子、分母分别相加减
+    wrong_numerator = abs(x.numerator - y.numerator) if subtract else x.numerator + y.numerator
+    wrong_denominator = abs(x.denominator - y.denominator) if subtract else x.denominator + y.denominator
+    wrong = Fraction(wrong_numerator, wrong_denominator) if wrong_denominator else None
+    return Problem(
+        expression=f"{shown[0]} {sign} {shown[1]}",
+        answer=format_number(answer),
+        explanation=f"{method}，结果化成最简分数：{shown[0]} {sign} {shown[1]} = {format_number(answer)}。",
+        distractors=pick_distractors(rng, answer, [
+            wrong, x + y if subtract else abs(x - y), answer + Fraction(1, answer.denominator * 2)
+        ], step=Fraction(1, answer.denominator) if answer else Fraction(1, 10), minimum=Fraction(0))
+    )
+
+
+def decimal_add_subtract(rng: random.Random, grade: int, difficulty: int, hint: str) -> Problem:
+    places = (1, 1) if grade <= 3 or difficulty <= 1 else (1, 2) if difficulty <= 3 else (2, 2)
+    limit = 10 if grade <= 3 else 100
+    x_digits = rng.randint(1, limit * 10 ** places[0] - 1)
+    y_digits = rng.randint(1, limit * 10 ** places[1] - 1)
+    if places[0] == places[1] and x_digits == y_digits:
+        y_digits += 1
+    x, y = Decimal(x_digits).scaleb(-places[0]), Decimal(y_digits).scaleb(-places[1])
+    subtract = "减" in hint if ("加" in hint) != ("减" in hint) else rng.random() < 0.5
+    if subtract and x < y:
+        x, y = y, x
+        x_digits, y_digits = y_digits, x_digits
+        places = places[::-1]
+    answer = x - y if subtract else x + y
+    sign = "-" if subtract else "+"
+    # 常见错误：末位对齐而不是小数点对齐
+    misaligned = None
+    if places[0] != places[1]:
+        raw = x_digits - y_digits if subtract else x_digits + y_digits
+        misaligned = Decimal(abs(raw)).scaleb(-max(places))
+    step = Decimal(1).scaleb(-max(places))
+    return Problem(
+        expression=f"{format_number(x)} {sign} {format_number(y)}",
+        answer=format_number(answer),
+        explanation=f"小数加减法要把小数点对齐，再按整数加减法计算：{format_number(x)} {sign} "
+                    f"{format_number(y)} = {format_number(answer)}。",
+        distractors=pick_distractors(rng, answer, [misaligned, answer + Decimal("0.1"), answer - Decimal("0.1"),
+                                                   answer + 1], step=step, minimum=Decimal(0))
+    )
+
+
+def equation(rng: random.Random, grade: int, difficulty: int, hint: str) -> Problem:
+    x = rng.randint(2, 20)
+    a = rng.randint(2, 9)
+    b = rng.randint(1, 30)
+    form = rng.randrange(3) if difficulty <= 2 else 3 + rng.randrange(3)
+    if form == 0:
+        c = x + b
+        text = f"x + {b} = {c}"
+        steps = f"x = {c} - {b}，x = {x}。"
+        wrong = [c + b, c]
+    elif form == 1:
+        c = x
+        x = c + b
+        text = f"x - {b} = {c}"
+        steps = f"x = {c} + {b}，x = {x}。"
+        wrong = [c - b, c]
+    elif form == 2:
+        c = a * x
+        text = f"{a}x = {c}"
+        steps = f"x = {c} ÷ {a}，x = {x}。"
+        wrong = [c - a, c * a]
+    elif form == 3:
+        c = a * x + b
+        text = f"{a}x + {b} = {c}"
+        steps = f"{a}x = {c} - {b} = {c - b}，x = {c - b} ÷ {a} = {x}。"
+        wrong = [(c + b) // a if (c + b) % a == 0 else None, c - b, x + b]
+    elif form == 4:
+        x += b // a + 1
+        c = a * x - b
+        text = f"{a}x - {b} = {c}"
+        steps = f"{a}x = {c} + {b} = {c + b}，x = {c + b} ÷ {a} = {x}。"
+        wrong = [(c - b) // a if c > b and (c - b) % a == 0 else None, c + b, x - 1]
+    else:
+        c = a * (x + b)
+        text = f"{a}(x + {b}) = {c}"
+        steps = f"x + {b} = {c} ÷ {a} = {x + b}，x = {x + b} - {b} = {x}。"
+        wrong = [c // a, x * a, (c - b) // a if (c - b) % a == 0 else None]
+    return Problem(
+        expression=text,
+        answer=str(x),
+        explanation=f"利用等式的性质，把含 x 的项单独留在一边：{text}，{steps}检验：把 x = {x} 代入原方程，左右两边相等。",
+        distractors=pick_distractors(rng, x, wrong + [x + 1, x - 1], minimum=1),
+        fill=(f"解方程 {text}，x = ____", str(x)),
+        word=(f"解方程：{text}", f"x = {x}"),
+        choice_stem=f"方程 {text} 的解是（  ）",
+        option_prefix="x = "
+    )
+
+
+# 模式需匹配去掉年级、范围等前后缀后的整个知识点名称，如 "分数的意义" 不匹配分数运算
+TOPICS = [
+    Topic("equation", "解方程", (r"解?(?:简易|一元一次)?方程",), equation, (5, 7), 5),
+    Topic("fraction", "分数运算",
+          (r"(?:同分母|异分母)?分数(?:的)?(?:加减法?|加法|减法|乘法|(?:四则)?运算|加减混合运算)",),
+          fraction, (3, 6), 5),
+    Topic("decimal", "小数加减法", (r"小数(?:的)?(?:加减法?|加法|减法|加减混合运算)",),
+          decimal_add_subtract, (3, 6), 4),
+    Topic("mixed", "四则混合运算", (r"(?:整数)?(?:四则)?混合运算", r"(?:整数)?四则运算", r"运算顺序"),
+          mixed_operations, (2, 6), 3),
+    Topic("add_sub", "加减法", (_INT_MODIFIERS + r"加减(?:法|混合运算)?",), add_or_subtract, (1, 6), 2),
+    Topic("mul_div", "乘除法", (_INT_MODIFIERS + r"乘除(?:法|混合运算)?",), multiply_or_divide, (2, 6), 3),
+    Topic("division", "除法", (_INT_MODIFIERS + r"除法", r"平均分"), division, (2, 6), 3),
+    Topic("multiplication", "乘法", (_INT_MODIFIERS + r"乘法(?:口诀)?", r"乘法口诀表?"),
+          multiplication, (2, 6), 3),
+    Topic("subtraction", "减法", (_INT_MODIFIERS + r"减法",), subtraction, (1, 6), 2),
+    Topic("addition", "加法", (_INT_MODIFIERS + r"加法",), addition, (1, 6), 2),
+]
+_TOPICS_BY_NAME = {topic.name: topic for topic in TOPICS}
+_TOPIC_PATTERNS = [(topic, [re.compile(pattern) for pattern in topic.patterns]) for topic in TOPICS]
+
+# 未指定知识点时（仅用于AI不可用时的备用题目），各年级的常见计算内容
+GRADE_DEFAULT_TOPICS = {
+    1: ["add_sub"],
+    2: ["add_sub", "mul_div"],
+    3: ["add_sub", "mul_div", "mixed"],
+    4: ["mixed", "decimal", "multiplication"],
+    5: ["decimal", "equation", "fraction"],
+    6: ["fraction", "equation", "mixed"],
+}
+
+
+def match_topic(knowledge_point: str) -> Optional[Topic]:
+    """知识点名称恰好对应一个模板时返回该模板；概念类、无法识别或有歧义时返回 None"""
+    text = re.sub(r"\s+", "", knowledge_point or "")
+    if not text or _EXCLUDED_POINTS.search(text):
+        return None
+    text = _POINT_SUFFIX.sub("", _POINT_PREFIX.sub("", text, count=1), count=1)
+    matched = [topic for topic, patterns in _TOPIC_PATTERNS
+               if any(pattern.fullmatch(text) for pattern in patterns)]
+    return matched[0] if len(matched) == 1 else None
+
+
+def is_math(subject: Optional[str]) -> bool:
+    return bool(subject) and ("数学" in subject or subject.lower() in ("math", "mathematics"))
+
+
+class LocalQuestionGenerator:
+    """本地题目生成器
+
+    小学算术、分数、小数、简易方程等公式化知识点按参数化模板生成题目，
+    答案精确计算，干扰项取自常见错误（忘记进位、运算顺序错误等），微秒级完成且不消耗token。
+    """
+
+    def __init__(self):
+        self.stats = {"requests": 0, "generated": 0, "unsupported": 0, "fallback": 0}
+
+    def plan(self, subject: str, grade: Optional[str],
+             knowledge_points: List[str]) -> Optional[List[Tuple[Topic, str]]]:
+        """每个知识点都能本地生成时返回 [(模板, 知识点)]，否则返回 None"""
+        if not LOCAL_GENERATOR_ENABLED or not is_math(subject) or not knowledge_points:
+            return None
+        grade_number = parse_grade(grade)
+        planned = []
+        for knowledge_point in knowledge_points:
+            topic = match_topic(knowledge_point)
+            if topic is None:
+                return None
+            if grade_number is not None and not topic.grades[0] <= grade_number <= topic.grades[1]:
+                return None
+            planned.append((topic, knowledge_point))
+        return planned
+
+    def supports(self, subject: str, grade: Optional[str], knowledge_points: List[str]) -> bool:
+        return self.plan(subject, grade, knowledge_points) is not None
+
+    def generate(self, subject: str, grade: Optional[str], knowledge_points: List[str],
+                 question_type: str, question_count: int, difficulty_level: int = 1,
+                 seed: Optional[int] = None) -> Optional[List[Dict[str, Any]]]:
+        """按知识点轮流生成题目；有知识点无法本地生成时返回 None，由调用方交给AI模型"""
+        self.stats["requests"] += 1
+        planned = self.plan(subject, grade, knowledge_points)
+        if planned is None:
+            self.stats["unsupported"] += 1
+            return None
+        return self._generate(planned, parse_grade(grade), question_type, question_count,
+                              difficulty_level, seed)
+
+    def generate_fallback(self, subject: str, grade: Optional[str], question_type: str,
+                          question_count: int, difficulty_level: int = 1,
+                          seed: Optional[int] = None) -> Optional[List[Dict[str, Any]]]:
+        """AI不可用时的备用题目：按年级选择常见的计算内容"""
+        if not is_math(subject):
+            return None
+        self.stats["fallback"] += 1
+        grade_number = parse_grade(grade)
+        names = GRADE_DEFAULT_TOPICS.get(min(grade_number or 1, 6), GRADE_DEFAULT_TOPICS[1])
+        planned = [(_TOPICS_BY_NAME[name], f"{grade or ''}{_TOPICS_BY_NAME[name].label}") for name in names]
+        return self._generate(planned, grade_number, question_type, question_count, difficulty_level, seed)
+
+    def _generate(self, planned: List[Tuple[Topic, str]], grade: Optional[int], question_type: str,
+                  question_count: int, difficulty_level: int, seed: Optional[int]) -> List[Dict[str, Any]]:
+        rng = random.Random(seed)
+        difficulty = max(1, min(5, int(difficulty_level or 1)))
+        questions, seen = [], set()
+        attempts = 0
+        while len(questions) < question_count and attempts < question_count * LOCAL_GENERATOR_ATTEMPTS:
+            attempts += 1
+            topic, knowledge_point = planned[len(questions) % len(planned)]
+            topic_grade = min(max(grade or topic.default_grade, topic.grades[0]), topic.grades[1])
+            problem = topic.generator(rng, topic_grade, difficulty, knowledge_point)
+            kind = MIXED_TYPES[len(questions) % len(MIXED_TYPES)] if question_type == "mixed" else question_type
+            question = self._render(rng, problem, kind)
+            if question["content"] in seen:
+                continue
+            seen.add(question["content"])
+            question.update({
+                "id": len(questions) + 1,
+                "knowledge_point": knowledge_point,
+                "difficulty": difficulty,
+                "source": "local"
+            })
+            questions.append(question)
+        self.stats["generated"] += len(questions)
+        return questions
+
+    @staticmethod
+    def _render(rng: random.Random, problem: Problem, question_type: str) -> Dict[str, Any]:
+        if question_type == "choice":
+            options = [problem.answer] + problem.distractors[:3]
+            rng.shuffle(options)
+            return {
+                "type": "choice",
+                "content": problem.choice_stem or f"计算：{problem.expression} = ?",
+                "options": [f"{problem.option_prefix}{option}" for option in options],
+                "answer": CHOICE_LETTERS[options.index(problem.answer)],
+                "explanation": problem.explanation
+            }
+        if question_type == "fill":
+            content, answer = problem.fill or (f"{problem.expression} = ____", problem.answer)
+            return {"type": "fill", "content": content, "answer": answer, "explanation": problem.explanation}
+        if problem.word and question_type == "solve":
+            content, answer = problem.word
+        else:
+            content, answer = f"计算下面各题，写出计算过程：{problem.expression}", problem.answer
+        return {"type": "solve", "content": content, "answer": answer, "explanation": f"解：{problem.explanation}"}
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "enabled": LOCAL_GENERATOR_ENABLED,
+                "topics": {topic.name: topic.label for topic in TOPICS}}
+
+
+# 进程级共享实例
+local_question_generator = LocalQuestionGenerator()
@@ -0,0 +1,129 @@
+import os
+import time
+import tempfile
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional
+from sqlalchemy.orm import Session
+from database.models import AIModelConfig
+from utils.security import decrypt_api_key
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 多个工作进程通过该文件的修改时间互相通知配置变更
+REGISTRY_STAMP_PATH = os.getenv(
+    "MODEL_REGISTRY_STAMP",
+    os.path.join(tempfile.gettempdir(), "dongtaijf_model_registry.stamp")
+)
+
+# 检查变更标记的最小间隔（秒）
+STAMP_CHECK_INTERVAL = 1.0
+
+
+@dataclass(frozen=True)
+class ModelSnapshot:
+    """启用中的模型配置快照，api_key 为已解密的明文"""
+    id: int
+    model_name: str
+    display_name: str
+    api_endpoint: str
+    api_key: str = field(repr=False)
+    model_params: Dict[str, Any] = field(default_factory=dict)
+    is_default: bool = False
+    max_tokens: int = 2000
+    temperature: float = 0.7
+
+    @classmethod
+    def from_config(cls, config: AIModelConfig) -> "ModelSnapshot":
+        return cls(
+            id=config.id,
+            model_name=config.model_name,
+            display_name=config.display_name,
+            api_endpoint=config.api_endpoint,
+            api_key=decrypt_api_key(config.api_key),
+            model_params=dict(config.model_params or {}),
+            is_default=bool(config.is_default),
+            max_tokens=config.max_tokens,
+            temperature=config.temperature
+        )
+
+
+class ModelRegistry:
+    """进程级模型配置注册表
+
+    启用的模型配置及解密后的密钥常驻内存，调用路径不查询数据库也不做解密。
+    管理接口修改配置后调用 invalidate()，其他工作进程通过标记文件感知变更。
+    """
+
+    def __init__(self, stamp_path: str = REGISTRY_STAMP_PATH):
+        self.stamp_path = stamp_path
+        self._models: Optional[List[ModelSnapshot]] = None
+        self._loaded_stamp = 0
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        self.stats = {"loads": 0, "invalidations": 0, "remote_invalidations": 0}
+
+    def _read_stamp(self) -> int:
+        try:
+            return os.stat(self.stamp_path).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def _check_remote(self):
+        now = time.monotonic()
+        if now - self._last_check < STAMP_CHECK_INTERVAL:
+            return
+        self._last_check = now
+        if self._models is not None and self._read_stamp() != self._loaded_stamp:
+            self._models = None
+            self.stats["remote_invalidations"] += 1
+
+    def _snapshots(self, db: Session) -> List[ModelSnapshot]:
+        self._check_remote()
+        models = self._models
+        if models is not None:
+            return models
+
+        with self._lock:
+            if self._models is None:
+                # 先读标记再查库，加载期间发生的变更会在下次检查时生效
+                stamp = self._read_stamp()
+                configs = db.query(AIModelConfig).filter(AIModelConfig.is_active == True).all()
+                self._models = [ModelSnapshot.from_config(config) for config in configs]
+                self._loaded_stamp = stamp
+                self.stats["loads"] += 1
+                logger.info(f"已加载AI模型配置: {[m.model_name for m in self._models]}")
+            return self._models
+
+    def get_default(self, db: Session) -> Optional[ModelSnapshot]:
+        return next((m for m in self._snapshots(db) if m.is_default), None)
+
+    def get_by_name(self, db: Session, model_name: str) -> Optional[ModelSnapshot]:
+        return next((m for m in self._snapshots(db) if m.model_name == model_name), None)
+
+    def get_active(self, db: Session) -> List[ModelSnapshot]:
+        return list(self._snapshots(db))
+
+    def invalidate(self):
+        """丢弃本进程缓存，并通知其他工作进程重新加载"""
+        self._models = None
+        self.stats["invalidations"] += 1
+        try:
+            with open(self.stamp_path, "a"):
+                pass
+            os.utime(self.stamp_path, None)
+        except OSError as e:
+            logger.warning(f"更新模型配置变更标记失败: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "loaded": self._models is not None,
+            "models": [m.model_name for m in self._models or []],
+            "stamp_path": self.stamp_path
+        }
+
+
+# 进程级共享实例
+model_registry = ModelRegistry()
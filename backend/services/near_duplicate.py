@@ -0,0 +1,129 @@
+import os
+import re
+import random
+import hashlib
+from typing import Dict, Any, List, Optional, Tuple, Hashable
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 字符n-gram长度：中文没有空格分词，按连续两个字符切片
+NGRAM_SIZE = 2
+
+# MinHash签名长度 = 分段数 × 每段行数；每段完全相同即成为候选
+LSH_BANDS = 20
+LSH_ROWS = 3
+NUM_PERM = LSH_BANDS * LSH_ROWS
+
+# 估算Jaccard相似度达到该值即视为近似重复
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.5"))
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+# 固定种子，保证各进程、各次启动的签名一致（签名会持久化）
+_rng = random.Random(20240601)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(NUM_PERM)
+]
+
+_IGNORED = re.compile(r"[\s　，。、；：？！“”‘’（）《》【】,.;:?!\"'()\[\]<>_\-]+")
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+
+# (MinHash签名, 题干中的数字序列)
+Signature = Tuple[Tuple[int, ...], Tuple[str, ...]]
+
+
+def normalize_text(text: str) -> str:
+    return _IGNORED.sub("", str(text or "")).lower()
+
+
+def shingles(text: str) -> set:
+    normalized = normalize_text(text)
+    if len(normalized) <= NGRAM_SIZE:
+        return {normalized} if normalized else set()
+    return {normalized[i:i + NGRAM_SIZE] for i in range(len(normalized) - NGRAM_SIZE + 1)}
+
+
+def minhash(text: str) -> Tuple[int, ...]:
+    """计算文本字符n-gram集合的MinHash签名"""
+    hashes = [
+        int.from_bytes(hashlib.blake2b(gram.encode("utf-8"), digest_size=4).digest(), "big")
+        for gram in shingles(text)
+    ]
+    if not hashes:
+        return tuple([_MAX_HASH] * NUM_PERM)
+    return tuple(
+        min((a * h + b) % _MERSENNE_PRIME for h in hashes) & _MAX_HASH
+        for a, b in _PERMUTATIONS
+    )
+
+
+def signature(text: str) -> Signature:
+    """近似去重签名：数字不同的同型题（换数变式）不视为重复"""
+    return minhash(text), tuple(_NUMBER.findall(str(text or "")))
+
+
+def question_signature(question: Dict[str, Any]) -> Signature:
+    return signature(question.get("content", ""))
+
+
+def estimated_similarity(a: Tuple[int, ...], b: Tuple[int, ...]) -> float:
+    return sum(1 for x, y in zip(a, b) if x == y) / NUM_PERM
+
+
+def encode_signature(sig: Signature) -> str:
+    """序列化签名用于持久化"""
+    hashes, numbers = sig
+    return "".join(f"{h:08x}" for h in hashes) + "|" + ",".join(numbers)
+
+
+def decode_signature(value: str) -> Signature:
+    hashes, _, numbers = value.partition("|")
+    return (
+        tuple(int(hashes[i:i + 8], 16) for i in range(0, len(hashes), 8)),
+        tuple(numbers.split(",")) if numbers else ()
+    )
+
+
+class NearDuplicateIndex:
+    """MinHash LSH索引：签名按段分桶，查询只与同桶候选比较"""
+
+    def __init__(self, threshold: float = NEAR_DUPLICATE_THRESHOLD):
+        self.threshold = threshold
+        self._buckets: List[Dict[Tuple[int, ...], List[Hashable]]] = [{} for _ in range(LSH_BANDS)]
+        self._signatures: Dict[Hashable, Signature] = {}
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    @staticmethod
+    def _bands(hashes: Tuple[int, ...]):
+        for band in range(LSH_BANDS):
+            yield band, hashes[band * LSH_ROWS:(band + 1) * LSH_ROWS]
+
+    def add(self, key: Hashable, sig: Signature):
+        if key in self._signatures:
+            return
+        self._signatures[key] = sig
+        for band, value in self._bands(sig[0]):
+            self._buckets[band].setdefault(value, []).append(key)
+
+    def find(self, sig: Signature) -> Optional[Hashable]:
+        """返回一个近似重复项的键，没有时返回 None"""
+        hashes, numbers = sig
+        checked = set()
+        for band, value in self._bands(hashes):
+            for key in self._buckets[band].get(value, ()):
+                if key in checked:
+                    continue
+                checked.add(key)
+                other_hashes, other_numbers = self._signatures[key]
+                if other_numbers == numbers and \
+                        estimated_similarity(hashes, other_hashes) >= self.threshold:
+                    return key
+        return None
+
+    def contains(self, sig: Signature) -> bool:
+        return self.find(sig) is not None
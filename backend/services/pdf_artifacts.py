@@ -0,0 +1,158 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+from typing import Dict, Any, Optional, Tuple
+from services.pdf_service import PDFServiceManager, PDF_TEMPLATE_VERSION, run_pdf_render
+from services.single_flight import SingleFlight
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 产物缓存容量与保留时间
+PDF_CACHE_MAX_BYTES = int(os.getenv("PDF_CACHE_MAX_MB", "500")) * 1024 * 1024
+PDF_CACHE_MAX_AGE_DAYS = int(os.getenv("PDF_CACHE_MAX_AGE_DAYS", "7"))
+
+# 两次淘汰扫描的最小间隔（秒）
+EVICT_INTERVAL = 60
+
+
+class PDFArtifactStore:
+    """按内容哈希存储的PDF产物库：相同内容只渲染一次"""
+
+    def __init__(self, directory: Optional[str] = None,
+                 max_bytes: int = PDF_CACHE_MAX_BYTES,
+                 max_age_days: int = PDF_CACHE_MAX_AGE_DAYS):
+        self._directory = directory
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self._flight = SingleFlight()
+        self._last_evict = 0.0
+        self.stats = {"hits": 0, "renders": 0, "evicted": 0}
+
+    @property
+    def directory(self) -> str:
+        if self._directory is None:
+            self._directory = PDFServiceManager.ensure_pdf_directory()
+        return self._directory
+
+    @staticmethod
+    def content_hash(pdf_type: str, exercise_data: Dict[str, Any], include_answers: bool = False,
+                     analysis_data: Optional[Dict[str, Any]] = None) -> str:
+        """计算 内容 + 模板版本 + 是否含答案 的哈希"""
+        material = {
+            "template_version": PDF_TEMPLATE_VERSION,
+            "pdf_type": pdf_type,
+            "include_answers": include_answers,
+            "exercise": exercise_data,
+            "analysis": analysis_data
+        }
+        raw = json.dumps(material, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def path_for(self, pdf_type: str, digest: str) -> str:
+        return os.path.join(self.directory, f"{pdf_type}_{digest}.pdf")
+
+    @staticmethod
+    def digest_from_path(path: str) -> str:
+        """从产物文件名中取出内容哈希（用作ETag）"""
+        name = os.path.splitext(os.path.basename(path))[0]
+        return name.rsplit("_", 1)[-1]
+
+    def lookup(self, pdf_type: str, digest: str) -> Optional[str]:
+        path = self.path_for(pdf_type, digest)
+        if not os.path.exists(path):
+            return None
+        # 以修改时间记录最近使用，供淘汰时参考
+        os.utime(path, None)
+        return path
+
+    async def get_or_render(self, pdf_type: str, exercise_data: Dict[str, Any],
+                            include_answers: bool = False,
+                            analysis_data: Optional[Dict[str, Any]] = None) -> Tuple[str, str]:
+        """返回 (文件路径, 内容哈希)；未命中时渲染，同一内容并发只渲染一次"""
+        # 预览与不含答案的练习题PDF内容相同，共用产物
+        if pdf_type == 'preview':
+            pdf_type = 'exercise'
+
+        digest = self.content_hash(pdf_type, exercise_data, include_answers, analysis_data)
+        path = self.lookup(pdf_type, digest)
+        if path:
+            self.stats["hits"] += 1
+            return path, digest
+
+        async def render():
+            target = self.path_for(pdf_type, digest)
+            if os.path.exists(target):
+                return target
+            tmp_path = os.path.join(self.directory, f".{uuid.uuid4().hex}.pdf.tmp")
+            try:
+                await run_pdf_render(pdf_type, exercise_data, tmp_path, include_answers, analysis_data)
+                os.replace(tmp_path, target)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            self.stats["renders"] += 1
+            return target
+
+        path = await self._flight.do(f"{pdf_type}:{digest}", render)
+        await self.maybe_evict()
+        return path, digest
+
+    async def maybe_evict(self):
+        if time.time() - self._last_evict < EVICT_INTERVAL:
+            return
+        self._last_evict = time.time()
+        await asyncio.to_thread(self.evict)
+
+    def evict(self, max_age_days: Optional[int] = None, max_bytes: Optional[int] = None) -> int:
+        """按最近使用时间淘汰：先删除过期文件，再按总容量删除最久未用的文件"""
+        max_age_days = self.max_age_days if max_age_days is None else max_age_days
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        now = time.time()
+
+        entries = []
+        for filename in os.listdir(self.directory):
+            if not filename.endswith('.pdf'):
+                continue
+            path = os.path.join(self.directory, filename)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        entries.sort()
+        total_bytes = sum(size for _, size, _ in entries)
+        removed = 0
+        for mtime, size, path in entries:
+            expired = now - mtime > max_age_days * 86400
+            if not expired and total_bytes <= max_bytes:
+                break
+            try:
+                os.remove(path)
+                total_bytes -= size
+                removed += 1
+                logger.info(f"已淘汰PDF产物: {os.path.basename(path)}")
+            except FileNotFoundError:
+                continue
+
+        self.stats["evicted"] += removed
+        return removed
+
+    def get_stats(self) -> Dict[str, Any]:
+        files = [f for f in os.listdir(self.directory) if f.endswith('.pdf')]
+        total_bytes = sum(os.path.getsize(os.path.join(self.directory, f)) for f in files)
+        return {
+            **self.stats,
+            "files": len(files),
+            "total_bytes": total_bytes,
+            "max_bytes": self.max_bytes,
+            "max_age_days": self.max_age_days
+        }
+
+
+# 进程级共享实例
+pdf_artifact_store = PDFArtifactStore()
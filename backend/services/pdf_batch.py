@@ -0,0 +1,118 @@
+import os
+import asyncio
+import hashlib
+import zipfile
+from typing import Dict, Any, List, Tuple, Iterator
+from services.pdf_artifacts import pdf_artifact_store
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 合并为单个PDF需要 pypdf（可选依赖）
+try:
+    from pypdf import PdfWriter
+except ImportError:
+    PdfWriter = None
+
+# 单次批量导出的练习数量上限
+MAX_BATCH_SIZE = int(os.getenv("PDF_BATCH_MAX_SIZE", "100"))
+
+# 合并为单个PDF时的练习数量上限：pypdf 在写出前需要把所有页面保留在内存中，
+# 无法像ZIP那样边读边发送，因此只允许小批量合并，更多练习请使用 zip 格式
+MAX_MERGE_SIZE = int(os.getenv("PDF_MERGE_MAX_SIZE", "20"))
+
+ZIP_CHUNK_SIZE = 64 * 1024
+
+
+async def render_batch(items: List[Dict[str, Any]], include_answers: bool = False) -> List[Tuple[str, str]]:
+    """并行渲染多份练习PDF，返回 [(文件路径, 内容哈希)]，顺序与输入一致
+
+    并行度由PDF渲染进程池大小决定；已渲染过的内容直接命中产物缓存。
+    """
+    return await asyncio.gather(*[
+        pdf_artifact_store.get_or_render('exercise', item, include_answers)
+        for item in items
+    ])
+
+
+class _ZipStreamBuffer:
+    """只写缓冲区：zipfile 写入的数据在每个分块后被取走并发送给客户端"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._offset = 0
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_zip_stream(entries: List[Tuple[str, str]]) -> Iterator[bytes]:
+    """逐块生成ZIP数据流，内存中只保留当前分块
+
+    entries: [(压缩包内文件名, 磁盘文件路径)]。PDF本身已压缩，这里使用
+    存储模式以节省CPU。
+    """
+    buffer = _ZipStreamBuffer()
+    with zipfile.ZipFile(buffer, mode="w", compression=zipfile.ZIP_STORED) as zf:
+        for arcname, path in entries:
+            with open(path, "rb") as src, zf.open(arcname, mode="w") as dest:
+                while True:
+                    chunk = src.read(ZIP_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    dest.write(chunk)
+                    data = buffer.drain()
+                    if data:
+                        yield data
+            data = buffer.drain()
+            if data:
+                yield data
+    # 写出中央目录
+    data = buffer.drain()
+    if data:
+        yield data
+
+
+def merge_pdfs(paths: List[str], output_path: str) -> str:
+    """将多份PDF按顺序合并为一个文件；所有页面在内存中合并，调用方需限制份数"""
+    if PdfWriter is None:
+        raise RuntimeError("合并PDF需要安装 pypdf")
+
+    writer = PdfWriter()
+    for path in paths:
+        writer.append(path)
+
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        writer.write(f)
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+async def get_or_merge(rendered: List[Tuple[str, str]]) -> str:
+    """获取合并后的PDF，相同的练习组合只合并一次"""
+    batch_digest = hashlib.sha256(
+        "|".join(digest for _, digest in rendered).encode("utf-8")
+    ).hexdigest()
+
+    path = pdf_artifact_store.lookup('batch', batch_digest)
+    if path:
+        return path
+
+    output_path = pdf_artifact_store.path_for('batch', batch_digest)
+    await asyncio.to_thread(merge_pdfs, [p for p, _ in rendered], output_path)
+    logger.info(f"批量PDF合并完成: {len(rendered)}份 -> {os.path.basename(output_path)}")
+    return output_path
@@ -0,0 +1,151 @@
+import os
+import time
+import uuid
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional
+from sqlalchemy import func
+from sqlalchemy.orm import Session, sessionmaker
+from database.models import PDFJob, Exercise
+from services.pdf_service import PDFServiceManager, PDF_WORKERS, shutdown_pdf_executor
+from services.pdf_artifacts import pdf_artifact_store
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 每个进程同时排队或渲染的任务上限，超出时拒绝提交
+PDF_JOB_MAX_PENDING = int(os.getenv("PDF_JOB_MAX_PENDING", "50"))
+
+# 渲染中的任务定期写入心跳（秒）；超过 PDF_JOB_STALE_SECONDS 没有心跳的任务
+# 视为所在进程已退出，标记为失败，轮询的客户端可以重新提交
+PDF_JOB_HEARTBEAT_INTERVAL = float(os.getenv("PDF_JOB_HEARTBEAT_INTERVAL", "30"))
+PDF_JOB_STALE_SECONDS = float(os.getenv("PDF_JOB_STALE_SECONDS", "300"))
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+class PDFJobQueueFull(Exception):
+    """进行中的渲染任务已达上限"""
+
+
+class PDFJobManager:
+    """PDF后台渲染任务管理器，任务状态持久化在 pdf_jobs 表"""
+
+    def __init__(self, max_pending: int = PDF_JOB_MAX_PENDING):
+        self.max_pending = max_pending
+        self._tasks = set()
+        self._last_reconcile = 0.0
+        self.stats = {"rejected": 0, "abandoned": 0}
+
+    def enqueue(self, db: Session, user_id: int, exercise: Exercise,
+                job_type: str = 'exercise', include_answers: bool = False) -> PDFJob:
+        """创建渲染任务并在后台执行；进行中的任务已满时抛出 PDFJobQueueFull"""
+        if len(self._tasks) >= self.max_pending:
+            self.stats["rejected"] += 1
+            raise PDFJobQueueFull(f"PDF渲染任务已满（{len(self._tasks)}）")
+        if time.time() - self._last_reconcile > PDF_JOB_STALE_SECONDS / 5:
+            self.reconcile(db)
+
+        job = PDFJob(
+            id=str(uuid.uuid4()),
+            user_id=user_id,
+            exercise_id=exercise.id,
+            job_type=job_type,
+            include_answers=include_answers,
+            status="queued",
+            heartbeat_at=datetime.now()
+        )
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+
+        # 入队时固定渲染数据，后台任务使用独立的数据库会话
+        exercise_data = PDFServiceManager.build_exercise_data(exercise)
+        analysis_data = exercise.answer_content if job_type == 'answer' else None
+        session_factory = sessionmaker(autocommit=False, autoflush=False, bind=db.get_bind())
+
+        task = asyncio.create_task(
+            self._run(session_factory, job.id, exercise.id, job_type,
+                      exercise_data, include_answers, analysis_data)
+        )
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    def reconcile(self, db: Session) -> int:
+        """把长时间没有心跳的排队中、渲染中任务标记为失败（所在进程已退出）"""
+        self._last_reconcile = time.time()
+        now = datetime.now()
+        cutoff = now - timedelta(seconds=PDF_JOB_STALE_SECONDS)
+        count = db.query(PDFJob).filter(
+            PDFJob.status.in_(ACTIVE_STATUSES),
+            func.coalesce(PDFJob.heartbeat_at, PDFJob.started_at, PDFJob.created_at) < cutoff
+        ).update({
+            "status": "failed",
+            "error_message": "渲染任务因服务重启中断，请重新提交",
+            "finished_at": now
+        }, synchronize_session=False)
+        db.commit()
+        if count:
+            self.stats["abandoned"] += count
+            logger.warning(f"标记 {count} 个中断的PDF任务为失败")
+        return count
+
+    async def _run(self, session_factory, job_id: str, exercise_id: int, job_type: str,
+                   exercise_data: Dict[str, Any], include_answers: bool,
+                   analysis_data: Optional[Dict[str, Any]]):
+        self._update(session_factory, job_id, status="running", started_at=datetime.now(),
+                     heartbeat_at=datetime.now())
+        heartbeat = asyncio.create_task(self._heartbeat(session_factory, job_id))
+
+        try:
+            output_path, _ = await pdf_artifact_store.get_or_render(
+                job_type, exercise_data, include_answers, analysis_data
+            )
+            finished = self._update(session_factory, job_id, status="done", file_path=output_path,
+                                    finished_at=datetime.now())
+            if finished:
+                logger.info(f"PDF任务完成: {job_id}")
+        except Exception as e:
+            self._update(session_factory, job_id, status="failed", error_message=str(e),
+                         finished_at=datetime.now())
+            logger.error(f"PDF任务失败: {job_id} {e}")
+        finally:
+            heartbeat.cancel()
+
+    async def _heartbeat(self, session_factory, job_id: str):
+        """渲染期间定期刷新心跳，等待进程池空闲的任务不会被当作中断任务"""
+        while True:
+            await asyncio.sleep(PDF_JOB_HEARTBEAT_INTERVAL)
+            try:
+                if not self._update(session_factory, job_id, heartbeat_at=datetime.now()):
+                    return
+            except Exception as e:
+                logger.error(f"PDF任务心跳写入失败: {job_id} {e}")
+
+    @staticmethod
+    def _update(session_factory, job_id: str, **fields) -> bool:
+        """更新仍在进行中的任务；任务已被标记为中断时不再改动，返回是否生效"""
+        db = session_factory()
+        try:
+            count = db.query(PDFJob).filter(
+                PDFJob.id == job_id, PDFJob.status.in_(ACTIVE_STATUSES)
+            ).update(fields, synchronize_session=False)
+            db.commit()
+            return count > 0
+        finally:
+            db.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "active_tasks": len(self._tasks), "max_pending": self.max_pending,
+                "workers": PDF_WORKERS}
+
+    async def shutdown(self):
+        """等待进行中的任务结束并关闭进程池"""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        shutdown_pdf_executor()
+
+
+# 进程级共享实例
+pdf_job_manager = PDFJobManager()
@@ -1,6 +1,10 @@
 import os
 import json
-from typing import List, Dict, Any
+import asyncio
+import threading
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Optional
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
@@ -13,66 +17,134 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# 模板版本号，修改PDF版式后需递增，使已缓存的PDF产物失效
+PDF_TEMPLATE_VERSION = "2"
+
+# PDF渲染工作进程数
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "2"))
+
+# 中文字体配置；.ttc 字体集合需通过 PDF_FONT_SUBFONT_INDEX 指定子字体
+CHINESE_FONT_NAME = 'SimHei'
+CHINESE_FONT_PATH = os.getenv(
+    'PDF_FONT_PATH',
+    os.path.join(os.path.dirname(__file__), '..', 'fonts', 'SimHei.ttf')
+)
+CHINESE_FONT_SUBFONT_INDEX = int(os.getenv('PDF_FONT_SUBFONT_INDEX', '0'))
+
+_registry_lock = threading.Lock()
+_registered_font: Optional[str] = None
+_style_cache: Dict[str, Dict[str, ParagraphStyle]] = {}
+_shared_service: Optional['PDFService'] = None
+
+
+def register_chinese_font() -> str:
+    """注册中文字体，进程内只解析一次TTF文件
+
+    ReportLab 在输出时只嵌入文档实际用到的字形子集，因此共享同一个
+    TTFont 对象不会增大单个PDF的体积。
+    """
+    global _registered_font
+    if _registered_font is not None:
+        return _registered_font
+
+    with _registry_lock:
+        if _registered_font is None:
+            try:
+                if os.path.exists(CHINESE_FONT_PATH):
+                    pdfmetrics.registerFont(TTFont(
+                        CHINESE_FONT_NAME,
+                        CHINESE_FONT_PATH,
+                        subfontIndex=CHINESE_FONT_SUBFONT_INDEX
+                    ))
+                    _registered_font = CHINESE_FONT_NAME
+                else:
+                    # 如果没有中文字体文件，使用默认字体
+                    _registered_font = 'Helvetica'
+                    logger.warning("未找到中文字体文件，使用默认字体")
+            except Exception as e:
+                _registered_font = 'Helvetica'
+                logger.warning(f"字体设置失败: {e}")
+    return _registered_font
+
+
+def get_pdf_styles(font_name: str) -> Dict[str, ParagraphStyle]:
+    """获取指定字体的段落样式，按字体缓存"""
+    styles = _style_cache.get(font_name)
+    if styles is not None:
+        return styles
+
+    with _registry_lock:
+        styles = _style_cache.get(font_name)
+        if styles is None:
+            sample = getSampleStyleSheet()
+            styles = {
+                'sample': sample,
+                'title': ParagraphStyle(
+                    'CustomTitle',
+                    parent=sample['Heading1'],
+                    fontName=font_name,
+                    fontSize=18,
+                    spaceAfter=30,
+                    alignment=1  # 居中
+                ),
+                'heading': ParagraphStyle(
+                    'CustomHeading',
+                    parent=sample['Heading2'],
+                    fontName=font_name,
+                    fontSize=14,
+                    spaceAfter=12,
+                    spaceBefore=12
+                ),
+                'normal': ParagraphStyle(
+                    'CustomNormal',
+                    parent=sample['Normal'],
+                    fontName=font_name,
+                    fontSize=12,
+                    spaceAfter=6
+                ),
+                'question': ParagraphStyle(
+                    'QuestionStyle',
+                    parent=sample['Normal'],
+                    fontName=font_name,
+                    fontSize=12,
+                    spaceAfter=10,
+                    leftIndent=20
+                )
+            }
+            _style_cache[font_name] = styles
+    return styles
+
+
+def get_pdf_service() -> 'PDFService':
+    """获取进程内共享的PDF服务实例（渲染方法不修改实例状态，可并发使用）"""
+    global _shared_service
+    if _shared_service is None:
+        service = PDFService()
+        with _registry_lock:
+            if _shared_service is None:
+                _shared_service = service
+    return _shared_service
+
+
 class PDFService:
     """PDF生成服务"""
     
     def __init__(self):
         self.setup_fonts()
-        self.styles = getSampleStyleSheet()
         self.setup_custom_styles()
     
     def setup_fonts(self):
-        """设置中文字体"""
-        try:
-            # 尝试注册中文字体
-            font_path = os.path.join(os.path.dirname(__file__), '..', 'fonts', 'SimHei.ttf')
-            if os.path.exists(font_path):
-                pdfmetrics.registerFont(TTFont('SimHei', font_path))
-                self.chinese_font = 'SimHei'
-            else:
-                # 如果没有中文字体文件，使用默认字体
-                self.chinese_font = 'Helvetica'
-                logger.warning("未找到中文字体文件，使用默认字体")
-        except Exception as e:
-            self.chinese_font = 'Helvetica'
-            logger.warning(f"字体设置失败: {e}")
+        """设置中文字体（使用进程级字体注册表）"""
+        self.chinese_font = register_chinese_font()
     
     def setup_custom_styles(self):
-        """设置自定义样式"""
-        self.title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=self.styles['Heading1'],
-            fontName=self.chinese_font,
-            fontSize=18,
-            spaceAfter=30,
-            alignment=1  # 居中
-        )
-        
-        self.heading_style = ParagraphStyle(
-            'CustomHeading',
-            parent=self.styles['Heading2'],
-            fontName=self.chinese_font,
-            fontSize=14,
-            spaceAfter=12,
-            spaceBefore=12
-        )
-        
-        self.normal_style = ParagraphStyle(
-            'CustomNormal',
-            parent=self.styles['Normal'],
-            fontName=self.chinese_font,
-            fontSize=12,
-            spaceAfter=6
-        )
-        
-        self.question_style = ParagraphStyle(
-            'QuestionStyle',
-            parent=self.styles['Normal'],
-            fontName=self.chinese_font,
-            fontSize=12,
-            spaceAfter=10,
-            leftIndent=20
-        )
+        """设置自定义样式（使用按字体缓存的样式对象）"""
+        styles = get_pdf_styles(self.chinese_font)
+        self.styles = styles['sample']
+        self.title_style = styles['title']
+        self.heading_style = styles['heading']
+        self.normal_style = styles['normal']
+        self.question_style = styles['question']
     
     def generate_exercise_pdf(self, exercise_data: Dict[str, Any], 
                             output_path: str, include_answers: bool = False) -> str:
@@ -101,9 +173,12 @@ class PDFService:
             info_data = [
                 ['题目数量:', f"{exercise_data.get('question_count', 0)}题"],
                 ['题目类型:', self._get_type_display(exercise_data.get('question_type', ''))],
-                ['难度等级:', self._get_difficulty_display(exercise_data.get('difficulty_level', 1))],
-                ['生成时间:', datetime.now().strftime('%Y-%m-%d %H:%M')]
+                ['难度等级:', self._get_difficulty_display(exercise_data.get('difficulty_level', 1))]
             ]
+            # 产物按内容哈希缓存，时间取自练习记录（属于哈希内容），不使用渲染时间
+            created_at = exercise_data.get('created_at')
+            if created_at:
+                info_data.append(['生成时间:', datetime.fromisoformat(created_at).strftime('%Y-%m-%d %H:%M')])
             
             info_table = Table(info_data, colWidths=[2*inch, 3*inch])
             info_table.setStyle(TableStyle([
@@ -278,28 +353,65 @@ class PDFServiceManager:
         return pdf_dir
     
     @staticmethod
-    def get_pdf_path(exercise_id: int, pdf_type: str = 'exercise') -> str:
-        """获取PDF文件路径"""
-        pdf_dir = PDFServiceManager.ensure_pdf_directory()
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"{pdf_type}_{exercise_id}_{timestamp}.pdf"
-        return os.path.join(pdf_dir, filename)
+    def build_exercise_data(exercise) -> Dict[str, Any]:
+        """从练习记录提取渲染PDF所需的数据"""
+        return {
+            "subject": exercise.subject,
+            "title": exercise.title,
+            "question_count": exercise.question_count,
+            "question_type": exercise.question_type,
+            "difficulty_level": exercise.difficulty_level,
+            "generated_content": exercise.generated_content,
+            "created_at": exercise.created_at.isoformat() if exercise.created_at else None
+        }
     
     @staticmethod
     def cleanup_old_pdfs(days: int = 7):
-        """清理旧的PDF文件"""
+        """清理旧的PDF文件（按最近使用时间与总容量淘汰产物）"""
+        from services.pdf_artifacts import pdf_artifact_store
+        
         try:
-            pdf_dir = PDFServiceManager.ensure_pdf_directory()
-            current_time = datetime.now()
-            
-            for filename in os.listdir(pdf_dir):
-                if filename.endswith('.pdf'):
-                    file_path = os.path.join(pdf_dir, filename)
-                    file_time = datetime.fromtimestamp(os.path.getctime(file_path))
-                    
-                    if (current_time - file_time).days > days:
-                        os.remove(file_path)
-                        logger.info(f"已删除过期PDF文件: {filename}")
-                        
+            pdf_artifact_store.evict(max_age_days=days)
         except Exception as e:
-            logger.error(f"清理PDF文件失败: {e}")
\ No newline at end of file
+            logger.error(f"清理PDF文件失败: {e}")
+
+
+# 进程池渲染
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def get_pdf_executor() -> ProcessPoolExecutor:
+    """获取PDF渲染进程池（首次使用时创建）"""
+    global _executor
+    if _executor is None:
+        # 工作进程启动时即加载字体与样式，首个任务无需再付出初始化开销
+        _executor = ProcessPoolExecutor(max_workers=PDF_WORKERS, initializer=get_pdf_service)
+    return _executor
+
+
+def shutdown_pdf_executor():
+    """关闭PDF渲染进程池"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
+
+
+def render_pdf(pdf_type: str, exercise_data: Dict[str, Any], output_path: str,
+               include_answers: bool = False, analysis_data: Optional[Dict[str, Any]] = None) -> str:
+    """渲染PDF（在工作进程中执行）"""
+    pdf_service = get_pdf_service()
+    if pdf_type == 'answer':
+        return pdf_service.generate_answer_pdf(exercise_data, analysis_data or {}, output_path)
+    return pdf_service.generate_exercise_pdf(exercise_data, output_path, include_answers)
+
+
+async def run_pdf_render(pdf_type: str, exercise_data: Dict[str, Any], output_path: str,
+                         include_answers: bool = False,
+                         analysis_data: Optional[Dict[str, Any]] = None) -> str:
+    """在进程池中渲染PDF，不阻塞事件循环"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_pdf_executor(),
+        partial(render_pdf, pdf_type, exercise_data, output_path, include_answers, analysis_data)
+    )
@@ -0,0 +1,217 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 拍照批阅结果缓存，可通过环境变量关闭
+PHOTO_CACHE_ENABLED = os.getenv("PHOTO_CACHE_ENABLED", "true").lower() == "true"
+
+# 感知哈希（64位）汉明距离阈值：不超过该值视为同一张照片
+PHOTO_CACHE_HAMMING = int(os.getenv("PHOTO_CACHE_HAMMING", "6"))
+
+# 不超过该值视为同一份印刷练习卷，复用已识别的题目，只重新批改答案。
+# 感知哈希分辨不出手写答案的差异，因此作业照片只有原图完全相同时才直接返回缓存结果
+PHOTO_TEMPLATE_HAMMING = int(os.getenv("PHOTO_TEMPLATE_HAMMING", "8"))
+
+# 缓存容量与有效期
+PHOTO_CACHE_MAX_ENTRIES = int(os.getenv("PHOTO_CACHE_MAX_ENTRIES", "2000"))
+PHOTO_CACHE_TTL = float(os.getenv("PHOTO_CACHE_TTL_HOURS", "168")) * 3600
+
+HASH_BITS = 64
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def cache_namespace(correction_type: str, config: Dict[str, Any]) -> str:
+    """批阅结果取决于批阅类型与配置，不同配置的结果互不复用"""
+    key = json.dumps([
+        correction_type,
+        config.get("subject"),
+        config.get("grade"),
+        bool(config.get("needExplanation", True)),
+        bool(config.get("needSimilarQuestions", False))
+    ], ensure_ascii=False)
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+class _Entry:
+    __slots__ = ("sha256", "phash", "result", "created_at", "hits")
+
+    def __init__(self, sha256: Optional[str], phash: Optional[int], result: Dict[str, Any]):
+        self.sha256 = sha256
+        self.phash = phash
+        self.result = result
+        self.created_at = time.time()
+        self.hits = 0
+
+
+class PhotoHashIndex:
+    """感知哈希的多段索引
+
+    64位哈希均分为 threshold+1 段：距离不超过 threshold 的两个哈希至少有一段完全相同，
+    查询只需比较与某一段相同的候选。
+    """
+
+    def __init__(self, threshold: int):
+        self.threshold = threshold
+        self.segments = threshold + 1
+        bounds = [round(i * HASH_BITS / self.segments) for i in range(self.segments + 1)]
+        self._ranges = list(zip(bounds[:-1], bounds[1:]))
+        self._buckets: List[Dict[int, set]] = [{} for _ in range(self.segments)]
+
+    def _segments(self, value: int):
+        for i, (start, end) in enumerate(self._ranges):
+            yield i, (value >> start) & ((1 << (end - start)) - 1)
+
+    def add(self, key: int, value: int):
+        for i, segment in self._segments(value):
+            self._buckets[i].setdefault(segment, set()).add(key)
+
+    def remove(self, key: int, value: int):
+        for i, segment in self._segments(value):
+            bucket = self._buckets[i].get(segment)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[i][segment]
+
+    def candidates(self, value: int) -> set:
+        found = set()
+        for i, segment in self._segments(value):
+            found |= self._buckets[i].get(segment, set())
+        return found
+
+
+class PhotoResultCache:
+    """拍照批阅结果缓存
+
+    先按原图 SHA-256 精确匹配，再按感知哈希查找近似照片（重新压缩、轻微重拍），
+    作业照片则按感知哈希找到同一份练习卷。按最近使用淘汰，并有过期时间。
+    """
+
+    def __init__(self, threshold: int = PHOTO_CACHE_HAMMING,
+                 template_threshold: int = PHOTO_TEMPLATE_HAMMING,
+                 max_entries: int = PHOTO_CACHE_MAX_ENTRIES, ttl: float = PHOTO_CACHE_TTL):
+        self.threshold = threshold
+        self.template_threshold = max(threshold, template_threshold)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[int, Tuple[str, _Entry]]" = OrderedDict()
+        self._by_sha: Dict[Tuple[str, str], int] = {}
+        self._indexes: Dict[str, PhotoHashIndex] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.stats = {"lookups": 0, "exact_hits": 0, "near_hits": 0, "template_hits": 0,
+                      "misses": 0, "stored": 0, "evicted": 0}
+
+    def _index(self, namespace: str) -> PhotoHashIndex:
+        index = self._indexes.get(namespace)
+        if index is None:
+            index = self._indexes[namespace] = PhotoHashIndex(self.template_threshold)
+        return index
+
+    def _drop(self, entry_id: int):
+        namespace, entry = self._entries.pop(entry_id)
+        if entry.sha256:
+            self._by_sha.pop((namespace, entry.sha256), None)
+        if entry.phash is not None:
+            self._index(namespace).remove(entry_id, entry.phash)
+
+    def _nearest(self, namespace: str, phash: int, threshold: int) -> Optional[Tuple[int, int]]:
+        now = time.time()
+        best = None
+        for entry_id in self._index(namespace).candidates(phash):
+            _, entry = self._entries[entry_id]
+            if now - entry.created_at > self.ttl:
+                continue
+            distance = hamming_distance(phash, entry.phash)
+            if distance <= threshold and (best is None or distance < best[1]):
+                best = (entry_id, distance)
+        return best
+
+    def _hit(self, entry_id: int, distance: int) -> Tuple[Dict[str, Any], int]:
+        self._entries.move_to_end(entry_id)
+        entry = self._entries[entry_id][1]
+        entry.hits += 1
+        return entry.result, distance
+
+    def lookup(self, namespace: str, sha256: Optional[str], phash: Optional[str],
+               allow_near: bool = True) -> Optional[Tuple[Dict[str, Any], int]]:
+        """查找同一张照片的批阅结果，返回 (结果, 汉明距离)
+
+        allow_near 为 False 时只做原图精确匹配。
+        """
+        if not PHOTO_CACHE_ENABLED:
+            return None
+        with self._lock:
+            self.stats["lookups"] += 1
+            entry_id = self._by_sha.get((namespace, sha256)) if sha256 else None
+            if entry_id is not None:
+                _, entry = self._entries[entry_id]
+                if time.time() - entry.created_at <= self.ttl:
+                    self.stats["exact_hits"] += 1
+                    return self._hit(entry_id, 0)
+                self._drop(entry_id)
+
+            if phash and allow_near:
+                best = self._nearest(namespace, int(phash, 16), self.threshold)
+                if best is not None:
+                    self.stats["near_hits"] += 1
+                    return self._hit(*best)
+            self.stats["misses"] += 1
+            return None
+
+    def find_template(self, namespace: str, phash: Optional[str]) -> Optional[Tuple[Dict[str, Any], int]]:
+        """查找版面相近的已批阅照片（同一份练习卷），用于只重新批改学生答案"""
+        if not PHOTO_CACHE_ENABLED or not phash:
+            return None
+        with self._lock:
+            best = self._nearest(namespace, int(phash, 16), self.template_threshold)
+            if best is None:
+                return None
+            self.stats["template_hits"] += 1
+            return self._hit(*best)
+
+    def put(self, namespace: str, sha256: Optional[str], phash: Optional[str], result: Dict[str, Any]):
+        if not PHOTO_CACHE_ENABLED or (not sha256 and not phash):
+            return
+        with self._lock:
+            if sha256 and (namespace, sha256) in self._by_sha:
+                self._drop(self._by_sha[(namespace, sha256)])
+            entry_id = self._next_id
+            self._next_id += 1
+            entry = _Entry(sha256, int(phash, 16) if phash else None, result)
+            self._entries[entry_id] = (namespace, entry)
+            if sha256:
+                self._by_sha[(namespace, sha256)] = entry_id
+            if entry.phash is not None:
+                self._index(namespace).add(entry_id, entry.phash)
+            self.stats["stored"] += 1
+
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.stats["evicted"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats["lookups"]
+        hits = self.stats["exact_hits"] + self.stats["near_hits"]
+        return {
+            **self.stats,
+            "enabled": PHOTO_CACHE_ENABLED,
+            "entries": len(self._entries),
+            "hit_rate": round(hits / lookups * 100, 1) if lookups else 0,
+            "hamming_threshold": self.threshold,
+            "template_threshold": self.template_threshold
+        }
+
+
+# 进程级共享实例
+photo_result_cache = PhotoResultCache()
@@ -0,0 +1,415 @@
+import os
+import json
+import time
+import uuid
+import random
+import sqlite3
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Dict, Any, List, Optional, Callable, Awaitable
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 任务状态存储文件，多个服务进程可共享同一文件
+PHOTO_JOB_DB_PATH = os.getenv("PHOTO_JOB_DB_PATH", "photo_jobs.db")
+
+# 每个进程的批阅工作协程数，以及等待中的任务上限
+PHOTO_JOB_WORKERS = int(os.getenv("PHOTO_JOB_WORKERS", "4"))
+PHOTO_JOB_MAX_QUEUE = int(os.getenv("PHOTO_JOB_MAX_QUEUE", "200"))
+
+# 被限流时的最大尝试次数；已结束任务的保留时长（小时）
+PHOTO_JOB_MAX_ATTEMPTS = int(os.getenv("PHOTO_JOB_MAX_ATTEMPTS", "3"))
+PHOTO_JOB_RETENTION = float(os.getenv("PHOTO_JOB_RETENTION_HOURS", "24")) * 3600
+
+# 执行中的任务定期写入心跳（秒）；超过 PHOTO_JOB_STALE_SECONDS 没有心跳的任务
+# 视为所在进程已退出，重新排队。后者应为心跳间隔的数倍
+PHOTO_JOB_HEARTBEAT_INTERVAL = float(os.getenv("PHOTO_JOB_HEARTBEAT_INTERVAL", "30"))
+PHOTO_JOB_STALE_SECONDS = float(os.getenv("PHOTO_JOB_STALE_SECONDS", "300"))
+
+# 空闲工作协程检查新任务的间隔（秒）；本进程提交的任务会立即唤醒
+PHOTO_JOB_POLL_INTERVAL = 1.0
+
+FINAL_STATUSES = ("done", "failed")
+
+_JSON_COLUMNS = ("config", "preprocess_info", "partial", "result")
+
+
+class PhotoJobError(Exception):
+    """批阅任务失败；带 retry_after 时稍后重新排队"""
+
+    def __init__(self, message: str, status_code: int = 500, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class PhotoJobQueueFull(Exception):
+    """等待中的任务已达上限"""
+
+
+class PhotoJobStore:
+    """基于SQLite文件的批阅任务存储
+
+    图片在提交时预处理后写入，任务结束即清除；进程重启后未完成的任务继续执行。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS photo_jobs ("
+            "id TEXT PRIMARY KEY, status TEXT NOT NULL, correction_type TEXT NOT NULL, "
+            "config TEXT NOT NULL, sha256 TEXT, image TEXT, preprocess_info TEXT, "
+            "partial TEXT NOT NULL DEFAULT '[]', result TEXT, error TEXT, status_code INTEGER, "
+            "attempts INTEGER NOT NULL DEFAULT 0, not_before REAL NOT NULL, "
+            "created_at REAL NOT NULL, started_at REAL, heartbeat_at REAL, finished_at REAL)"
+        )
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(photo_jobs)")}
+        if "heartbeat_at" not in columns:
+            # 旧版本创建的任务库
+            self._conn.execute("ALTER TABLE photo_jobs ADD COLUMN heartbeat_at REAL")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_photo_jobs_claim ON photo_jobs (status, not_before)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def _decode(row: Optional[sqlite3.Row]) -> Optional[Dict[str, Any]]:
+        if row is None:
+            return None
+        job = dict(row)
+        for column in _JSON_COLUMNS:
+            if job.get(column) is not None:
+                job[column] = json.loads(job[column])
+        return job
+
+    def insert(self, job_id: str, correction_type: str, config: Dict[str, Any], image: str,
+               sha256: Optional[str], preprocess_info: Dict[str, Any], max_queue: int):
+        now = time.time()
+        with self._lock:
+            queued = self._conn.execute(
+                "SELECT COUNT(*) FROM photo_jobs WHERE status IN ('queued', 'running')"
+            ).fetchone()[0]
+            if queued >= max_queue:
+                raise PhotoJobQueueFull(f"批阅任务排队已满（{queued}）")
+            self._conn.execute(
+                "INSERT INTO photo_jobs (id, status, correction_type, config, sha256, image, "
+                "preprocess_info, not_before, created_at) VALUES (?, 'queued', ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, correction_type, json.dumps(config, ensure_ascii=False), sha256, image,
+                 json.dumps(preprocess_info, ensure_ascii=False), now, now)
+            )
+            self._conn.commit()
+
+    def get(self, job_id: str, with_image: bool = False) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM photo_jobs WHERE id = ?", (job_id,)).fetchone()
+        job = self._decode(row)
+        if job is not None and not with_image:
+            job.pop("image", None)
+        return job
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """取出最早一个可执行的任务并标记为运行中；多进程同时领取时只有一个成功
+
+        返回任务中的 attempts 即本次领取的凭据，后续写入都需带上，
+        任务被重新排队后旧的执行者无法再改动它。
+        """
+        now = time.time()
+        with self._lock:
+            while True:
+                row = self._conn.execute(
+                    "SELECT id FROM photo_jobs WHERE status = 'queued' AND not_before <= ? "
+                    "ORDER BY created_at LIMIT 1", (now,)
+                ).fetchone()
+                if row is None:
+                    return None
+                cursor = self._conn.execute(
+                    "UPDATE photo_jobs SET status = 'running', started_at = ?, heartbeat_at = ?, "
+                    "attempts = attempts + 1 WHERE id = ? AND status = 'queued'",
+                    (now, now, row["id"])
+                )
+                self._conn.commit()
+                if cursor.rowcount:
+                    return self._decode(self._conn.execute(
+                        "SELECT * FROM photo_jobs WHERE id = ?", (row["id"],)
+                    ).fetchone())
+
+    # 以下写入仅在任务仍由本次领取（状态与 attempts 均未变）时生效，返回是否生效
+
+    def heartbeat(self, job_id: str, attempts: int) -> bool:
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE photo_jobs SET heartbeat_at = ? "
+                "WHERE id = ? AND status = 'running' AND attempts = ?",
+                (time.time(), job_id, attempts)
+            )
+            self._conn.commit()
+            return cursor.rowcount > 0
+
+    def save_partial(self, job_id: str, attempts: int, corrections: List[Dict[str, Any]]) -> bool:
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE photo_jobs SET partial = ?, heartbeat_at = ? "
+                "WHERE id = ? AND status = 'running' AND attempts = ?",
+                (json.dumps(corrections, ensure_ascii=False), time.time(), job_id, attempts)
+            )
+            self._conn.commit()
+            return cursor.rowcount > 0
+
+    def finish(self, job_id: str, attempts: int, result: Optional[Dict[str, Any]] = None,
+               error: Optional[str] = None, status_code: Optional[int] = None) -> bool:
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE photo_jobs SET status = ?, result = ?, error = ?, status_code = ?, "
+                "image = NULL, finished_at = ? WHERE id = ? AND status = 'running' AND attempts = ?",
+                ("failed" if error else "done",
+                 json.dumps(result, ensure_ascii=False) if result is not None else None,
+                 error, status_code, time.time(), job_id, attempts)
+            )
+            self._conn.commit()
+            return cursor.rowcount > 0
+
+    def requeue(self, job_id: str, attempts: int, delay: float) -> bool:
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE photo_jobs SET status = 'queued', partial = '[]', not_before = ? "
+                "WHERE id = ? AND status = 'running' AND attempts = ?",
+                (time.time() + delay, job_id, attempts)
+            )
+            self._conn.commit()
+            return cursor.rowcount > 0
+
+    def recover(self, stale_seconds: float) -> int:
+        """重新排队长时间没有心跳的运行中任务（所在进程已退出）"""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE photo_jobs SET status = 'queued', partial = '[]', not_before = ? "
+                "WHERE status = 'running' AND COALESCE(heartbeat_at, started_at) < ?",
+                (now, now - stale_seconds)
+            )
+            self._conn.commit()
+            return cursor.rowcount
+
+    def purge(self, retention: float) -> int:
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM photo_jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+                (time.time() - retention,)
+            )
+            self._conn.commit()
+            return cursor.rowcount
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, COUNT(*) FROM photo_jobs GROUP BY status"
+            ).fetchall()
+        return {status: count for status, count in rows}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# 批阅处理函数：接收任务与逐题进度回调，返回最终结果
+PhotoJobHandler = Callable[[Dict[str, Any], Callable[[Dict[str, Any]], None]], Awaitable[Dict[str, Any]]]
+
+
+class PhotoJobManager:
+    """拍照批阅异步任务
+
+    提交后立即返回任务ID，由固定数量的工作协程领取执行，状态与逐题结果持久化在
+    SQLite 中，客户端轮询或订阅进度。工作协程数按吞吐量配置，与单次视觉调用耗时无关。
+    """
+
+    def __init__(self, path: str = PHOTO_JOB_DB_PATH, workers: int = PHOTO_JOB_WORKERS):
+        self.path = path
+        self.workers = workers
+        self._store: Optional[PhotoJobStore] = None
+        # 存储操作在单个线程中按提交顺序执行，逐题进度不会被较早的写入覆盖
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._handler: Optional[PhotoJobHandler] = None
+        self._tasks = set()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._changed: Optional[asyncio.Event] = None
+        self._partials: Dict[str, List[Dict[str, Any]]] = {}
+        # 本进程执行中的任务 -> 领取时的 attempts
+        self._claims: Dict[str, int] = {}
+        self._last_recover = 0.0
+        self.stats = {"submitted": 0, "completed": 0, "failed": 0, "retried": 0,
+                      "recovered": 0, "rejected": 0}
+
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(func, *args, **kwargs))
+
+    async def start(self, handler: PhotoJobHandler):
+        """打开任务存储并启动工作协程；上次未完成的任务会继续执行"""
+        if self._tasks:
+            return
+        self._handler = handler
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="photo-jobs")
+        self._store = PhotoJobStore(self.path)
+        self._wakeup = asyncio.Event()
+        self._changed = asyncio.Event()
+
+        await self._recover()
+        purged = await self._run(self._store.purge, PHOTO_JOB_RETENTION)
+        if purged:
+            logger.info(f"清理过期批阅任务 {purged} 个")
+
+        for index in range(self.workers):
+            task = asyncio.create_task(self._worker(index))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def submit(self, correction_type: str, config: Dict[str, Any], image: str,
+                     sha256: Optional[str], preprocess_info: Dict[str, Any]) -> str:
+        """保存任务并唤醒工作协程，返回任务ID；排队已满时抛出 PhotoJobQueueFull"""
+        job_id = str(uuid.uuid4())
+        try:
+            await self._run(self._store.insert, job_id, correction_type, config, image,
+                            sha256, preprocess_info, PHOTO_JOB_MAX_QUEUE)
+        except PhotoJobQueueFull:
+            self.stats["rejected"] += 1
+            raise
+        self.stats["submitted"] += 1
+        self._wakeup.set()
+        return job_id
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = await self._run(self._store.get, job_id)
+        if job is not None and job["status"] == "running" and job_id in self._partials:
+            # 本进程正在执行的任务直接返回内存中的最新进度
+            job["partial"] = list(self._partials[job_id])
+        return job
+
+    async def wait_for_change(self, timeout: float = PHOTO_JOB_POLL_INTERVAL):
+        """等待本进程内任一任务的状态或进度变化；其他进程执行的任务靠超时轮询"""
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _reporter(self, job_id: str, attempts: int) -> Callable[[Dict[str, Any]], None]:
+        corrections = self._partials[job_id] = []
+
+        def report(correction: Dict[str, Any]):
+            corrections.append(correction)
+            self._executor.submit(self._store.save_partial, job_id, attempts, list(corrections))
+            self._notify()
+        return report
+
+    async def _heartbeat(self, job_id: str, attempts: int):
+        """任务执行期间定期刷新心跳，避免耗时较长的任务被其他进程当作中断任务重复执行"""
+        while True:
+            await asyncio.sleep(PHOTO_JOB_HEARTBEAT_INTERVAL)
+            try:
+                alive = await self._run(self._store.heartbeat, job_id, attempts)
+            except sqlite3.Error as e:
+                logger.error(f"批阅任务心跳写入失败: {job_id} {e}")
+                continue
+            if not alive:
+                logger.warning(f"批阅任务已被重新排队，本次执行结果将被丢弃: {job_id}")
+                return
+
+    async def _recover(self):
+        self._last_recover = time.time()
+        recovered = await self._run(self._store.recover, PHOTO_JOB_STALE_SECONDS)
+        if recovered:
+            self.stats["recovered"] += recovered
+            logger.warning(f"重新排队 {recovered} 个中断的批阅任务")
+
+    async def _worker(self, index: int):
+        while True:
+            try:
+                if index == 0 and time.time() - self._last_recover > PHOTO_JOB_STALE_SECONDS / 5:
+                    await self._recover()
+                job = await self._run(self._store.claim)
+            except sqlite3.Error as e:
+                logger.error(f"领取批阅任务失败: {e}")
+                job = None
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), PHOTO_JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._execute(job)
+
+    async def _execute(self, job: Dict[str, Any]):
+        job_id = job["id"]
+        attempts = job["attempts"]
+        logger.info(f"批阅任务开始: {job_id} 第{attempts}次")
+        self._claims[job_id] = attempts
+        heartbeat = asyncio.create_task(self._heartbeat(job_id, attempts))
+        self._notify()
+        try:
+            result = await self._handler(job, self._reporter(job_id, attempts))
+        except PhotoJobError as e:
+            if e.retry_after is not None and attempts < PHOTO_JOB_MAX_ATTEMPTS:
+                delay = e.retry_after + random.uniform(0, 1)
+                if await self._run(self._store.requeue, job_id, attempts, delay):
+                    self.stats["retried"] += 1
+                    logger.info(f"批阅任务被限流，{delay:.1f}秒后重试: {job_id}")
+            elif await self._run(self._store.finish, job_id, attempts,
+                                 error=str(e), status_code=e.status_code):
+                self.stats["failed"] += 1
+                logger.error(f"批阅任务失败: {job_id} {e}")
+        except Exception as e:
+            if await self._run(self._store.finish, job_id, attempts,
+                               error=f"批阅处理异常: {e}", status_code=500):
+                self.stats["failed"] += 1
+                logger.exception(f"批阅任务异常: {job_id}")
+        else:
+            if await self._run(self._store.finish, job_id, attempts, result=result):
+                self.stats["completed"] += 1
+                logger.info(f"批阅任务完成: {job_id}")
+            else:
+                logger.warning(f"批阅任务已由其他执行者接管，丢弃本次结果: {job_id}")
+        finally:
+            heartbeat.cancel()
+            self._partials.pop(job_id, None)
+            self._claims.pop(job_id, None)
+        self._notify()
+
+    async def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "workers": self.workers,
+            "running_here": len(self._partials),
+            "jobs": await self._run(self._store.counts) if self._store else {},
+            "max_queue": PHOTO_JOB_MAX_QUEUE
+        }
+
+    async def shutdown(self):
+        """停止工作协程，执行中的任务重新排队，由下次启动（或其他进程）继续执行"""
+        interrupted = dict(self._claims)
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._store is not None:
+            for job_id, attempts in interrupted.items():
+                await self._run(self._store.requeue, job_id, attempts, 0)
+            await self._run(self._store.close)
+            self._store = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+# 进程级共享实例
+photo_job_manager = PhotoJobManager()
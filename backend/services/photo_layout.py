@@ -0,0 +1,194 @@
+import io
+import os
+import base64
+import asyncio
+import statistics
+from typing import List, Optional, Tuple
+import logging
+
+from services.image_preprocess import split_data_url, IMAGE_QUALITY
+
+# 版面分析需要 Pillow（可选依赖），未安装时整张照片一次批阅
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = ImageOps = None
+
+logger = logging.getLogger(__name__)
+
+# 多题作业照片按题目区域切分后并行批阅，可通过环境变量关闭
+PHOTO_CROP_ENABLED = os.getenv("PHOTO_CROP_ENABLED", "true").lower() == "true"
+
+# 单张照片最多切分的区域数，以及同时批阅的区域数
+PHOTO_CROP_MAX_REGIONS = int(os.getenv("PHOTO_CROP_MAX_REGIONS", "12"))
+PHOTO_CROP_CONCURRENCY = int(os.getenv("PHOTO_CROP_CONCURRENCY", "4"))
+
+# 版面分析时先缩小到该宽度，只用于计算投影
+LAYOUT_ANALYSIS_WIDTH = 600
+
+# 行墨迹占比低于该值视为空白行
+LAYOUT_INK_RATIO = 0.01
+
+# 题目之间的空白需大于文本行高中位数的倍数。手写答案与题干之间常留有一两行空白，
+# 倍数过小会把答案切到下一个区域；低于行高该倍数的区域（下划线、污点）并入相邻区域
+LAYOUT_GAP_FACTOR = 2.5
+LAYOUT_MIN_REGION_FACTOR = 0.6
+
+# 新题目的首行（题号）从左边距开始：缩进超过该值（占图宽比例）的行不作为区域起点
+LAYOUT_INDENT_TOLERANCE = 0.05
+
+# 裁剪时在区域上下各保留的边距（占全图高度比例）
+LAYOUT_PADDING_RATIO = 0.01
+
+
+def otsu_threshold(histogram: List[int]) -> int:
+    """大津法求灰度二值化阈值"""
+    total = sum(histogram)
+    weighted_total = sum(i * count for i, count in enumerate(histogram))
+    background = weighted_background = 0
+    best_threshold, best_variance = 127, -1.0
+    for threshold, count in enumerate(histogram):
+        background += count
+        if background == 0:
+            continue
+        foreground = total - background
+        if foreground == 0:
+            break
+        weighted_background += threshold * count
+        mean_background = weighted_background / background
+        mean_foreground = (weighted_total - weighted_background) / foreground
+        variance = background * foreground * (mean_background - mean_foreground) ** 2
+        if variance > best_variance:
+            best_threshold, best_variance = threshold, variance
+    return best_threshold
+
+
+def ink_mask(image):
+    """缩小并二值化，墨迹为白（255）、背景为黑（0）"""
+    gray = image.convert("L")
+    if gray.width > LAYOUT_ANALYSIS_WIDTH:
+        height = max(1, round(gray.height * LAYOUT_ANALYSIS_WIDTH / gray.width))
+        gray = gray.resize((LAYOUT_ANALYSIS_WIDTH, height), Image.BILINEAR)
+    threshold = otsu_threshold(gray.histogram())
+    return gray.point(lambda p: 255 if p <= threshold else 0)
+
+
+def row_profile(ink) -> List[float]:
+    """水平投影：每一行深色像素（墨迹）的占比"""
+    # 缩成一列后每个像素即该行的平均墨迹
+    column = ink.resize((1, ink.height), Image.BOX)
+    return [value / 255 for value in column.getdata()]
+
+
+def line_indents(ink, lines: List[Tuple[int, int]]) -> List[float]:
+    """各文本行最左侧墨迹的位置（占图宽比例）"""
+    indents = []
+    for top, bottom in lines:
+        box = ink.crop((0, top, ink.width, bottom)).getbbox()
+        indents.append(box[0] / ink.width if box else 1.0)
+    return indents
+
+
+def text_lines(profile: List[float], ink_ratio: float = LAYOUT_INK_RATIO) -> List[Tuple[int, int]]:
+    """按空白行切出文本行，返回 [(起始行, 结束行)]，结束行不含"""
+    lines, start = [], None
+    for row, value in enumerate(profile):
+        if value > ink_ratio and start is None:
+            start = row
+        elif value <= ink_ratio and start is not None:
+            lines.append((start, row))
+            start = None
+    if start is not None:
+        lines.append((start, len(profile)))
+    return lines
+
+
+def group_regions(lines: List[Tuple[int, int]], max_regions: int = PHOTO_CROP_MAX_REGIONS,
+                  gap_factor: float = LAYOUT_GAP_FACTOR,
+                  min_region_factor: float = LAYOUT_MIN_REGION_FACTOR,
+                  indents: Optional[List[float]] = None,
+                  indent_tolerance: float = LAYOUT_INDENT_TOLERANCE) -> List[Tuple[int, int]]:
+    """把文本行合并为题目区域
+
+    题目之间留有作答空白，通常明显大于题内行距：空白超过行高中位数一定倍数、
+    且下一行从左边距开始（提供 indents 时）处切分，缩进的手写答案留在题目所在区域。
+    过矮的区域并入空白更小的相邻区域，区域过多时合并空白最小的相邻区域。
+    """
+    if len(lines) < 2:
+        return list(lines)
+    line_height = statistics.median(bottom - top for top, bottom in lines)
+    split_gap = line_height * gap_factor
+    margin = min(indents) if indents else 0.0
+
+    regions = [list(lines[0])]
+    for index, line in enumerate(lines[1:], 1):
+        at_margin = indents is None or indents[index] - margin <= indent_tolerance
+        if line[0] - regions[-1][1] > split_gap and at_margin:
+            regions.append(list(line))
+        else:
+            regions[-1][1] = line[1]
+
+    def merge_smallest_gap(candidates: List[int]):
+        index = min(candidates, key=lambda i: regions[i + 1][0] - regions[i][1])
+        regions[index][1] = regions.pop(index + 1)[1]
+
+    min_height = line_height * min_region_factor
+    while len(regions) > 1:
+        short = [i for i, (top, bottom) in enumerate(regions) if bottom - top < min_height]
+        if not short:
+            break
+        i = short[0]
+        # 并入空白更小的一侧
+        neighbours = [n for n in (i - 1, i) if 0 <= n < len(regions) - 1]
+        merge_smallest_gap(neighbours)
+
+    while len(regions) > max_regions:
+        merge_smallest_gap(list(range(len(regions) - 1)))
+    return [tuple(region) for region in regions]
+
+
+def find_question_regions(image, max_regions: int = PHOTO_CROP_MAX_REGIONS) -> List[Tuple[int, int, int, int]]:
+    """检测题目区域，返回按从上到下排列的裁剪框 (left, top, right, bottom)"""
+    ink = ink_mask(image)
+    profile = row_profile(ink)
+    scale = image.height / len(profile)
+    lines = text_lines(profile)
+    regions = group_regions(lines, max_regions, indents=line_indents(ink, lines))
+    padding = image.height * LAYOUT_PADDING_RATIO
+    return [
+        (0, max(0, int(top * scale - padding)), image.width,
+         min(image.height, int(bottom * scale + padding + 1)))
+        for top, bottom in regions
+    ]
+
+
+def crop_question_regions(data: bytes, max_regions: int = PHOTO_CROP_MAX_REGIONS,
+                          quality: int = IMAGE_QUALITY) -> Tuple[List[str], List[List[int]]]:
+    """把已预处理的图片按题目区域裁剪，返回 (各区域的 data URL, 裁剪框)"""
+    image = Image.open(io.BytesIO(data))
+    image = image.convert("L" if image.mode == "L" else "RGB")
+    boxes = find_question_regions(image, max_regions)
+    crops = []
+    for box in boxes:
+        buffer = io.BytesIO()
+        image.crop(box).save(buffer, "JPEG", quality=quality)
+        crops.append(f"data:image/jpeg;base64,{base64.b64encode(buffer.getvalue()).decode()}")
+    return crops, [list(box) for box in boxes]
+
+
+async def split_question_regions(image: str, max_regions: int = PHOTO_CROP_MAX_REGIONS
+                                 ) -> Optional[Tuple[List[str], List[List[int]]]]:
+    """在线程中切分 data URL 图片；不足两个区域、未安装 Pillow 或无法解码时返回 None"""
+    if not PHOTO_CROP_ENABLED or Image is None or not image.startswith("data:"):
+        return None
+    _, encoded = split_data_url(image)
+    try:
+        crops, boxes = await asyncio.to_thread(
+            crop_question_regions, base64.b64decode(encoded), max_regions
+        )
+    except (ValueError, OSError) as e:
+        logger.warning(f"版面分析失败，整张照片批阅: {e}")
+        return None
+    if len(crops) < 2:
+        return None
+    return crops, boxes
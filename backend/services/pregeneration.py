@@ -0,0 +1,474 @@
+import os
+import json
+import math
+import time
+import asyncio
+import hashlib
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, List, Optional, Tuple
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, sessionmaker
+from database.models import ExerciseDemand, PregeneratedSet, AICallRollup, Exercise, User, UserRole
+from services.ai_analytics import utc_naive
+from services.near_duplicate import NearDuplicateIndex, question_signature
+from services.question_utils import parse_questions, merge_question_sets
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 空闲时段预生成热门组卷参数的整套题目，可通过环境变量关闭
+PREGEN_ENABLED = os.getenv("PREGEN_ENABLED", "true").lower() == "true"
+
+# 预生成的组卷参数个数、每个参数保有的套数、每轮最多生成的套数
+PREGEN_TOP_COMBOS = int(os.getenv("PREGEN_TOP_COMBOS", "20"))
+PREGEN_POOL_SIZE = int(os.getenv("PREGEN_POOL_SIZE", "3"))
+PREGEN_MAX_SETS_PER_CYCLE = int(os.getenv("PREGEN_MAX_SETS_PER_CYCLE", "10"))
+
+# 检查与补充的间隔（秒）
+PREGEN_INTERVAL = float(os.getenv("PREGEN_INTERVAL", "600"))
+
+# 热度半衰期（小时），以及进入预生成的最低热度
+PREGEN_HALF_LIFE_HOURS = float(os.getenv("PREGEN_HALF_LIFE_HOURS", "72"))
+PREGEN_MIN_SCORE = float(os.getenv("PREGEN_MIN_SCORE", "3"))
+
+# 热度表为空时（首次部署）从最近若干天的练习记录估算初始热度，以及最多读取的练习数
+PREGEN_SEED_DAYS = int(os.getenv("PREGEN_SEED_DAYS", "14"))
+PREGEN_SEED_MAX_EXERCISES = int(os.getenv("PREGEN_SEED_MAX_EXERCISES", "5000"))
+
+# 未领取的题目保留天数，过期后删除以免内容陈旧
+PREGEN_MAX_AGE_DAYS = int(os.getenv("PREGEN_MAX_AGE_DAYS", "7"))
+
+# 空闲时段：显式配置（本地时间，如 "0-6" 或 "1,2,3,23"）优先；
+# 否则按最近7天每小时调用量判断，低于峰值小时该比例即为空闲
+PREGEN_OFFPEAK_HOURS = os.getenv("PREGEN_OFFPEAK_HOURS", "")
+PREGEN_OFFPEAK_RATIO = float(os.getenv("PREGEN_OFFPEAK_RATIO", "0.3"))
+DEFAULT_OFFPEAK_HOURS = frozenset(range(0, 7))
+
+# 调用量统计的回溯天数，以及据此判断所需的最少调用次数
+LOAD_PROFILE_DAYS = 7
+LOAD_PROFILE_MIN_CALLS = 200
+
+# 预生成调用使用独立的功能类型：按后台优先级排队，且不计入负载统计
+PREGEN_FUNCTION_TYPE = "pregenerate_exercise"
+
+# 领取时最多检查的候选套数
+CLAIM_CANDIDATES = 5
+
+
+def combo_key(subject: str, grade: Optional[str], knowledge_points: List[str], question_type: str,
+              question_count: int, difficulty_level: int) -> str:
+    """组卷参数的规范化哈希，知识点顺序不影响结果"""
+    payload = json.dumps(
+        [subject, grade or "", sorted(knowledge_points), question_type, question_count, difficulty_level],
+        ensure_ascii=False, separators=(",", ":")
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def parse_hours(value: str) -> frozenset:
+    """解析小时配置，如 "0-6,23" """
+    hours = set()
+    for part in value.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        start, _, end = part.partition("-")
+        start = int(start)
+        end = int(end) if end else start
+        if start <= end:
+            hours.update(range(start, end + 1))
+        else:
+            # 跨越午夜，如 "22-5"
+            hours.update(range(start, 24))
+            hours.update(range(0, end + 1))
+    return frozenset(h for h in hours if 0 <= h < 24)
+
+
+def decayed(score: float, since: Optional[datetime], now: datetime) -> float:
+    if not since or not score:
+        return score or 0.0
+    hours = max(0.0, (now - since).total_seconds() / 3600)
+    return score * math.pow(0.5, hours / PREGEN_HALF_LIFE_HOURS)
+
+
+class PregenerationPool:
+    """热门组卷参数的预生成题库
+
+    请求时记录组卷参数的热度；后台任务在调用量低的时段为最热门的参数
+    预先生成整套题目，请求到来时直接领取，无需等待模型生成。
+    """
+
+    def __init__(self):
+        self._session_factory = None
+        self._task: Optional[asyncio.Task] = None
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._offpeak_hours: Optional[frozenset] = None
+        self._offpeak_checked = 0.0
+        self._seeded = False
+        self.stats = {"seeded": 0, "requests": 0, "claimed": 0, "history_skipped": 0, "generated": 0,
+                      "failed": 0, "expired": 0, "cycles": 0, "last_cycle_at": None}
+
+    def configure(self, bind):
+        """绑定数据库引擎并启动后台任务（首次请求时由请求会话提供）"""
+        if not PREGEN_ENABLED:
+            return
+        if self._session_factory is None:
+            self._session_factory = sessionmaker(autocommit=False, autoflush=False, bind=bind)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def record_demand(self, subject: str, grade: Optional[str], knowledge_points: List[str],
+                      question_type: str, question_count: int, difficulty_level: int) -> str:
+        """记录一次组卷请求，热度在后台任务中批量写入"""
+        key = combo_key(subject, grade, knowledge_points, question_type, question_count, difficulty_level)
+        self.stats["requests"] += 1
+        entry = self._pending.get(key)
+        if entry is None:
+            entry = self._pending[key] = {
+                "subject": subject,
+                "grade": grade,
+                "knowledge_points": sorted(knowledge_points),
+                "question_type": question_type,
+                "question_count": question_count,
+                "difficulty_level": difficulty_level,
+                "count": 0
+            }
+        entry["count"] += 1
+        return key
+
+    def claim(self, db: Session, key: str, user_id: int,
+              history: Optional[NearDuplicateIndex] = None) -> Optional[List[Dict[str, Any]]]:
+        """领取一套预生成题目，跳过含有学生做过题目的套题"""
+        if not PREGEN_ENABLED:
+            return None
+        candidates = db.query(PregeneratedSet.id, PregeneratedSet.questions).filter(
+            PregeneratedSet.combo_key == key,
+            PregeneratedSet.status == "ready"
+        ).order_by(PregeneratedSet.id).limit(CLAIM_CANDIDATES).all()
+
+        for row in candidates:
+            questions = row.questions or []
+            if history is not None and len(history) and \
+                    any(history.contains(question_signature(q)) for q in questions):
+                self.stats["history_skipped"] += 1
+                continue
+            # 条件更新保证同一套题只被一个请求（或工作进程）领取
+            claimed = db.query(PregeneratedSet).filter(
+                PregeneratedSet.id == row.id,
+                PregeneratedSet.status == "ready"
+            ).update({
+                "status": "claimed",
+                "claimed_by": user_id,
+                "claimed_at": datetime.now(timezone.utc)
+            }, synchronize_session=False)
+            db.commit()
+            if claimed:
+                self.stats["claimed"] += 1
+                return questions
+        return None
+
+    def flush_demand(self, db: Session):
+        """把内存中累计的请求次数合并到热度表"""
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        now = datetime.utcnow()
+        rows = {
+            row.combo_key: row for row in db.query(ExerciseDemand).filter(
+                ExerciseDemand.combo_key.in_(list(pending))
+            )
+        }
+        for key, entry in pending.items():
+            row = rows.get(key)
+            if row is None:
+                row = ExerciseDemand(
+                    combo_key=key,
+                    subject=entry["subject"],
+                    grade=entry["grade"],
+                    knowledge_points=entry["knowledge_points"],
+                    question_type=entry["question_type"],
+                    question_count=entry["question_count"],
+                    difficulty_level=entry["difficulty_level"],
+                    request_count=0,
+                    score=0.0
+                )
+                db.add(row)
+            row.score = decayed(row.score, row.last_requested_at, now) + entry["count"]
+            row.request_count = (row.request_count or 0) + entry["count"]
+            row.last_requested_at = now
+        try:
+            db.commit()
+        except IntegrityError:
+            # 其他工作进程刚写入了相同的组卷参数，下一轮再合并
+            db.rollback()
+            for key, entry in pending.items():
+                merged = self._pending.setdefault(key, {**entry, "count": 0})
+                merged["count"] += entry["count"]
+
+    def seed_demand(self, db: Session) -> int:
+        """热度表为空时，按最近的练习记录估算各组卷参数的初始热度
+
+        练习记录不保存年级与请求的知识点，知识点取各题标注的知识点，年级记为空；
+        每条记录按生成时间衰减后计入热度，避免上线后要等实时请求积累才开始预生成。
+        返回写入的组卷参数个数。
+        """
+        if self._seeded:
+            return 0
+        self._seeded = True
+        if db.query(ExerciseDemand.id).first() is not None:
+            return 0
+
+        now = datetime.utcnow()
+        rows = db.query(
+            Exercise.subject, Exercise.question_type, Exercise.question_count,
+            Exercise.difficulty_level, Exercise.generated_content, Exercise.created_at
+        ).filter(
+            Exercise.created_at >= now - timedelta(days=PREGEN_SEED_DAYS)
+        ).order_by(Exercise.id.desc()).limit(PREGEN_SEED_MAX_EXERCISES).all()
+
+        demands: Dict[str, ExerciseDemand] = {}
+        for row in rows:
+            content = row.generated_content or {}
+            questions = content.get("questions", []) if isinstance(content, dict) else []
+            points = sorted({
+                str(q.get("knowledge_point")).strip() for q in questions
+                if isinstance(q, dict) and str(q.get("knowledge_point") or "").strip()
+            })
+            if not points:
+                continue
+            difficulty_level = row.difficulty_level or 1
+            key = combo_key(row.subject, None, points, row.question_type,
+                            row.question_count, difficulty_level)
+            demand = demands.get(key)
+            if demand is None:
+                demand = demands[key] = ExerciseDemand(
+                    combo_key=key,
+                    subject=row.subject,
+                    grade=None,
+                    knowledge_points=points,
+                    question_type=row.question_type,
+                    question_count=row.question_count,
+                    difficulty_level=difficulty_level,
+                    request_count=0,
+                    score=0.0,
+                    last_requested_at=now
+                )
+            created_at = row.created_at
+            if created_at is not None and created_at.tzinfo is not None:
+                created_at = created_at.astimezone(timezone.utc).replace(tzinfo=None)
+            demand.score += decayed(1.0, created_at, now)
+            demand.request_count += 1
+
+        if not demands:
+            return 0
+        db.add_all(demands.values())
+        try:
+            db.commit()
+        except IntegrityError:
+            # 其他工作进程已写入初始热度
+            db.rollback()
+            return 0
+        self.stats["seeded"] = len(demands)
+        logger.info(f"已根据 {len(rows)} 条练习记录估算 {len(demands)} 组组卷参数的初始热度")
+        return len(demands)
+
+    def offpeak_hours(self, db: Session) -> frozenset:
+        """按最近几天每个本地小时的平均调用量判断空闲时段（每小时重新计算一次）"""
+        if PREGEN_OFFPEAK_HOURS:
+            return parse_hours(PREGEN_OFFPEAK_HOURS)
+        if self._offpeak_hours is not None and time.time() - self._offpeak_checked < 3600:
+            return self._offpeak_hours
+
+        since = utc_naive() - timedelta(days=LOAD_PROFILE_DAYS)
+        rows = db.query(AICallRollup.bucket_start, AICallRollup.call_count).filter(
+            AICallRollup.granularity == "hour",
+            AICallRollup.bucket_start >= since,
+            AICallRollup.function_type != PREGEN_FUNCTION_TYPE
+        ).all()
+        load = [0] * 24
+        for bucket_start, call_count in rows:
+            local_hour = bucket_start.replace(tzinfo=timezone.utc).astimezone().hour
+            load[local_hour] += call_count or 0
+
+        if sum(load) < LOAD_PROFILE_MIN_CALLS:
+            hours = DEFAULT_OFFPEAK_HOURS
+        else:
+            peak = max(load)
+            hours = frozenset(h for h, calls in enumerate(load) if calls <= peak * PREGEN_OFFPEAK_RATIO)
+        self._offpeak_hours = hours
+        self._offpeak_checked = time.time()
+        return hours
+
+    def is_offpeak(self, db: Session, now: Optional[datetime] = None) -> bool:
+        now = now or datetime.now()
+        return now.hour in self.offpeak_hours(db)
+
+    def _plan(self, db: Session) -> List[Tuple[ExerciseDemand, int]]:
+        """按热度选出需要补充的组卷参数及各自缺少的套数"""
+        now = datetime.utcnow()
+        demands = db.query(ExerciseDemand).order_by(ExerciseDemand.score.desc()).limit(
+            PREGEN_TOP_COMBOS * 3
+        ).all()
+        ranked = sorted(
+            ((decayed(d.score, d.last_requested_at, now), d) for d in demands),
+            key=lambda item: item[0], reverse=True
+        )
+        hot = [d for score, d in ranked if score >= PREGEN_MIN_SCORE][:PREGEN_TOP_COMBOS]
+        if not hot:
+            return []
+
+        ready = dict(db.query(PregeneratedSet.combo_key, func.count(PregeneratedSet.id)).filter(
+            PregeneratedSet.combo_key.in_([d.combo_key for d in hot]),
+            PregeneratedSet.status == "ready"
+        ).group_by(PregeneratedSet.combo_key).all())
+
+        plan = []
+        budget = PREGEN_MAX_SETS_PER_CYCLE
+        for demand in hot:
+            missing = min(PREGEN_POOL_SIZE - ready.get(demand.combo_key, 0), budget)
+            if missing > 0:
+                plan.append((demand, missing))
+                budget -= missing
+            if budget <= 0:
+                break
+        return plan
+
+    def expire(self, db: Session) -> int:
+        """删除过期未领取的套题，以及已领取超过一天的记录"""
+        now = datetime.now(timezone.utc)
+        removed = db.query(PregeneratedSet).filter(
+            PregeneratedSet.status == "ready",
+            PregeneratedSet.created_at < now - timedelta(days=PREGEN_MAX_AGE_DAYS)
+        ).delete(synchronize_session=False)
+        removed += db.query(PregeneratedSet).filter(
+            PregeneratedSet.status == "claimed",
+            PregeneratedSet.claimed_at < now - timedelta(days=1)
+        ).delete(synchronize_session=False)
+        db.commit()
+        self.stats["expired"] += removed
+        return removed
+
+    async def replenish(self, db: Session) -> int:
+        """为热门组卷参数补足预生成套题，返回新生成的套数"""
+        from services.ai_service import AIService
+        from services.question_bank import question_bank, QUESTION_BANK_ENABLED
+
+        # 调用日志需要关联用户，预生成记在超级管理员名下
+        owner = db.query(User.id).filter(User.role == UserRole.super_admin).order_by(User.id).first()
+        if owner is None:
+            logger.info("没有超级管理员账号，跳过题目预生成")
+            return 0
+
+        service = AIService(db)
+        generated = 0
+        for demand, missing in self._plan(db):
+            for _ in range(missing):
+                result = await service._generate_questions_with_model(
+                    owner.id, demand.subject, demand.knowledge_points, demand.question_type,
+                    demand.question_count, demand.difficulty_level,
+                    function_type=PREGEN_FUNCTION_TYPE
+                )
+                questions = parse_questions(result['content']) if result.get('success') else None
+                questions = merge_question_sets([questions or []], limit=demand.question_count)
+                if len(questions) < demand.question_count:
+                    # 题量不足的套题不入池，该参数本轮不再重试
+                    self.stats["failed"] += 1
+                    logger.warning(f"预生成题目失败({demand.subject}/{demand.question_type}): "
+                                   f"{result.get('error') or '题量不足'}")
+                    break
+
+                db.add(PregeneratedSet(combo_key=demand.combo_key, questions=questions))
+                db.commit()
+                generated += 1
+                self.stats["generated"] += 1
+                if QUESTION_BANK_ENABLED:
+                    try:
+                        question_bank.ingest(
+                            db, questions, demand.subject, demand.grade, demand.knowledge_points,
+                            demand.question_type, demand.difficulty_level,
+                            source="pregenerated", model_name=result.get('model_name')
+                        )
+                    except Exception as e:
+                        db.rollback()
+                        logger.error(f"预生成题目收录题库失败: {e}")
+        return generated
+
+    async def run_cycle(self, force: bool = False) -> int:
+        """执行一轮：写入热度、清理过期套题，空闲时段内补充预生成题目"""
+        if self._session_factory is None:
+            return 0
+        db = self._session_factory()
+        try:
+            self.seed_demand(db)
+            self.flush_demand(db)
+            self.expire(db)
+            self.stats["cycles"] += 1
+            self.stats["last_cycle_at"] = datetime.utcnow().isoformat()
+            if not force and not self.is_offpeak(db):
+                return 0
+            generated = await self.replenish(db)
+            if generated:
+                logger.info(f"本轮预生成 {generated} 套题目")
+            return generated
+        finally:
+            db.close()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(PREGEN_INTERVAL)
+            try:
+                await self.run_cycle()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"题目预生成任务出错: {e}")
+
+    async def stop(self):
+        """停止后台任务，并写入尚未保存的热度（应用关闭时调用）"""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        if self._session_factory is not None and self._pending:
+            db = self._session_factory()
+            try:
+                self.flush_demand(db)
+            except Exception as e:
+                logger.error(f"写入组卷热度失败: {e}")
+            finally:
+                db.close()
+
+    def get_stats(self, db: Optional[Session] = None) -> Dict[str, Any]:
+        stats = {
+            **self.stats,
+            "enabled": PREGEN_ENABLED,
+            "running": self._task is not None and not self._task.done(),
+            "pending_demand": len(self._pending)
+        }
+        if db is not None:
+            stats["offpeak_hours"] = sorted(self.offpeak_hours(db))
+            stats["ready_sets"] = db.query(PregeneratedSet).filter(
+                PregeneratedSet.status == "ready"
+            ).count()
+            stats["top_combos"] = [
+                {
+                    "subject": d.subject,
+                    "grade": d.grade,
+                    "knowledge_points": d.knowledge_points,
+                    "question_type": d.question_type,
+                    "question_count": d.question_count,
+                    "difficulty_level": d.difficulty_level,
+                    "request_count": d.request_count,
+                    "score": round(decayed(d.score, d.last_requested_at, datetime.utcnow()), 2)
+                }
+                for d in db.query(ExerciseDemand).order_by(ExerciseDemand.score.desc()).limit(10)
+            ]
+        return stats
+
+
+# 进程级共享实例
+pregeneration_pool = PregenerationPool()
@@ -0,0 +1,272 @@
+import os
+import random
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from database.models import QuestionBankItem, Exercise
+from services.question_utils import question_key, MIXED_TYPES
+from services.near_duplicate import (
+    NearDuplicateIndex, question_signature, encode_signature, decode_signature
+)
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 组卷时优先从题库取题，可通过环境变量关闭
+QUESTION_BANK_ENABLED = os.getenv("QUESTION_BANK_ENABLED", "true").lower() == "true"
+
+# 每道所需题目预取的候选题数，用于在使用次数相近的题目中随机选择
+CANDIDATE_FACTOR = 4
+
+# 学生做题记录：回溯的最近练习数，以及内存中保留的学生数
+HISTORY_EXERCISES = int(os.getenv("QUESTION_HISTORY_EXERCISES", "50"))
+HISTORY_MAX_USERS = int(os.getenv("QUESTION_HISTORY_MAX_USERS", "1000"))
+
+
+def content_hash(question: Dict[str, Any]) -> str:
+    return hashlib.sha256(question_key(question).encode("utf-8")).hexdigest()
+
+
+def _match_knowledge_point(question: Dict[str, Any], knowledge_points: List[str]) -> Optional[str]:
+    """把模型标注的知识点对应到请求中的知识点
+
+    题库只按请求中的知识点取题，对应不上时返回 None（不收录），
+    避免以模型自拟的知识点名称入库后再也取不到。
+    """
+    labeled = str(question.get("knowledge_point") or "").strip()
+    for point in knowledge_points:
+        if labeled and (point in labeled or labeled in point):
+            return point
+    if len(knowledge_points) == 1:
+        return knowledge_points[0]
+    return None
+
+
+def _as_int(value: Any, default: int) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def is_valid_question(question: Dict[str, Any], question_type: str) -> bool:
+    """入库校验：题干与答案齐全，选择题至少两个选项"""
+    if not str(question.get("content") or "").strip():
+        return False
+    if not str(question.get("answer") or "").strip():
+        return False
+    if question_type == "choice":
+        options = question.get("options")
+        if not isinstance(options, (list, dict)) or len(options) < 2:
+            return False
+    return question_type in MIXED_TYPES
+
+
+class QuestionBank:
+    """题库：按学科、年级、知识点、题型、难度索引已生成的题目"""
+
+    def __init__(self):
+        self.stats = {"served": 0, "requested": 0, "ingested": 0, "rejected": 0, "unmatched": 0,
+                      "duplicates": 0, "near_duplicates": 0, "history_filtered": 0}
+        # 按学科划分的近似去重索引：学科 -> (索引, 已加载的最大题目ID)
+        self._indexes: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def _index_for(self, db: Session, subject: str) -> NearDuplicateIndex:
+        """取学科索引，并增量加载其他进程新收录的题目"""
+        with self._lock:
+            entry = self._indexes.get(subject)
+            if entry is None:
+                entry = self._indexes[subject] = [NearDuplicateIndex(), 0]
+            index, last_id = entry
+            rows = db.query(
+                QuestionBankItem.id, QuestionBankItem.content_hash,
+                QuestionBankItem.signature, QuestionBankItem.content
+            ).filter(
+                QuestionBankItem.subject == subject,
+                QuestionBankItem.id > last_id
+            ).order_by(QuestionBankItem.id).all()
+            for row in rows:
+                sig = decode_signature(row.signature) if row.signature else \
+                    question_signature({"content": row.content})
+                index.add(row.content_hash, sig)
+                entry[1] = row.id
+            return index
+
+    def draw(self, db: Session, subject: str, grade: Optional[str], knowledge_points: List[str],
+             question_type: str, difficulty_level: int, count: int,
+             history: Optional[NearDuplicateIndex] = None) -> List[Dict[str, Any]]:
+        """从题库中取题，优先使用被组卷次数少、学生没做过的题目"""
+        self.stats["requested"] += count
+        if count <= 0 or not knowledge_points:
+            return []
+
+        types = MIXED_TYPES if question_type == "mixed" else [question_type]
+        query = db.query(QuestionBankItem).filter(
+            QuestionBankItem.subject == subject,
+            QuestionBankItem.grade == grade if grade else QuestionBankItem.grade.is_(None),
+            QuestionBankItem.knowledge_point.in_(knowledge_points),
+            QuestionBankItem.question_type.in_(types),
+            QuestionBankItem.difficulty_level == difficulty_level
+        )
+        candidates = query.order_by(
+            QuestionBankItem.usage_count, QuestionBankItem.id
+        ).limit(count * CANDIDATE_FACTOR).all()
+
+        if history is not None and len(history):
+            unseen = [
+                item for item in candidates
+                if not history.contains(decode_signature(item.signature) if item.signature
+                                        else question_signature({"content": item.content}))
+            ]
+            self.stats["history_filtered"] += len(candidates) - len(unseen)
+            candidates = unseen
+        if len(candidates) > count:
+            # 使用次数最少的题目中随机选取，避免每次组出相同的试卷
+            pool = candidates[:max(count, len(candidates) // 2)]
+            candidates = random.sample(pool, count)
+
+        now = datetime.now()
+        for item in candidates:
+            item.usage_count = (item.usage_count or 0) + 1
+            item.last_served_at = now
+        if candidates:
+            db.commit()
+
+        self.stats["served"] += len(candidates)
+        return [self.to_question(item) for item in candidates]
+
+    @staticmethod
+    def to_question(item: QuestionBankItem) -> Dict[str, Any]:
+        question = {
+            "type": item.question_type,
+            "content": item.content,
+            "answer": item.answer,
+            "knowledge_point": item.knowledge_point,
+            "difficulty": item.difficulty_level,
+            "bank_id": item.id
+        }
+        if item.options:
+            question["options"] = item.options
+        return question
+
+    def ingest(self, db: Session, questions: List[Dict[str, Any]], subject: str, grade: Optional[str],
+               knowledge_points: List[str], question_type: str, difficulty_level: int,
+               source: str = "ai", model_name: Optional[str] = None) -> int:
+        """校验并收录题目，与已有题目近似重复的不再收录"""
+        index = self._index_for(db, subject)
+        batch = NearDuplicateIndex()
+        signatures = {}
+        items = {}
+        for question in questions:
+            if question.get("bank_id"):
+                continue
+            item_type = question.get("type") or question_type
+            point = _match_knowledge_point(question, knowledge_points)
+            if point is None:
+                self.stats["unmatched"] += 1
+                continue
+            if not is_valid_question(question, item_type):
+                self.stats["rejected"] += 1
+                continue
+            digest = content_hash(question)
+            if digest in items:
+                continue
+            sig = question_signature(question)
+            if index.contains(sig) or batch.contains(sig):
+                self.stats["near_duplicates"] += 1
+                continue
+            batch.add(digest, sig)
+            signatures[digest] = sig
+            items[digest] = QuestionBankItem(
+                subject=subject,
+                grade=grade,
+                knowledge_point=point,
+                question_type=item_type,
+                difficulty_level=_as_int(question.get("difficulty"), difficulty_level),
+                content=str(question["content"]).strip(),
+                options=question.get("options"),
+                answer=str(question["answer"]).strip(),
+                content_hash=digest,
+                signature=encode_signature(sig),
+                source=source,
+                model_name=model_name
+            )
+
+        if not items:
+            return 0
+
+        existing = {
+            row.content_hash for row in db.query(QuestionBankItem.content_hash).filter(
+                QuestionBankItem.content_hash.in_(list(items))
+            )
+        }
+        new_items = [item for digest, item in items.items() if digest not in existing]
+        self.stats["duplicates"] += len(items) - len(new_items)
+        if not new_items:
+            return 0
+        try:
+            db.add_all(new_items)
+            db.commit()
+        except IntegrityError:
+            # 并发请求刚收录了相同题目
+            db.rollback()
+            logger.info("题库收录时遇到并发写入的重复题目，本批跳过")
+            return 0
+        for item in new_items:
+            index.add(item.content_hash, signatures[item.content_hash])
+        self.stats["ingested"] += len(new_items)
+        return len(new_items)
+
+    def get_stats(self, db: Optional[Session] = None) -> Dict[str, Any]:
+        requested = self.stats["requested"]
+        stats = {
+            **self.stats,
+            "hit_rate": round(self.stats["served"] / requested * 100, 1) if requested else 0
+        }
+        if db is not None:
+            stats["total_items"] = db.query(QuestionBankItem).count()
+        return stats
+
+
+class StudentHistory:
+    """学生最近做过的题目签名，按练习记录增量维护，用于过滤重复出题"""
+
+    def __init__(self, max_users: int = HISTORY_MAX_USERS, max_exercises: int = HISTORY_EXERCISES):
+        self.max_users = max_users
+        self.max_exercises = max_exercises
+        self._users: "OrderedDict[int, list]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def index_for(self, db: Session, user_id: int) -> NearDuplicateIndex:
+        with self._lock:
+            entry = self._users.get(user_id)
+            # 长期使用的学生定期重建，只保留最近的练习
+            if entry is None or len(entry[0]) > self.max_exercises * 50:
+                entry = self._users[user_id] = [NearDuplicateIndex(), 0]
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+
+            index, last_id = entry
+            rows = db.query(Exercise.id, Exercise.generated_content).filter(
+                Exercise.user_id == user_id,
+                Exercise.id > last_id
+            ).order_by(Exercise.id.desc()).limit(self.max_exercises).all()
+            for row in rows:
+                content = row.generated_content or {}
+                questions = content.get("questions", []) if isinstance(content, dict) else []
+                for number, question in enumerate(questions):
+                    if isinstance(question, dict) and question.get("content"):
+                        index.add(f"{row.id}:{number}", question_signature(question))
+                entry[1] = max(entry[1], row.id)
+            return index
+
+
+# 进程级共享实例
+question_bank = QuestionBank()
+student_history = StudentHistory()
@@ -0,0 +1,127 @@
+import os
+import re
+import json
+import math
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional, Iterable
+from services.stream_parser import IncrementalQuestionParser
+from services.near_duplicate import NearDuplicateIndex, question_signature
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 拆分生成：每组最多题数、最多并发组数、单组 max_tokens 上限
+FANOUT_CHUNK_SIZE = int(os.getenv("AI_FANOUT_CHUNK_SIZE", "5"))
+FANOUT_MAX_CHUNKS = int(os.getenv("AI_FANOUT_MAX_CHUNKS", "6"))
+FANOUT_MAX_TOKENS = int(os.getenv("AI_FANOUT_MAX_TOKENS", "2000"))
+
+# 单次组卷最多题数：组数随题量增加，超过该值的请求直接拒绝
+MAX_QUESTION_COUNT = int(os.getenv("AI_MAX_QUESTION_COUNT", "100"))
+
+# 单题输出的估算token数（含JSON结构），以及每次响应的固定开销
+TOKENS_PER_QUESTION = {
+    "choice": 250,
+    "fill": 150,
+    "solve": 450,
+    "mixed": 350
+}
+RESPONSE_OVERHEAD_TOKENS = 200
+
+# 混合题型拆分时轮换使用的题型
+MIXED_TYPES = ["choice", "fill", "solve"]
+
+_PUNCTUATION = re.compile(r"[\s　，。、；：？！“”‘’（）《》【】,.;:?!\"'()\[\]<>_\-]+")
+
+
+@dataclass
+class ExerciseChunk:
+    """一次并发生成请求的参数"""
+    knowledge_points: List[str]
+    question_type: str
+    question_count: int
+    index: int = 0
+    total: int = 1
+
+
+def estimate_max_tokens(question_type: str, question_count: int) -> int:
+    per_question = TOKENS_PER_QUESTION.get(question_type, TOKENS_PER_QUESTION["mixed"])
+    return min(FANOUT_MAX_TOKENS, RESPONSE_OVERHEAD_TOKENS + per_question * question_count)
+
+
+def chunk_capacity(question_type: str) -> int:
+    """单组最多题数：不超过配置值，且估算输出不超过 max_tokens 上限"""
+    per_question = TOKENS_PER_QUESTION.get(question_type, TOKENS_PER_QUESTION["mixed"])
+    fits = (FANOUT_MAX_TOKENS - RESPONSE_OVERHEAD_TOKENS) // per_question
+    return max(1, min(FANOUT_CHUNK_SIZE, fits))
+
+
+def plan_exercise_chunks(knowledge_points: List[str], question_type: str,
+                         question_count: int) -> List[ExerciseChunk]:
+    """把大批量题目拆分为多组：知识点较多时按知识点分组，混合题型按题型分组
+
+    组数随题量增加，每组题数不超过单组容量，输出不会因 max_tokens 上限被截断；
+    同时进行的组数由调用方按 FANOUT_MAX_CHUNKS 限制。
+    """
+    chunk_types = MIXED_TYPES if question_type == "mixed" else [question_type]
+    capacity = min(chunk_capacity(chunk_type) for chunk_type in chunk_types)
+    chunk_count = math.ceil(question_count / capacity)
+    if chunk_count <= 1:
+        return [ExerciseChunk(knowledge_points, question_type, question_count)]
+
+    counts = [
+        question_count // chunk_count + (1 if i < question_count % chunk_count else 0)
+        for i in range(chunk_count)
+    ]
+
+    chunks = []
+    for i, count in enumerate(counts):
+        if len(knowledge_points) >= chunk_count:
+            points = knowledge_points[i::chunk_count]
+        else:
+            points = knowledge_points
+        chunk_type = chunk_types[i % len(chunk_types)]
+        chunks.append(ExerciseChunk(points, chunk_type, count, index=i, total=chunk_count))
+    return chunks
+
+
+def parse_questions(content: str) -> Optional[List[Dict[str, Any]]]:
+    """解析模型输出的题目列表；输出被截断时保留已完整的题目"""
+    try:
+        data = json.loads(content)
+        if isinstance(data, dict) and isinstance(data.get("questions"), list):
+            return data["questions"]
+    except (json.JSONDecodeError, TypeError):
+        pass
+
+    questions = IncrementalQuestionParser().feed(content or "")
+    return questions or None
+
+
+def question_key(question: Dict[str, Any]) -> str:
+    """去重用的规范化题干：忽略空白、标点与大小写"""
+    return _PUNCTUATION.sub("", str(question.get("content", ""))).lower()
+
+
+def merge_question_sets(question_sets: Iterable[List[Dict[str, Any]]],
+                        limit: Optional[int] = None,
+                        history: Optional[NearDuplicateIndex] = None) -> List[Dict[str, Any]]:
+    """合并多组题目：去除近似重复及学生做过的题目，并从1开始重新编号"""
+    merged = []
+    seen = NearDuplicateIndex()
+    for questions in question_sets:
+        for question in questions:
+            if not question_key(question):
+                continue
+            sig = question_signature(question)
+            if seen.contains(sig) or (history is not None and history.contains(sig)):
+                continue
+            seen.add(len(merged), sig)
+            merged.append(dict(question))
+            if limit is not None and len(merged) >= limit:
+                break
+        if limit is not None and len(merged) >= limit:
+            break
+
+    for number, question in enumerate(merged, 1):
+        question["id"] = number
+    return merged
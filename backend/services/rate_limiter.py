@@ -0,0 +1,271 @@
+import time
+import asyncio
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 限流默认参数，可通过 AIModelConfig.model_params["rate_limit"] 按模型覆盖
+DEFAULT_RATE_LIMIT_OPTIONS = {
+    "requests_per_minute": 60,  # 令牌补充速率
+    "burst": 10,                # 令牌桶容量（允许的瞬时突发）
+    "max_concurrency": 8,       # 同时进行的上游调用上限
+    "max_queue": 200,           # 排队请求上限，超出直接拒绝
+    "queue_timeout": 30         # 单个请求最长排队时间（秒）
+}
+
+# 优先级：数值越小越先调度
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+
+# 各功能的默认优先级，未列出的功能按交互请求处理
+FUNCTION_PRIORITIES = {
+    "generate_exercise": PRIORITY_INTERACTIVE,
+    "generate_analysis": PRIORITY_INTERACTIVE,
+    "analyze_errors": PRIORITY_BACKGROUND,
+    "pregenerate_exercise": PRIORITY_BACKGROUND
+}
+
+# 未提供 Retry-After 时，上游429后的默认暂停时间（秒）
+DEFAULT_RETRY_AFTER = 5.0
+MAX_RETRY_AFTER = 300.0
+
+
+class RateLimitExceeded(Exception):
+    """排队已满或等待超时"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def rate_limit_options(model_config) -> Dict[str, Any]:
+    """合并默认参数与模型配置中的限流参数"""
+    options = dict(DEFAULT_RATE_LIMIT_OPTIONS)
+    model_params = model_config.model_params or {}
+    options.update(model_params.get("rate_limit") or {})
+    return options
+
+
+def tenant_key(user_id: Optional[int], institution: Optional[str] = None) -> str:
+    """公平队列的租户：账号有所属机构（学校）时按机构，否则按用户
+
+    同一机构下的大量账号共享一个份额，不会挤占其他机构的调用机会。
+    """
+    institution = (institution or "").strip()
+    return f"institution:{institution}" if institution else f"user:{user_id}"
+
+
+def priority_for(function_type: str) -> int:
+    return FUNCTION_PRIORITIES.get(function_type, PRIORITY_INTERACTIVE)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After 响应头（秒数或HTTP日期）"""
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        seconds = (retry_at - datetime.now(timezone.utc)).total_seconds()
+    return min(max(seconds, 0.0), MAX_RETRY_AFTER)
+
+
+class ModelLimiter:
+    """单个模型的令牌桶 + 并发上限 + 优先级公平队列
+
+    同一优先级内按租户（机构或用户）轮转出队，单个租户的大量请求不会饿死其他租户。
+    """
+
+    def __init__(self, model_name: str, options: Dict[str, Any]):
+        self.model_name = model_name
+        self.configure(options)
+        self.tokens = float(self.burst)
+        self.last_refill = time.monotonic()
+        self.active = 0
+        self.paused_until = 0.0
+        self._queues: Dict[int, OrderedDict] = {}
+        self._waiting = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.stats = {"admitted": 0, "queued": 0, "rejected": 0, "timeouts": 0,
+                      "throttled": 0, "max_queue_depth": 0, "total_wait": 0.0}
+
+    def configure(self, options: Dict[str, Any]):
+        self.rate = options["requests_per_minute"] / 60.0
+        self.burst = max(1, options["burst"])
+        self.max_concurrency = max(1, options["max_concurrency"])
+        self.max_queue = options["max_queue"]
+        self.queue_timeout = options["queue_timeout"]
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def _delay(self, now: float) -> float:
+        """距离可以放行下一个请求还需等待的时间，0 表示现在即可放行"""
+        if now < self.paused_until:
+            return self.paused_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else 1.0
+
+    def _admit(self):
+        self.tokens -= 1
+        self.active += 1
+        self.stats["admitted"] += 1
+
+    async def acquire(self, priority: int, tenant: str):
+        now = time.monotonic()
+        if self._waiting == 0 and self.active < self.max_concurrency and self._delay(now) == 0:
+            self._admit()
+            return
+
+        if self._waiting >= self.max_queue:
+            self.stats["rejected"] += 1
+            raise RateLimitExceeded("AI服务繁忙，请稍后重试", self._delay(now) or 1.0)
+
+        future = asyncio.get_running_loop().create_future()
+        tenants = self._queues.setdefault(priority, OrderedDict())
+        tenants.setdefault(tenant, deque()).append(future)
+        self._waiting += 1
+        self.stats["queued"] += 1
+        self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], self._waiting)
+        self._dispatch()
+
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                # 超时的同时已被放行
+                self.stats["total_wait"] += time.monotonic() - now
+                return
+            self._discard(priority, tenant, future)
+            self.stats["timeouts"] += 1
+            raise RateLimitExceeded("AI服务排队超时，请稍后重试", self._delay(time.monotonic()) or 1.0)
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()
+            else:
+                self._discard(priority, tenant, future)
+            raise
+        self.stats["total_wait"] += time.monotonic() - now
+
+    def _discard(self, priority: int, tenant: str, future: asyncio.Future):
+        tenants = self._queues.get(priority)
+        waiters = tenants.get(tenant) if tenants else None
+        if waiters and future in waiters:
+            waiters.remove(future)
+            self._waiting -= 1
+            if not waiters:
+                del tenants[tenant]
+        future.cancel()
+
+    def _next_waiter(self) -> Optional[asyncio.Future]:
+        for priority in sorted(self._queues):
+            tenants = self._queues[priority]
+            while tenants:
+                tenant, waiters = next(iter(tenants.items()))
+                future = waiters.popleft()
+                self._waiting -= 1
+                # 该租户移到队尾，实现轮转
+                del tenants[tenant]
+                if waiters:
+                    tenants[tenant] = waiters
+                if not future.done():
+                    return future
+        return None
+
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        while self._waiting and self.active < self.max_concurrency:
+            delay = self._delay(time.monotonic())
+            if delay > 0:
+                self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+                return
+            future = self._next_waiter()
+            if future is None:
+                return
+            self._admit()
+            future.set_result(None)
+
+    def release(self):
+        self.active = max(0, self.active - 1)
+        if self._waiting:
+            self._dispatch()
+
+    def throttle(self, retry_after: Optional[float]):
+        """上游返回429：按 Retry-After 暂停放行并清空令牌"""
+        retry_after = DEFAULT_RETRY_AFTER if retry_after is None else retry_after
+        self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+        self.tokens = 0.0
+        self.stats["throttled"] += 1
+        logger.warning(f"模型 {self.model_name} 被上游限流，暂停 {retry_after:.1f} 秒")
+
+    def get_stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        admitted = self.stats["admitted"]
+        return {
+            **{k: v for k, v in self.stats.items() if k != "total_wait"},
+            "active": self.active,
+            "queue_depth": self._waiting,
+            "queue_depth_by_priority": {
+                priority: sum(len(w) for w in tenants.values())
+                for priority, tenants in self._queues.items()
+            },
+            "tokens": round(min(self.burst, self.tokens + (now - self.last_refill) * self.rate), 2),
+            "paused_for": round(max(0.0, self.paused_until - now), 1),
+            "avg_wait_ms": round(self.stats["total_wait"] / admitted * 1000) if admitted else 0,
+            "max_concurrency": self.max_concurrency,
+            "requests_per_minute": round(self.rate * 60)
+        }
+
+
+class RateLimiter:
+    """按模型划分的上游调用限流器"""
+
+    def __init__(self):
+        self._limiters: Dict[str, ModelLimiter] = {}
+
+    def limiter_for(self, model_config) -> ModelLimiter:
+        options = rate_limit_options(model_config)
+        limiter = self._limiters.get(model_config.model_name)
+        if limiter is None:
+            limiter = self._limiters[model_config.model_name] = ModelLimiter(model_config.model_name, options)
+        else:
+            # 管理员修改配置后即时生效
+            limiter.configure(options)
+        return limiter
+
+    @asynccontextmanager
+    async def slot(self, model_config, priority: int = PRIORITY_INTERACTIVE, tenant: str = "anonymous"):
+        """占用一个上游调用名额，退出时归还"""
+        limiter = self.limiter_for(model_config)
+        await limiter.acquire(priority, tenant)
+        try:
+            yield limiter
+        finally:
+            limiter.release()
+
+    def throttle(self, model_config, retry_after: Optional[float] = None):
+        self.limiter_for(model_config).throttle(retry_after)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {name: limiter.get_stats() for name, limiter in self._limiters.items()}
+
+
+# 进程级共享实例
+rate_limiter = RateLimiter()
@@ -0,0 +1,52 @@
+import asyncio
+from typing import Dict, Any, Callable, Awaitable
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """合并相同键的并发调用：首个请求发起调用，其余请求等待同一结果"""
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._followers: Dict[str, int] = {}
+        self.stats = {
+            "leaders": 0,            # 实际发起的上游调用数
+            "coalesced": 0,          # 被合并、未发起上游调用的请求数
+            "max_followers": 0       # 单次调用最多合并的请求数
+        }
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+            self._followers[key] += 1
+            self.stats["max_followers"] = max(self.stats["max_followers"], self._followers[key])
+            return await asyncio.shield(task)
+
+        # 调用放在独立任务中执行，发起者断开连接不会影响等待中的其他请求
+        task = asyncio.ensure_future(func())
+        self._inflight[key] = task
+        self._followers[key] = 0
+        self.stats["leaders"] += 1
+        task.add_done_callback(lambda t: self._finish(key, t))
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task: asyncio.Task):
+        self._inflight.pop(key, None)
+        self._followers.pop(key, None)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"合并调用执行失败: {task.exception()}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        total = self.stats["leaders"] + self.stats["coalesced"]
+        return {
+            **self.stats,
+            "in_flight": len(self._inflight),
+            "coalesce_rate": round(self.stats["coalesced"] / total * 100, 1) if total else 0
+        }
+
+
+# 进程级共享实例，用于上游AI模型调用
+ai_call_flight = SingleFlight()
@@ -0,0 +1,103 @@
+import json
+from typing import Dict, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class IncrementalQuestionParser:
+    """从流式输出的JSON文本中增量解析题目
+
+    模型按 {"questions": [{...}, {...}]} 格式逐字输出，每当数组中的一个
+    题目对象闭合时即可解析出来，无需等待完整响应。
+    """
+
+    def __init__(self, array_key: str = "questions"):
+        self.array_key = array_key
+        self.buffer = ""
+        self._pos = 0              # 下一个待扫描字符位置
+        self._array_found = False
+        self._array_closed = False   # 数组结束后的输出不再解析
+        self._depth = 0            # 数组内对象嵌套深度
+        self._in_string = False
+        self._escape = False
+        self._object_chars: List[str] = []
+
+    def feed(self, text: str) -> List[Dict]:
+        """追加新文本，返回本次新解析出的完整题目"""
+        self.buffer += text
+        if self._array_closed:
+            return []
+        if not self._array_found and not self._locate_array():
+            return []
+        return self._scan()
+
+    def _locate_array(self) -> bool:
+        key_pos = self.buffer.find(f'"{self.array_key}"')
+        if key_pos < 0:
+            return False
+        bracket_pos = self.buffer.find("[", key_pos)
+        if bracket_pos < 0:
+            return False
+        self._array_found = True
+        self._pos = bracket_pos + 1
+        return True
+
+    def _scan(self) -> List[Dict]:
+        questions = []
+        buffer = self.buffer
+        while self._pos < len(buffer):
+            char = buffer[self._pos]
+
+            if self._in_string:
+                self._object_chars.append(char)
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                self._pos += 1
+                continue
+
+            # 跳过模型照抄提示词示例时带出的 // 注释
+            if char == "/" and self._pos + 1 == len(buffer):
+                break  # 无法判断是否为注释，等待下一个字符
+            if char == "/" and buffer.startswith("//", self._pos):
+                line_end = buffer.find("\n", self._pos)
+                if line_end < 0:
+                    break  # 注释尚未结束，等待更多文本
+                self._pos = line_end
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char == "{":
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+            elif char == "]" and self._depth == 0:
+                self._array_closed = True
+                self._pos = len(buffer)
+                break
+
+            if self._depth > 0 or char == "}":
+                self._object_chars.append(char)
+
+            if char == "}" and self._depth == 0:
+                question = self._decode("".join(self._object_chars))
+                self._object_chars = []
+                if question is not None:
+                    questions.append(question)
+
+            self._pos += 1
+        return questions
+
+    @staticmethod
+    def _decode(text: str) -> Optional[Dict]:
+        try:
+            value = json.loads(text)
+        except json.JSONDecodeError as e:
+            logger.warning(f"流式题目解析失败，已跳过: {e}")
+            return None
+        return value if isinstance(value, dict) else None
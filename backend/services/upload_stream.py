@@ -0,0 +1,162 @@
+import os
+import json
+import hashlib
+import tempfile
+from dataclasses import dataclass, field
+from typing import Dict, Any, Optional, BinaryIO
+from multipart.multipart import MultipartParser, parse_options_header
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 单张图片上传大小上限，以及在内存中缓冲的上限（超出后落盘到临时文件）
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_MB", "15")) * 1024 * 1024
+UPLOAD_SPOOL_MEMORY_BYTES = int(os.getenv("UPLOAD_SPOOL_MEMORY_KB", "512")) * 1024
+
+# 表单中普通文本字段的大小上限
+UPLOAD_MAX_FIELD_BYTES = 64 * 1024
+
+UPLOAD_ALLOWED_TYPES = ("image/jpeg", "image/png", "image/webp", "image/heic", "image/bmp")
+
+
+class UploadError(Exception):
+    """上传内容不合法，status_code 为应返回的HTTP状态码"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+@dataclass
+class SpooledUpload:
+    """已接收的上传文件：小文件留在内存，大文件在临时文件中"""
+    file: BinaryIO
+    filename: str = ""
+    content_type: str = ""
+    size: int = 0
+    sha256: str = ""
+    fields: Dict[str, str] = field(default_factory=dict)
+
+    def json_field(self, name: str, default: Any = None) -> Any:
+        value = self.fields.get(name)
+        if not value:
+            return default
+        try:
+            return json.loads(value)
+        except json.JSONDecodeError:
+            raise UploadError(f"表单字段 {name} 不是有效的JSON")
+
+    def close(self):
+        self.file.close()
+
+
+class _UploadReceiver:
+    """multipart 解析回调：文件字段边接收边写入临时文件并计算哈希"""
+
+    def __init__(self, file_field: str, max_bytes: int, spool_bytes: int):
+        self.file_field = file_field
+        self.max_bytes = max_bytes
+        self.upload = SpooledUpload(file=tempfile.SpooledTemporaryFile(max_size=spool_bytes))
+        self._hash = hashlib.sha256()
+        self._received_file = False
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_field = b""
+        self._header_value = b""
+        self._name: Optional[str] = None
+        self._is_file = False
+        self._value = bytearray()
+
+    def callbacks(self) -> Dict[str, Any]:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+        }
+
+    def on_part_begin(self):
+        self._headers = {}
+        self._value = bytearray()
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        self._name = options.get(b"name", b"").decode("utf-8", "replace")
+        self._is_file = self._name == self.file_field and b"filename" in options
+        if self._is_file:
+            if self._received_file:
+                raise UploadError("每次只能上传一张图片")
+            self._received_file = True
+            self.upload.filename = options[b"filename"].decode("utf-8", "replace")
+            self.upload.content_type = self._headers.get(b"content-type", b"").decode("latin-1").lower()
+            if self.upload.content_type not in UPLOAD_ALLOWED_TYPES:
+                raise UploadError(f"不支持的图片类型: {self.upload.content_type or '未知'}", 415)
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        chunk = data[start:end]
+        if self._is_file:
+            self.upload.size += len(chunk)
+            if self.upload.size > self.max_bytes:
+                raise UploadError(f"图片超过 {self.max_bytes // (1024 * 1024)}MB 上限", 413)
+            self._hash.update(chunk)
+            self.upload.file.write(chunk)
+        else:
+            self._value += chunk
+            if len(self._value) > UPLOAD_MAX_FIELD_BYTES:
+                raise UploadError(f"表单字段 {self._name} 过长", 413)
+
+    def on_part_end(self):
+        if not self._is_file and self._name:
+            self.upload.fields[self._name] = self._value.decode("utf-8", "replace")
+
+    def finish(self) -> SpooledUpload:
+        if not self._received_file or self.upload.size == 0:
+            raise UploadError(f"缺少图片文件字段: {self.file_field}")
+        self.upload.sha256 = self._hash.hexdigest()
+        self.upload.file.seek(0)
+        return self.upload
+
+
+async def receive_upload(request, file_field: str = "image", max_bytes: int = UPLOAD_MAX_BYTES,
+                         spool_bytes: int = UPLOAD_SPOOL_MEMORY_BYTES) -> SpooledUpload:
+    """流式解析 multipart/form-data 请求体
+
+    与 UploadFile 不同，超过大小上限时立即中止接收，不会先把整个请求体读完；
+    图片内容边接收边计算 SHA-256，调用方拿到的是可直接读取的文件句柄。
+    """
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in options:
+        raise UploadError("请使用 multipart/form-data 上传图片", 415)
+
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and \
+            int(content_length) > max_bytes + UPLOAD_MAX_FIELD_BYTES:
+        raise UploadError(f"图片超过 {max_bytes // (1024 * 1024)}MB 上限", 413)
+
+    receiver = _UploadReceiver(file_field, max_bytes, spool_bytes)
+    parser = MultipartParser(options[b"boundary"], receiver.callbacks())
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+        parser.finalize()
+        return receiver.finish()
+    except UploadError:
+        receiver.upload.close()
+        raise
+    except Exception as e:
+        receiver.upload.close()
+        logger.warning(f"解析上传请求失败: {e}")
+        raise UploadError("上传内容格式不正确")
@@ -0,0 +1,716 @@
+import os
+import re
+import math
+import random
+from dataclasses import dataclass, field
+from decimal import Decimal
+from fractions import Fraction
+from itertools import permutations, product
+from typing import Dict, Any, List, Optional, Tuple, Union
+from services.near_duplicate import NearDuplicateIndex, question_signature
+from services.question_utils import question_key
+from services.local_generator import NAMES
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 换数变式：把已有题目中的数字换成新值，答案由程序重新计算并验算，可通过环境变量关闭
+VARIANT_ENABLED = os.getenv("VARIANT_ENABLED", "true").lower() == "true"
+
+# 每道源题最多生成的变式数
+VARIANT_MAX_PER_SOURCE = int(os.getenv("VARIANT_MAX_PER_SOURCE", "4"))
+
+# 每个变式的取值尝试次数
+VARIANT_ATTEMPTS = 30
+
+# 没有讲解算式时，按题干数字穷举算式；题干数字超过该数时不穷举（容易误配）
+VARIANT_SEARCH_SLOTS = 4
+
+# 同一学科观测到的源题数达到该值后，才按可换数比例减少向模型要的题数
+VARIANT_MIN_OBSERVATIONS = 20
+
+OPERATORS = ("+", "-", "×", "÷")
+_PRECEDENCE = {"+": 1, "-": 1, "×": 2, "÷": 2}
+_OPERATOR_ALIASES = str.maketrans({"*": "×", "/": "÷", "−": "-", "（": "(", "）": ")"})
+
+_NUMBER = re.compile(r"(?<![\d.])\d+(?:\.\d+)?(?!\.?\d)")
+_TOKEN = re.compile(r"\s*(\d+(?:\.\d+)?|[-+×÷()])")
+_ARITHMETIC = r"[\d.+\-−×÷*/()（）\s]"
+_CHAIN = re.compile(rf"{_ARITHMETIC}+(?:={_ARITHMETIC}+)+")
+# 算式后注明的单位，如 “33（个）”
+_UNIT_NOTE = re.compile(r"[（(][^\d（）()]*[）)]")
+_OPTION_PREFIX = re.compile(r"^\s*[A-Da-d]\s*[.．、:：)）]\s*")
+
+# 序号、年级、分数、时刻中的数字不参与换数
+_FIXED_BEFORE = ("第", "/", ":")
+_FIXED_AFTER = ("年级", "题", "/", ":")
+
+# 时刻与日期（3时15分、8点、5月1日），换数后容易超出取值范围（如 3时82分），不参与换数
+_CLOCK_AFTER = re.compile(r"时(?!间)|点|[月日号]|分(?![钟之])")
+# 时长（3小时、20分钟）可以换数；复合时长中的分、秒（1小时20分钟）须小于60
+_DURATION_AFTER = re.compile(r"小时|分钟|秒|天|周|星期")
+_SEXAGESIMAL_AFTER = re.compile(r"分钟?|秒")
+_SEXAGESIMAL_BEFORE = ("时", "分", "分钟")
+
+# 区分不同算式的探测取值（固定种子，结果可复现）
+_probe_rng = random.Random(20240901)
+_PROBES = [[Fraction(_probe_rng.randint(2, 97)) for _ in range(16)] for _ in range(4)]
+
+# 表达式树：("slot", 题干数字序号) | ("num", 常数) | (运算符, 左, 右)
+Node = Tuple[Any, ...]
+
+
+class _AmbiguousSlot(Exception):
+    """讲解中的数字对应题干中多个相同的数字"""
+
+
+def apply_operator(operator: str, left: Fraction, right: Fraction) -> Optional[Fraction]:
+    if operator == "+":
+        return left + right
+    if operator == "-":
+        return left - right
+    if operator == "×":
+        return left * right
+    return left / right if right else None
+
+
+def evaluate(node: Node, values: Dict[int, Fraction],
+             trace: Optional[List[Fraction]] = None) -> Optional[Fraction]:
+    """计算表达式；trace 按固定顺序记录每个节点的值，用于比较换数前后的中间结果"""
+    kind = node[0]
+    if kind == "slot":
+        value = values[node[1]]
+    elif kind == "num":
+        value = node[1]
+    else:
+        left = evaluate(node[1], values, trace)
+        right = evaluate(node[2], values, trace)
+        if left is None or right is None:
+            return None
+        value = apply_operator(kind, left, right)
+        if value is None:
+            return None
+    if trace is not None:
+        trace.append(value)
+    return value
+
+
+def slot_indexes(node: Node) -> set:
+    if node[0] == "slot":
+        return {node[1]}
+    if node[0] == "num":
+        return set()
+    return slot_indexes(node[1]) | slot_indexes(node[2])
+
+
+def minimal_places(value: Fraction, limit: int = 6) -> Optional[int]:
+    """有限小数的最少小数位数，无限小数返回 None"""
+    for places in range(limit + 1):
+        if (value * 10 ** places).denominator == 1:
+            return places
+    return None
+
+
+def format_value(value: Fraction, places: Optional[int] = None) -> Optional[str]:
+    """按指定小数位数输出（默认取最少位数）；位数不够精确表示时返回 None"""
+    if places is None:
+        places = minimal_places(value)
+        if places is None:
+            return None
+    scaled = value * 10 ** places
+    if scaled.denominator != 1:
+        return None
+    return str(Decimal(scaled.numerator).scaleb(-places))
+
+
+def _places(text: str) -> int:
+    return len(text.split(".")[1]) if "." in text else 0
+
+
+def _is_clock(text: str, start: int, end: int) -> bool:
+    """时刻或日期中的数字；秒只在 “3分20秒” 这样的时刻写法中计入"""
+    if _CLOCK_AFTER.match(text, end):
+        return True
+    return text.startswith("秒", end) and not text.startswith("秒钟", end) and text[:start].endswith("分")
+
+
+def _unit_limit(text: str, start: int, end: int) -> Optional[int]:
+    """复合时长中的分钟、秒数的取值上限（不含）"""
+    if _SEXAGESIMAL_AFTER.match(text, end) and text[:start].endswith(_SEXAGESIMAL_BEFORE):
+        return 60
+    return None
+
+
+def _is_fixed(text: str, start: int, end: int) -> bool:
+    if text[max(0, start - 1):start] in _FIXED_BEFORE or text[end:].startswith(_FIXED_AFTER):
+        return True
+    if _is_clock(text, start, end):
+        return True
+    limit = _unit_limit(text, start, end)
+    return limit is not None and Fraction(text[start:end]) >= limit
+
+
+def find_numbers(text: str) -> List[Tuple[int, int, Fraction, int]]:
+    """文本中可换数的数字：[(起始位置, 结束位置, 数值, 小数位数)]"""
+    return [
+        (match.start(), match.end(), Fraction(match.group()), _places(match.group()))
+        for match in _NUMBER.finditer(text)
+        if not _is_fixed(text, match.start(), match.end())
+    ]
+
+
+def parse_expression(text: str) -> Optional[Node]:
+    """解析只含数字、四则运算与括号的算式"""
+    text = text.translate(_OPERATOR_ALIASES).strip().rstrip(".")
+    tokens, position = [], 0
+    while position < len(text):
+        match = _TOKEN.match(text, position)
+        if not match:
+            return None
+        tokens.append(match.group(1))
+        position = match.end()
+    if not tokens:
+        return None
+
+    def parse_sum(i: int) -> Tuple[Optional[Node], int]:
+        node, i = parse_product(i)
+        while node is not None and i < len(tokens) and tokens[i] in "+-":
+            right, j = parse_product(i + 1)
+            node, i = ((tokens[i], node, right), j) if right is not None else (None, j)
+        return node, i
+
+    def parse_product(i: int) -> Tuple[Optional[Node], int]:
+        node, i = parse_atom(i)
+        while node is not None and i < len(tokens) and tokens[i] in "×÷":
+            right, j = parse_atom(i + 1)
+            node, i = ((tokens[i], node, right), j) if right is not None else (None, j)
+        return node, i
+
+    def parse_atom(i: int) -> Tuple[Optional[Node], int]:
+        if i >= len(tokens):
+            return None, i
+        if tokens[i] == "(":
+            node, i = parse_sum(i + 1)
+            if node is None or i >= len(tokens) or tokens[i] != ")":
+                return None, i
+            return node, i + 1
+        if tokens[i][0].isdigit():
+            return ("num", Fraction(tokens[i])), i + 1
+        return None, i
+
+    node, end = parse_sum(0)
+    return node if end == len(tokens) else None
+
+
+def arithmetic_steps(text: str) -> Optional[List[Tuple[Node, Fraction]]]:
+    """提取文本中 “算式 = 结果” 的计算步骤；有算错的步骤时返回 None"""
+    steps = []
+    for match in _CHAIN.finditer(_UNIT_NOTE.sub(" ", text)):
+        parts = [parse_expression(part) for part in match.group().split("=")]
+        parts = [part for part in parts if part is not None]
+        if len(parts) < 2:
+            continue
+        values = [evaluate(part, {}) for part in parts]
+        if any(value is None for value in values) or len(set(values)) > 1:
+            return None
+        expression = next((part for part in parts if part[0] in OPERATORS), None)
+        if expression is not None:
+            steps.append((expression, values[-1]))
+    return steps
+
+
+def render_expression(node: Node, values: Dict[int, Fraction], places: Dict[int, int]) -> str:
+    kind = node[0]
+    if kind == "slot":
+        return format_value(values[node[1]], places[node[1]])
+    if kind == "num":
+        return format_value(node[1]) or str(node[1])
+    left = render_expression(node[1], values, places)
+    right = render_expression(node[2], values, places)
+    if node[1][0] in OPERATORS and _PRECEDENCE[node[1][0]] < _PRECEDENCE[kind]:
+        left = f"({left})"
+    if node[2][0] in OPERATORS and (
+        _PRECEDENCE[node[2][0]] < _PRECEDENCE[kind]
+        or (_PRECEDENCE[node[2][0]] == _PRECEDENCE[kind] and kind in "-÷")
+    ):
+        right = f"({right})"
+    return f"{left} {kind} {right}"
+
+
+def candidate_expressions(indexes: List[int], size: int):
+    """用 size 个题干数字组成的所有四则算式"""
+    if size == 2:
+        for a, b in permutations(indexes, 2):
+            for operator in OPERATORS:
+                yield (operator, ("slot", a), ("slot", b))
+    elif size == 3:
+        for a, b, c in permutations(indexes, 3):
+            for first, second in product(OPERATORS, repeat=2):
+                yield (second, (first, ("slot", a), ("slot", b)), ("slot", c))
+                yield (first, ("slot", a), (second, ("slot", b), ("slot", c)))
+
+
+def natural_value(node: Node, values: Dict[int, Fraction]) -> Optional[Fraction]:
+    """应用题中合理的算式：每一步结果都为正数"""
+    trace = []
+    value = evaluate(node, values, trace)
+    if value is None or any(step <= 0 for step in trace):
+        return None
+    return value
+
+
+def probe(node: Node) -> Tuple[Optional[Fraction], ...]:
+    """算式在几组探测取值下的结果，结果相同视为同一算式（如 a+b 与 b+a）"""
+    return tuple(evaluate(node, dict(enumerate(values))) for values in _PROBES)
+
+
+@dataclass
+class Slot:
+    """题干中参与换数的数字"""
+    start: int
+    end: int
+    value: Fraction
+    places: int
+    limit: Optional[int] = None     # 取值上限（不含），如复合时长中的分钟数
+
+
+@dataclass
+class OptionTemplate:
+    """选择题选项：rule 为 None 表示正确选项，为算式表示对应某种错误解法，为数值表示与答案的差"""
+    text: str
+    start: int
+    end: int
+    value: Fraction
+    places: int
+    rule: Union[None, Node, Fraction] = None
+
+
+@dataclass
+class QuestionTemplate:
+    """可换数的题目模板"""
+    question: Dict[str, Any]
+    slots: List[Slot]
+    expression: Node
+    method: str
+    answer: Fraction
+    answer_places: int
+    # 答案文本中数字的位置；选择题以选项字母作答时为 None
+    answer_span: Optional[Tuple[int, int]]
+    trace: List[Fraction]
+    steps: List[Tuple[Node, Fraction]] = field(default_factory=list)
+    options: Optional[List[OptionTemplate]] = None
+    option_keys: Optional[List[str]] = None
+    name: Optional[str] = None
+
+    @property
+    def used(self) -> List[int]:
+        return sorted(slot_indexes(self.expression))
+
+
+def _option_items(options: Any) -> Optional[List[Tuple[str, str]]]:
+    if isinstance(options, dict):
+        return [(str(key), str(value)) for key, value in options.items()]
+    if isinstance(options, list):
+        return [(chr(65 + i), str(value)) for i, value in enumerate(options)]
+    return None
+
+
+class VariantEngine:
+    """换数变式生成器
+
+    从题目讲解中的算式（没有讲解时按题干数字穷举唯一吻合答案的算式）得到答案的计算式，
+    题干数字换成同量级的新值后重新计算答案，要求每一步中间结果的正负与整除性不变，
+    讲解中的算式同步换数后再次验算。一道模型生成的应用题可派生多道不同数字的练习题。
+    """
+
+    def __init__(self):
+        self.stats = {"sources": 0, "templated": 0, "from_explanation": 0, "from_search": 0,
+                      "variants": 0, "exhausted": 0}
+        # 学科 -> [观测的源题数, 可换数的源题数]
+        self._observed: Dict[str, List[int]] = {}
+
+    def extract(self, question: Dict[str, Any]) -> Optional[QuestionTemplate]:
+        """解析题目的可换数模板，无法可靠确定答案算式时返回 None"""
+        self.stats["sources"] += 1
+        try:
+            template = self._extract(question)
+        except (ValueError, ZeroDivisionError, TypeError) as e:
+            logger.debug(f"题目无法换数: {e}")
+            template = None
+        if template is not None:
+            self.stats["templated"] += 1
+            self.stats[f"from_{template.method}"] += 1
+        return template
+
+    def _extract(self, question: Dict[str, Any]) -> Optional[QuestionTemplate]:
+        content = str(question.get("content") or "")
+        slots = [Slot(*number, limit=_unit_limit(content, *number[:2]))
+                 for number in find_numbers(content) if number[2] > 0]
+        if len(slots) < 2:
+            return None
+        # 题干含时刻或日期时，其中的时长多由时刻推算（8时到11时经过3小时），不能单独换数
+        has_clock = any(_is_clock(content, match.start(), match.end()) for match in _NUMBER.finditer(content))
+        durations = {i for i, slot in enumerate(slots) if _DURATION_AFTER.match(content, slot.end)}
+
+        answer_text = str(question.get("answer") or "").strip()
+        items = _option_items(question.get("options")) if question.get("options") else None
+        correct = None
+        if items:
+            keys = [key for key, _ in items]
+            if answer_text.upper() in keys:
+                correct = keys.index(answer_text.upper())
+            else:
+                plain = [_OPTION_PREFIX.sub("", text).strip() for _, text in items]
+                if answer_text not in plain:
+                    return None
+                correct = plain.index(answer_text)
+            target_text = items[correct][1]
+        elif question.get("type") == "choice":
+            return None
+        else:
+            target_text = answer_text
+
+        numbers = find_numbers(target_text)
+        if len(numbers) != 1:
+            return None
+        answer, answer_places = numbers[0][2], numbers[0][3]
+        answer_span = None
+        if correct is None or answer_text.upper() not in [key for key, _ in items]:
+            answer_numbers = find_numbers(answer_text)
+            if len(answer_numbers) != 1:
+                return None
+            answer_span = answer_numbers[0][:2]
+
+        explanation = str(question.get("explanation") or "")
+        raw_steps = arithmetic_steps(explanation)
+        if raw_steps is None:
+            # 讲解中的计算本身有误，这道题不作为源题
+            return None
+        expression, steps, method = None, [], "explanation"
+        resolved = self._resolve_steps(raw_steps, slots, answer)
+        if resolved is not None:
+            expression, steps = resolved
+        else:
+            expression, method = self._search(slots, answer), "search"
+        if expression is None:
+            return None
+
+        if has_clock and durations & slot_indexes(expression):
+            return None
+
+        values = {i: slot.value for i, slot in enumerate(slots)}
+        trace = []
+        if evaluate(expression, values, trace) != answer:
+            return None
+
+        template = QuestionTemplate(
+            question=question, slots=slots, expression=expression, method=method,
+            answer=answer, answer_places=answer_places, answer_span=answer_span,
+            trace=trace, steps=steps
+        )
+        if items:
+            options = self._option_templates(items, correct, template)
+            if options is None:
+                return None
+            template.options = options
+            template.option_keys = [key for key, _ in items]
+
+        names = {name for name in NAMES if name in content}
+        if len(names) == 1:
+            template.name = names.pop()
+        return template
+
+    @staticmethod
+    def _resolve_steps(raw_steps: List[Tuple[Node, Fraction]], slots: List[Slot],
+                       answer: Fraction) -> Optional[Tuple[Node, List[Tuple[Node, Fraction]]]]:
+        """把讲解算式中的数字对应到题干数字或前面步骤的结果，取算出答案的最后一步"""
+        by_value: Dict[Fraction, List[int]] = {}
+        for i, slot in enumerate(slots):
+            by_value.setdefault(slot.value, []).append(i)
+        steps: List[Tuple[Node, Fraction]] = []
+
+        def resolve(node: Node) -> Node:
+            if node[0] != "num":
+                return (node[0], resolve(node[1]), resolve(node[2]))
+            matches = by_value.get(node[1], [])
+            if len(matches) > 1:
+                raise _AmbiguousSlot()
+            if matches:
+                return ("slot", matches[0])
+            for tree, value in reversed(steps):
+                if value == node[1] and slot_indexes(tree):
+                    return tree
+            return node
+
+        try:
+            for tree, value in raw_steps:
+                steps.append((resolve(tree), value))
+        except _AmbiguousSlot:
+            return None
+        for tree, value in reversed(steps):
+            if value == answer and slot_indexes(tree):
+                return tree, steps
+        return None
+
+    @staticmethod
+    def _search(slots: List[Slot], answer: Fraction) -> Optional[Node]:
+        """穷举由2~3个题干数字组成的算式，只有唯一一种算式吻合答案时采用"""
+        counts: Dict[Fraction, int] = {}
+        for slot in slots:
+            counts[slot.value] = counts.get(slot.value, 0) + 1
+        indexes = [i for i, slot in enumerate(slots) if counts[slot.value] == 1]
+        if not 2 <= len(indexes) <= VARIANT_SEARCH_SLOTS or answer in counts:
+            return None
+        values = {i: slot.value for i, slot in enumerate(slots)}
+        for size in (2, 3):
+            matches = [
+                node for node in candidate_expressions(indexes, size)
+                if natural_value(node, values) == answer
+            ]
+            if matches:
+                return matches[0] if len({probe(node) for node in matches}) == 1 else None
+        return None
+
+    @staticmethod
+    def _option_templates(items: List[Tuple[str, str]], correct: int,
+                          template: QuestionTemplate) -> Optional[List[OptionTemplate]]:
+        """选项换数规则：干扰项尽量对应一种错误算式，否则保持与答案的差"""
+        used = template.used
+        values = {i: slot.value for i, slot in enumerate(template.slots)}
+        answer_probe = probe(template.expression)
+        candidates = [
+            node for size in (2, 3) if len(used) >= size
+            for node in candidate_expressions(used, size)
+        ]
+        options = []
+        for i, (_, text) in enumerate(items):
+            numbers = find_numbers(text)
+            if len(numbers) != 1:
+                return None
+            start, end, value, places = numbers[0]
+            rule = None
+            if i != correct:
+                rule = next(
+                    (node for node in candidates
+                     if natural_value(node, values) == value and probe(node) != answer_probe),
+                    value - template.answer
+                )
+            options.append(OptionTemplate(text, start, end, value, places, rule))
+        return options
+
+    def instantiate(self, template: QuestionTemplate, rng: random.Random) -> Optional[Dict[str, Any]]:
+        """换一组数字生成变式并验算，多次取值都不满足约束时返回 None"""
+        used = template.used
+        for _ in range(VARIANT_ATTEMPTS):
+            values = {i: slot.value for i, slot in enumerate(template.slots)}
+            for i in used:
+                values[i] = self._sample(rng, template.slots[i])
+            if all(values[i] == template.slots[i].value for i in used):
+                continue
+            trace = []
+            answer = evaluate(template.expression, values, trace)
+            if answer is None or not self._keeps_shape(template.trace, trace):
+                continue
+            answer_text = format_value(answer, template.answer_places)
+            if answer_text is None:
+                continue
+            options = None
+            if template.options:
+                options = self._instantiate_options(template, values, answer)
+                if options is None:
+                    continue
+            return self._render(template, values, answer, answer_text, options, rng)
+        return None
+
+    @staticmethod
+    def _sample(rng: random.Random, slot: Slot) -> Fraction:
+        """同位数、同样整十整百、同样小数位数的新值，不超过数字的取值上限"""
+        scaled = int(slot.value * 10 ** slot.places)
+        digits = len(str(scaled))
+        zeros = len(str(scaled)) - len(str(scaled).rstrip("0"))
+        step = 10 ** min(zeros, digits - 1)
+        low = 10 ** (digits - 1) if digits > 1 else (2 if scaled >= 2 else 1)
+        low = max(step, math.ceil(low / step) * step)
+        high = 10 ** digits
+        if slot.limit is not None:
+            high = min(high, slot.limit * 10 ** slot.places)
+        if low >= high:
+            return slot.value
+        while True:
+            value = rng.randrange(low, high, step)
+            # 原数末位不是0的小数，新值末位也不为0（避免出现 2.0 这样的写法）
+            if not (slot.places and zeros == 0 and value % 10 == 0):
+                return Fraction(value, 10 ** slot.places)
+
+    @staticmethod
+    def _keeps_shape(original: List[Fraction], trace: List[Fraction]) -> bool:
+        """每一步中间结果的正负、是否为零、是否为整数都与原题相同"""
+        for before, after in zip(original, trace):
+            if (before > 0) != (after > 0) or (before == 0) != (after == 0):
+                return False
+            if before.denominator == 1 and after.denominator != 1:
+                return False
+            if minimal_places(after) is None:
+                return False
+        return True
+
+    @staticmethod
+    def _instantiate_options(template: QuestionTemplate, values: Dict[int, Fraction],
+                             answer: Fraction) -> Optional[List[str]]:
+        def valid(value: Optional[Fraction], option: OptionTemplate) -> bool:
+            return (value is not None and not value < 0 <= option.value
+                    and (option.rule is None or value != answer)
+                    and format_value(value, option.places) is not None)
+
+        new_values = []
+        for option in template.options:
+            if option.rule is None:
+                value = answer
+            else:
+                value = None if isinstance(option.rule, Fraction) else evaluate(option.rule, values)
+                if not valid(value, option):
+                    # 错误算式在新数字下不适用（如结果为负），改为保持与答案的差
+                    value = answer + (option.value - template.answer)
+            if not valid(value, option):
+                return None
+            new_values.append(value)
+        if len(set(new_values)) != len(new_values):
+            return None
+        return [
+            option.text[:option.start] + format_value(value, option.places) + option.text[option.end:]
+            for option, value in zip(template.options, new_values)
+        ]
+
+    def _render(self, template: QuestionTemplate, values: Dict[int, Fraction], answer: Fraction,
+                answer_text: str, options: Optional[List[str]], rng: random.Random) -> Dict[str, Any]:
+        question = template.question
+        content = str(question["content"])
+        for i in sorted(template.used, key=lambda index: template.slots[index].start, reverse=True):
+            slot = template.slots[i]
+            content = content[:slot.start] + format_value(values[i], slot.places) + content[slot.end:]
+
+        variant = {key: value for key, value in question.items() if key not in ("id", "bank_id")}
+        variant["content"] = content
+        if template.answer_span is not None:
+            start, end = template.answer_span
+            original = str(question["answer"]).strip()
+            variant["answer"] = original[:start] + answer_text + original[end:]
+        if options is not None:
+            variant["options"] = dict(zip(template.option_keys, options)) \
+                if isinstance(question.get("options"), dict) else options
+        variant["explanation"] = self._explanation(template, values, answer, answer_text)
+        variant["source"] = "variant"
+
+        if template.name:
+            name = rng.choice([name for name in NAMES if name != template.name])
+            for key in ("content", "answer", "explanation"):
+                variant[key] = str(variant[key]).replace(template.name, name)
+            if isinstance(variant.get("options"), list):
+                variant["options"] = [option.replace(template.name, name) for option in variant["options"]]
+        return variant
+
+    @staticmethod
+    def _explanation(template: QuestionTemplate, values: Dict[int, Fraction],
+                     answer: Fraction, answer_text: str) -> str:
+        """讲解中的算式同步换数并验算；无法对应时给出列式"""
+        places = {i: slot.places for i, slot in enumerate(template.slots)}
+        plain = f"列式：{render_expression(template.expression, values, places)} = {answer_text}"
+        explanation = str(template.question.get("explanation") or "")
+        if template.method != "explanation" or not explanation:
+            return plain
+
+        replacements: Dict[Fraction, str] = {}
+
+        def bind(old: Fraction, new_text: Optional[str]) -> bool:
+            if new_text is None or replacements.get(old, new_text) != new_text:
+                return False
+            replacements[old] = new_text
+            return True
+
+        for i in template.used:
+            if not bind(template.slots[i].value, format_value(values[i], places[i])):
+                return plain
+        for tree, old in template.steps:
+            new = evaluate(tree, values)
+            if new is None or not bind(old, format_value(new)):
+                return plain
+        if not bind(template.answer, format_value(answer)):
+            return plain
+
+        rewritten, last = [], 0
+        for start, end, value, _ in find_numbers(explanation):
+            if value in replacements:
+                rewritten.append(explanation[last:start] + replacements[value])
+                last = end
+        rewritten.append(explanation[last:])
+        rewritten = "".join(rewritten)
+        steps = arithmetic_steps(rewritten)
+        if not steps or not any(value == answer for _, value in steps):
+            return plain
+        return rewritten
+
+    def expand(self, questions: List[Dict[str, Any]], count: int, subject: Optional[str] = None,
+               per_source: int = VARIANT_MAX_PER_SOURCE,
+               history: Optional[NearDuplicateIndex] = None,
+               seed: Optional[int] = None) -> List[Dict[str, Any]]:
+        """由一组题目轮流派生变式，最多 count 道，跳过与源题相同或学生做过的题目"""
+        if not VARIANT_ENABLED or not questions:
+            return []
+        # 不需要变式时也解析一遍，统计该学科题目的可换数比例
+        templates = [template for template in map(self.extract, questions) if template is not None]
+        if subject:
+            observed = self._observed.setdefault(subject, [0, 0])
+            observed[0] += len(questions)
+            observed[1] += len(templates)
+        if count <= 0 or per_source <= 0:
+            return []
+        rng = random.Random(seed)
+
+        seen = {question_key(question) for question in questions}
+        quotas = [per_source] * len(templates)
+        variants = []
+        while len(variants) < count and any(quotas):
+            for i, template in enumerate(templates):
+                if not quotas[i] or len(variants) >= count:
+                    continue
+                quotas[i] -= 1
+                variant = self.instantiate(template, rng)
+                if variant is None:
+                    # 取值范围已难以满足约束，不再从这道题派生
+                    quotas[i] = 0
+                    self.stats["exhausted"] += 1
+                    continue
+                key = question_key(variant)
+                if key in seen or (history is not None and history.contains(question_signature(variant))):
+                    continue
+                seen.add(key)
+                variants.append(variant)
+        self.stats["variants"] += len(variants)
+        return variants
+
+    def source_count(self, subject: str, count: int) -> int:
+        """为凑够 count 道题需要模型生成的源题数
+
+        按该学科已观测到的可换数比例估算每道源题能提供的题数；观测不足时不减少。
+        """
+        observed = self._observed.get(subject)
+        if not VARIANT_ENABLED or not observed or observed[0] < VARIANT_MIN_OBSERVATIONS:
+            return count
+        expected = 1 + observed[1] / observed[0] * VARIANT_MAX_PER_SOURCE
+        return max(1, math.ceil(count / expected))
+
+    def get_stats(self) -> Dict[str, Any]:
+        sources = self.stats["sources"]
+        return {
+            **self.stats,
+            "enabled": VARIANT_ENABLED,
+            "templated_rate": round(self.stats["templated"] / sources * 100, 1) if sources else 0,
+            "by_subject": {
+                subject: {"sources": seen, "templated": templated}
+                for subject, (seen, templated) in self._observed.items()
+            }
+        }
+
+
+# 进程级共享实例
+variant_engine = VariantEngine()
@@ -0,0 +1,212 @@
+import os
+import json
+import time
+import asyncio
+import aiohttp
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional, Callable, Tuple
+from services.http_pool import http_pool
+from services.rate_limiter import rate_limiter, RateLimitExceeded, parse_retry_after
+import logging
+
+logger = logging.getLogger(__name__)
+
+VISION_API_ENDPOINT = "https://dashscope.aliyuncs.com/api/v1/services/aigc/multimodal-generation/generation"
+VISION_MODEL = os.getenv("VISION_MODEL", "qwen-vl-max")
+
+# 单次视觉调用的截止时间（秒，含排队时间）
+VISION_TIMEOUT = float(os.getenv("VISION_TIMEOUT", "90"))
+
+# 本进程同时进行的视觉调用上限，以及排队上限
+VISION_MAX_CONCURRENCY = int(os.getenv("VISION_MAX_CONCURRENCY", "8"))
+VISION_MAX_QUEUE = int(os.getenv("VISION_MAX_QUEUE", "50"))
+
+# 等待期间检查客户端是否已断开的间隔（秒）
+DISCONNECT_POLL_INTERVAL = 0.5
+
+
+class ClientDisconnected(Exception):
+    """客户端在视觉调用完成前断开连接，调用已取消"""
+
+
+@dataclass(frozen=True)
+class VisionConfig:
+    """视觉模型配置，字段与 ModelSnapshot 一致，可直接用于共享连接池与限流器"""
+    model_name: str
+    api_endpoint: str
+    api_key: str = field(repr=False)
+    model_params: Dict[str, Any] = field(default_factory=dict)
+
+
+def default_vision_config(api_key: Optional[str] = None) -> VisionConfig:
+    return VisionConfig(
+        model_name=VISION_MODEL,
+        api_endpoint=VISION_API_ENDPOINT,
+        api_key=api_key or os.getenv("DASHSCOPE_API_KEY", ""),
+        model_params={
+            "rate_limit": {
+                "max_concurrency": VISION_MAX_CONCURRENCY,
+                "max_queue": VISION_MAX_QUEUE,
+                "queue_timeout": VISION_TIMEOUT
+            }
+        }
+    )
+
+
+def message_text(content: Any) -> str:
+    """多模态接口的 content 是分段列表，拼接其中的文本"""
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content or ""
+
+
+class VisionClient:
+    """通义千问视觉模型的异步客户端
+
+    所有拍照批阅入口共用：走进程级连接池，经限流器控制并发，
+    每次调用有截止时间，调用方取消（如客户端断开）时上游请求随之中止。
+    """
+
+    def __init__(self):
+        self.stats = {"calls": 0, "succeeded": 0, "failed": 0, "timeouts": 0,
+                      "rate_limited": 0, "cancelled": 0, "total_time": 0.0}
+
+    async def call(self, messages: List[Dict[str, Any]], config: Optional[VisionConfig] = None,
+                   timeout: float = VISION_TIMEOUT, parameters: Optional[Dict[str, Any]] = None,
+                   tenant: str = "anonymous",
+                   on_delta: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+        """调用视觉模型，返回 {'success', 'content', 'usage', 'response_time'} 或失败信息
+
+        提供 on_delta 时以SSE增量输出方式调用，每收到一段文本即回调，返回值不变。
+        """
+        config = config or default_vision_config()
+        start_time = time.time()
+        self.stats["calls"] += 1
+        try:
+            result = await asyncio.wait_for(
+                self._call(config, messages, parameters or {}, start_time + timeout, tenant, on_delta),
+                timeout
+            )
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            logger.warning(f"视觉模型调用超时({timeout:.0f}秒)")
+            return {'success': False, 'error': f'视觉模型响应超时（{timeout:.0f}秒）', 'timeout': True}
+        except RateLimitExceeded as e:
+            self.stats["rate_limited"] += 1
+            return {'success': False, 'error': str(e), 'retry_after': e.retry_after, 'rate_limited': True}
+        except asyncio.CancelledError:
+            self.stats["cancelled"] += 1
+            logger.info("视觉模型调用已取消")
+            raise
+        except aiohttp.ClientError as e:
+            self.stats["failed"] += 1
+            logger.error(f"视觉模型请求失败: {e}")
+            return {'success': False, 'error': f'视觉模型请求失败: {e}'}
+
+        response_time = time.time() - start_time
+        result['response_time'] = response_time
+        self.stats["total_time"] += response_time
+        self.stats["succeeded" if result.get('success') else "failed"] += 1
+        return result
+
+    async def _call(self, config: VisionConfig, messages: List[Dict[str, Any]],
+                    parameters: Dict[str, Any], deadline: float, tenant: str,
+                    on_delta: Optional[Callable[[str], None]]) -> Dict[str, Any]:
+        headers = {
+            "Authorization": f"Bearer {config.api_key}",
+            "Content-Type": "application/json"
+        }
+        parameters = {"result_format": "message", **parameters}
+        if on_delta is not None:
+            headers.update({"Accept": "text/event-stream", "X-DashScope-SSE": "enable"})
+            parameters["incremental_output"] = True
+        payload = {
+            "model": config.model_name,
+            "input": {"messages": messages},
+            "parameters": parameters
+        }
+
+        async with rate_limiter.slot(config, tenant=tenant):
+            session = await http_pool.get_session(config)
+            remaining = max(1.0, deadline - time.time())
+            async with session.post(
+                config.api_endpoint,
+                headers=headers,
+                json=payload,
+                timeout=aiohttp.ClientTimeout(total=remaining)
+            ) as response:
+                if response.status != 200:
+                    error_text = await response.text()
+                    retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                    if response.status == 429:
+                        rate_limiter.throttle(config, retry_after)
+                    logger.error(f"视觉模型调用失败: {response.status} - {error_text}")
+                    return {
+                        'success': False,
+                        'error': f'API调用失败: {response.status} - {error_text}',
+                        'status': response.status,
+                        'retry_after': retry_after
+                    }
+                if on_delta is None:
+                    content, usage = self._read_message(await response.json())
+                else:
+                    content, usage = await self._read_stream(response, on_delta)
+
+        if not content:
+            return {'success': False, 'error': '视觉模型返回空响应'}
+        return {'success': True, 'content': content, 'usage': usage}
+
+    @staticmethod
+    def _read_message(result: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+        choices = (result.get("output") or {}).get("choices") or [{}]
+        return message_text((choices[0].get("message") or {}).get("content")), result.get("usage") or {}
+
+    async def _read_stream(self, response: aiohttp.ClientResponse,
+                           on_delta: Callable[[str], None]) -> Tuple[str, Dict[str, Any]]:
+        """逐条读取SSE增量输出，拼接完整文本"""
+        chunks, usage = [], {}
+        async for raw_line in response.content:
+            line = raw_line.decode("utf-8").strip()
+            if not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if not data or data == "[DONE]":
+                continue
+            text, event_usage = self._read_message(json.loads(data))
+            usage = event_usage or usage
+            if text:
+                chunks.append(text)
+                on_delta(text)
+        return "".join(chunks), usage
+
+    async def close(self):
+        await http_pool.close(VISION_API_ENDPOINT)
+
+    def get_stats(self) -> Dict[str, Any]:
+        completed = self.stats["succeeded"] + self.stats["failed"]
+        return {
+            **{k: v for k, v in self.stats.items() if k != "total_time"},
+            "avg_response_time": round(self.stats["total_time"] / completed, 2) if completed else 0,
+            "limiter": rate_limiter.get_stats().get(VISION_MODEL)
+        }
+
+
+async def cancel_on_disconnect(request, awaitable):
+    """等待视觉调用完成；客户端先断开时取消调用并抛出 ClientDisconnected"""
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                logger.info("客户端已断开，取消视觉模型调用")
+                raise ClientDisconnected()
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+# 进程级共享实例
+vision_client = VisionClient()
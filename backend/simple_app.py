@@ -12,6 +12,8 @@ import json
 # 添加当前目录到Python路径
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
+from services.local_generator import local_question_generator
+
 # 默认AI配置 - 通义千问
 DEFAULT_AI_CONFIG = {
     "provider": "tongyi",
@@ -341,6 +343,22 @@ async def generate_exercise(request_data: dict):
         
         print(f"🎯 收到题目生成请求: {subject} {grade} {question_type} 共{question_count}题")
         
+        # 算术等公式化知识点由本地模板生成，无需调用AI
+        local_questions = local_question_generator.generate(
+            subject, grade, knowledge_points, question_type, question_count, difficulty_level
+        )
+        if local_questions:
+            print(f"✅ 本地生成 {len(local_questions)} 道{subject}题目")
+            return {
+                "success": True,
+                "questions": local_questions,
+                "total_count": len(local_questions),
+                "subject": subject,
+                "grade": grade,
+                "message": f"成功生成{len(local_questions)}道{subject}题目",
+                "ai_powered": False
+            }
+        
         # 根据题型构建不同的AI提示词
         type_descriptions = {
             'choice': '选择题',
@@ -515,111 +533,10 @@ async def generate_exercise(request_data: dict):
             
             # 根据题型生成不同类型的备用题目
             if subject == "数学":
-                if question_type == 'choice':
-                    math_questions = [
-                        {
-                            "type": "choice",
-                            "content": "计算：5 + 3 = ?",
-                            "options": ["6", "7", "8", "9"],
-                            "answer": "8",
-                            "explanation": "这是一道基础加法运算题：5 + 3 = 8。",
-                            "knowledge_point": f"{grade}数学基础运算",
-                            "difficulty": difficulty_level
-                        },
-                        {
-                            "type": "choice",
-                            "content": "计算：10 - 4 = ?",
-                            "options": ["5", "6", "7", "8"],
-                            "answer": "6",
-                            "explanation": "这是一道基础减法运算题：10 - 4 = 6。",
-                            "knowledge_point": f"{grade}数学基础运算",
-                            "difficulty": difficulty_level
-                        },
-                        {
-                            "type": "choice",
-                            "content": "计算：3 × 4 = ?",
-                            "options": ["10", "11", "12", "13"],
-                            "answer": "12",
-                            "explanation": "这是一道基础乘法运算题：3 × 4 = 12。",
-                            "knowledge_point": f"{grade}数学乘法运算",
-                            "difficulty": difficulty_level
-                        }
-                    ]
-                elif question_type == 'fill':
-                    math_questions = [
-                        {
-                            "type": "fill",
-                            "content": "5 + 3 = ____",
-                            "answer": "8",
-                            "explanation": "这是一道基础加法运算题：5 + 3 = 8。",
-                            "knowledge_point": f"{grade}数学基础运算",
-                            "difficulty": difficulty_level
-                        },
-                        {
-                            "type": "fill",
-                            "content": "10 - ____ = 6",
-                            "answer": "4",
-                            "explanation": "这是一道基础减法运算题：10 - 4 = 6。",
-                            "knowledge_point": f"{grade}数学基础运算",
-                            "difficulty": difficulty_level
-                        },
-                        {
-                            "type": "fill",
-                            "content": "3 × 4 = ____",
-                            "answer": "12",
-                            "explanation": "这是一道基础乘法运算题：3 × 4 = 12。",
-                            "knowledge_point": f"{grade}数学乘法运算",
-                            "difficulty": difficulty_level
-                        }
-                    ]
-                elif question_type == 'solve':
-                    math_questions = [
-                        {
-                            "type": "solve",
-                            "content": "小明有5个苹果，妈妈又给了他3个苹果，请问小明现在一共有多少个苹果？",
-                            "answer": "8个苹果",
-                            "explanation": "解：小明原有5个苹果，妈妈又给了3个苹果，所以总数为：5 + 3 = 8个苹果。",
-                            "knowledge_point": f"{grade}数学应用题",
-                            "difficulty": difficulty_level
-                        },
-                        {
-                            "type": "solve",
-                            "content": "一个长方形的长是6厘米，宽是4厘米，求这个长方形的面积。",
-                            "answer": "24平方厘米",
-                            "explanation": "解：长方形面积 = 长 × 宽 = 6 × 4 = 24平方厘米。",
-                            "knowledge_point": f"{grade}数学几何",
-                            "difficulty": difficulty_level
-                        }
-                    ]
-                else:  # mixed
-                    math_questions = [
-                        {
-                            "type": "choice",
-                            "content": "计算：5 + 3 = ?",
-                            "options": ["6", "7", "8", "9"],
-                            "answer": "8",
-                            "explanation": "这是一道基础加法运算题：5 + 3 = 8。",
-                            "knowledge_point": f"{grade}数学基础运算",
-                            "difficulty": difficulty_level
-                        },
-                        {
-                            "type": "fill",
-                            "content": "10 - ____ = 6",
-                            "answer": "4",
-                            "explanation": "这是一道基础减法运算题：10 - 4 = 6。",
-                            "knowledge_point": f"{grade}数学基础运算",
-                            "difficulty": difficulty_level
-                        },
-                        {
-                            "type": "solve",
-                            "content": "小明有5个苹果，妈妈又给了他3个苹果，请问小明现在一共有多少个苹果？",
-                            "answer": "8个苹果",
-                            "explanation": "解：小明原有5个苹果，妈妈又给了3个苹果，所以总数为：5 + 3 = 8个苹果。",
-                            "knowledge_point": f"{grade}数学应用题",
-                            "difficulty": difficulty_level
-                        }
-                    ]
-                questions = math_questions[:question_count]
+                # 按年级生成常见的计算题，答案由程序计算
+                questions = local_question_generator.generate_fallback(
+                    subject, grade, question_type, question_count, difficulty_level
+                )
                 
             elif subject == "语文":
                 if question_type == 'choice':
@@ -891,9 +808,7 @@ async def photo_correction(request_data: dict):
         # 调用通义千问API（注意：实际应用中需要支持图片输入的多模态模型）
         try:
             # 由于当前使用的是文本模型，这里模拟图片识别结果
-            simulated_prompt = f"{prompt}
-
-[模拟图片识别结果：学生上传了一张包含{subject}题目的图片]"
+            simulated_prompt = f"{prompt}\n\n[模拟图片识别结果：学生上传了一张包含{subject}题目的图片]"
             
             ai_result = await call_tongyi_api(simulated_prompt)
             
@@ -1,13 +1,11 @@
 # 精准动态教辅系统 - 统一后端服务
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 import sys
 import os
 import httpx
 import json
-import dashscope
-from http import HTTPStatus
 from pydantic import BaseModel
 from typing import List, Dict, Union, Any
 
@@ -21,6 +19,11 @@ except ImportError:
 # --- 配置 ---
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
+from services.image_preprocess import image_preprocessor
+from services.vision_client import (
+    vision_client, default_vision_config, cancel_on_disconnect, ClientDisconnected
+)
+
 # 从环境变量获取API Key配置
 DASHSCOPE_API_KEY = os.getenv('DASHSCOPE_API_KEY')
 if not DASHSCOPE_API_KEY:
@@ -28,8 +31,6 @@ if not DASHSCOPE_API_KEY:
     print("Please set it in your .env file")
     DASHSCOPE_API_KEY = "your-api-key-not-set"
 
-dashscope.api_key = DASHSCOPE_API_KEY
-
 # 文本生成模型配置
 TEXT_AI_CONFIG = {
     "provider": "tongyi",
@@ -90,29 +91,32 @@ async def login(request_data: dict = None):
         "message": "登录成功"
     }
 
-# AI连通性测试 (新, 使用Dashscope SDK)
+# AI连通性测试
 @app.get("/api/ai/test-connection")
 async def test_connection():
     try:
-        print("--- 正在测试 qwen-vl-max 连通性 (SDK) ---")
+        print("--- 正在测试 qwen-vl-max 连通性 ---")
         messages = [{'role': 'user', 'content': [{'text': "你好，请回复'连接正常'以确认连接。"}]}]
-        response = dashscope.MultiModalConversation.call(model='qwen-vl-max', messages=messages)
-        if response.status_code == HTTPStatus.OK:
+        result = await vision_client.call(messages, default_vision_config(DASHSCOPE_API_KEY), timeout=30)
+        if result['success']:
             print("✅ 连通性测试成功")
-            return {"success": True, "status": "success", "message": "qwen-vl-max 模型连通正常 (SDK)"}
+            return {"success": True, "status": "success", "message": "qwen-vl-max 模型连通正常"}
         else:
-            print(f"❌ 连通性测试失败: {response.code} - {response.message}")
-            raise HTTPException(status_code=500, detail=f"API返回错误: {response.code} - {response.message}")
+            print(f"❌ 连通性测试失败: {result['error']}")
+            raise HTTPException(status_code=500, detail=f"API返回错误: {result['error']}")
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ 连通性测试异常: {str(e)}")
         raise HTTPException(status_code=500, detail=f"连接测试时发生异常: {str(e)}")
 
-# AI拍照批阅 (新, 使用Dashscope SDK)
+# AI拍照批阅
 @app.post("/api/ai/photo-correction")
-async def photo_correction(request: PhotoCorrectionRequest):
+async def photo_correction(request: PhotoCorrectionRequest, http_request: Request):
     try:
         print(f"📸 收到批阅请求, 类型: {request.type}, 配置: {request.config}, 图片数据长度: {len(request.image)}")
-        image_data = request.image
+        image_data, preprocess_info = await image_preprocessor.prepare(request.image)
+        print(f"🗜️ 图片预处理: {preprocess_info}")
         prompt = "你是一位经验丰富的AI辅导老师..." # 省略详细prompt
         if request.type == "homework":
             prompt = """你是一位经验丰富的AI辅导老师，请仔细分析这张作业图片，进行智能批阅。返回结果必须严格遵循以下JSON格式：{"corrections": [{"question": "...", "student_answer": "...", "correct_answer": "...", "is_correct": false, "explanation": "...", "knowledge_points": ["..."]}], "overall_summary": "..."}"""
@@ -121,12 +125,15 @@ async def photo_correction(request: PhotoCorrectionRequest):
 
         messages = [{"role": "user", "content": [{"image": image_data}, {"text": prompt}]}]
         
-        print("📡 正在通过 Dashscope SDK 调用 qwen-vl-max API...")
-        response = dashscope.MultiModalConversation.call(model='qwen-vl-max', messages=messages)
+        print("📡 正在调用 qwen-vl-max API...")
+        # 异步调用，不阻塞其他用户的请求；客户端断开时取消调用
+        result = await cancel_on_disconnect(
+            http_request, vision_client.call(messages, default_vision_config(DASHSCOPE_API_KEY))
+        )
         
-        if response.status_code == HTTPStatus.OK:
-            print("✅ API 调用成功")
-            ai_response_text = response.output.choices[0].message.content[0]['text']
+        if result['success']:
+            print(f"✅ API 调用成功，耗时 {result['response_time']:.1f} 秒")
+            ai_response_text = result['content']
             print(f"🤖 AI 原始回复: {ai_response_text[:300]}...")
             try:
                 json_str = ai_response_text.split("```json")[1].split("```")[0].strip() if "```json" in ai_response_text else ai_response_text
@@ -136,9 +143,14 @@ async def photo_correction(request: PhotoCorrectionRequest):
                 print(f"❌ AI响应JSON解析失败: {e}")
                 return {"success": False, "result": {"error_summary": "AI响应不是有效的JSON格式。", "raw_response": ai_response_text}}
         else:
-            error_msg = f"Dashscope API 调用失败: {response.code} - {response.message}"
+            error_msg = f"Dashscope API 调用失败: {result['error']}"
             print(f"❌ {error_msg}")
-            raise HTTPException(status_code=500, detail=error_msg)
+            raise HTTPException(status_code=504 if result.get('timeout') else 500, detail=error_msg)
+    except ClientDisconnected:
+        print("🔌 客户端已断开，批阅已取消")
+        raise HTTPException(status_code=499, detail="客户端已断开")
+    except HTTPException:
+        raise
     except Exception as e:
         error_msg = f"服务器内部错误: {str(e)}"
         print(f"❌ {error_msg}")
@@ -177,5 +189,18 @@ async def generate_exercise(request_data: dict):
         print(f"❌ AI题目生成失败，使用备用题目: {e}")
         return {"success": True, "questions": [{"content": "备用题：1+1=?", "answer": "2"}], "ai_powered": False}
 
+@app.get("/api/ai/image-preprocess-stats")
+async def image_preprocess_stats():
+    return image_preprocessor.get_stats()
+
+@app.get("/api/ai/vision-stats")
+async def vision_stats():
+    return vision_client.get_stats()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    image_preprocessor.shutdown()
+    await vision_client.close()
+
 if __name__ == "__main__":
     uvicorn.run("simple_app_vision:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
@@ -0,0 +1,120 @@
+import os
+import time
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import func, cast, Integer
+
+from database.models import AICallLog
+from services.ai_analytics import (
+    LATENCY_BUCKETS, rebuild_rollups, total_aggregate, window_stats, summarize, local_period_start
+)
+
+
+@pytest.fixture
+def shanghai_tz():
+    """本地时区固定为 UTC+8，本地零点对应 UTC 前一天 16:00"""
+    previous = os.environ.get("TZ")
+    os.environ["TZ"] = "Asia/Shanghai"
+    time.tzset()
+    yield
+    if previous is None:
+        del os.environ["TZ"]
+    else:
+        os.environ["TZ"] = previous
+    time.tzset()
+
+
+def add_logs(db, start: datetime, hours: float, count: int, seed: int = 7):
+    rng = random.Random(seed)
+    for _ in range(count):
+        db.add(AICallLog(
+            user_id=1,
+            model_name=rng.choice(["qwen-plus", "qwen-max"]),
+            function_type=rng.choice(["generate_exercise", "analyze_error"]),
+            prompt_tokens=rng.randint(10, 500),
+            completion_tokens=rng.randint(10, 900),
+            total_tokens=0,
+            response_time=rng.choice([rng.uniform(0.05, 3), rng.uniform(3, 40), rng.uniform(100, 200)]),
+            success=rng.random() > 0.1,
+            created_at=start + timedelta(seconds=rng.uniform(0, hours * 3600))
+        ))
+    db.commit()
+
+
+def direct_aggregate(db, since=None):
+    query = db.query(
+        func.count(AICallLog.id),
+        func.sum(cast(AICallLog.success, Integer)),
+        func.sum(AICallLog.prompt_tokens),
+        func.sum(AICallLog.completion_tokens),
+        func.sum(AICallLog.response_time)
+    )
+    times_query = db.query(AICallLog.response_time)
+    if since is not None:
+        query = query.filter(AICallLog.created_at >= since)
+        times_query = times_query.filter(AICallLog.created_at >= since)
+    calls, successes, prompt, completion, response_time = query.one()
+    times = sorted(value for (value,) in times_query)
+    return calls, successes, prompt, completion, response_time, times
+
+
+def bucket_bounds(seconds: float):
+    for i, upper in enumerate(LATENCY_BUCKETS):
+        if seconds <= upper:
+            return (LATENCY_BUCKETS[i - 1] if i else 0.0), upper
+    return LATENCY_BUCKETS[-1], LATENCY_BUCKETS[-1]
+
+
+def assert_matches_direct(agg, direct):
+    calls, successes, prompt, completion, response_time, times = direct
+    assert agg["call_count"] == calls
+    assert agg["success_count"] == successes
+    assert agg["prompt_tokens"] == prompt
+    assert agg["completion_tokens"] == completion
+    assert agg["total_response_time"] == pytest.approx(response_time)
+    assert sum(agg["latency_histogram"]) == calls
+    summary = summarize(agg)
+    for q, key in ((0.50, "p50_ms"), (0.95, "p95_ms"), (0.99, "p99_ms")):
+        exact = times[max(0, int(q * len(times) + 0.5) - 1)]
+        lower, upper = bucket_bounds(exact)
+        # 直方图只能确定分位数所在的区间
+        assert lower * 1000 - 1 <= summary[key] <= upper * 1000 + 1
+
+
+def test_rollup_totals_match_direct_aggregate(db):
+    add_logs(db, datetime(2024, 5, 1, 10), hours=72, count=400)
+    assert rebuild_rollups(db) == 400
+    direct = direct_aggregate(db)
+    for granularity in ("minute", "hour", "day"):
+        assert_matches_direct(total_aggregate(db, granularity), direct)
+
+
+def test_window_stats_match_direct_aggregate(db):
+    now = datetime(2024, 5, 3, 12, 30)
+    add_logs(db, now - timedelta(hours=30), hours=30, count=300)
+    rebuild_rollups(db)
+    stats = window_stats(db, "24h", now=now)
+    since = datetime.fromisoformat(stats["since"])
+    calls, successes = direct_aggregate(db, since)[:2]
+    assert stats["overall"]["calls"] == calls
+    assert stats["overall"]["successes"] == successes
+    assert sum(item["calls"] for item in stats["by_model_function"]) == calls
+
+
+def test_local_day_window_crosses_utc_day_boundary(db, shanghai_tz):
+    # 本地 2024-05-02 08:30，今日起点为本地 05-02 00:00 = UTC 05-01 16:00
+    now = datetime(2024, 5, 2, 0, 30, tzinfo=timezone.utc)
+    since = local_period_start("day", now)
+    assert since == datetime(2024, 5, 1, 16, 0)
+
+    add_logs(db, datetime(2024, 5, 1, 12), hours=12, count=200)
+    rebuild_rollups(db)
+    direct = direct_aggregate(db, since)
+    assert 0 < direct[0] < 200
+    assert_matches_direct(total_aggregate(db, "hour", since), direct)
+
+    month_start = local_period_start("month", now)
+    assert month_start == datetime(2024, 4, 30, 16, 0)
+    assert total_aggregate(db, "hour", month_start)["call_count"] == 200
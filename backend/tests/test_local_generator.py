@@ -0,0 +1,133 @@
+import random
+import re
+from fractions import Fraction
+
+import pytest
+
+from services.local_generator import (
+    TOPICS, CHOICE_LETTERS, LocalQuestionGenerator, match_topic, parse_grade
+)
+
+SEEDS = range(200)
+TOPIC_NAMES = [topic.name for topic in TOPICS]
+
+# 各模板覆盖的年级与难度组合，含知识点中的提示词
+CASES = [(grade, difficulty, hint) for grade in (1, 3, 4, 6) for difficulty in (1, 3, 5)
+         for hint in ("", "进位加法", "有余数的除法", "分数减法", "分数乘法")]
+
+
+def _evaluate(expression: str, x: Fraction = None) -> Fraction:
+    """按 Fraction 精确计算题目中的算式，x 为方程的未知数"""
+    text = expression.replace("×", "*").replace("÷", "/")
+    text = re.sub(r"(\d)(?=[x(])", r"\1*", text)
+    text = re.sub(r"\d+(?:\.\d+)?", lambda m: f"Fraction('{m.group()}')", text)
+    return eval(text, {"Fraction": Fraction, "x": x})
+
+
+def _check_answer(topic_name: str, expression: str, answer: str):
+    if topic_name == "equation":
+        left, right = expression.split("=")
+        x = Fraction(answer)
+        assert _evaluate(left, x) == _evaluate(right, x), (expression, answer)
+    elif "……" in answer:
+        quotient, remainder = (int(part) for part in answer.split("……"))
+        dividend, divisor = (int(part) for part in expression.split("÷"))
+        assert divmod(dividend, divisor) == (quotient, remainder), (expression, answer)
+    else:
+        assert _evaluate(expression) == Fraction(answer), (expression, answer)
+
+
+@pytest.mark.parametrize("topic", TOPICS, ids=TOPIC_NAMES)
+def test_answers_are_arithmetically_correct(topic):
+    for seed in SEEDS:
+        grade, difficulty, hint = CASES[seed % len(CASES)]
+        grade = min(max(grade, topic.grades[0]), topic.grades[1])
+        problem = topic.generator(random.Random(seed), grade, difficulty, hint)
+        _check_answer(topic.name, problem.expression, problem.answer)
+        assert problem.answer not in problem.distractors
+
+
+@pytest.mark.parametrize("topic", TOPICS, ids=TOPIC_NAMES)
+def test_fill_answers_complete_the_equation(topic):
+    for seed in SEEDS:
+        problem = topic.generator(random.Random(seed), topic.default_grade, 3, "")
+        if problem.fill is None or "……" in problem.answer or topic.name == "equation":
+            continue
+        content, answer = problem.fill
+        left, right = content.replace("____", answer).split("=")
+        assert _evaluate(left) == _evaluate(right), (content, answer)
+
+
+@pytest.mark.parametrize("point, expected", [
+    ("加法", "addition"),
+    ("20以内的退位减法", "subtraction"),
+    ("三年级两位数进位加法", "addition"),
+    ("有余数的除法", "division"),
+    ("表内乘法", "multiplication"),
+    ("乘法口诀", "multiplication"),
+    ("100以内加减法", "add_sub"),
+    ("异分母分数加减法", "fraction"),
+    ("分数加减法练习", "fraction"),
+    ("小数加法计算", "decimal"),
+    ("四则混合运算", "mixed"),
+    ("解简易方程", "equation"),
+])
+def test_match_topic_exact_names(point, expected):
+    assert match_topic(point).name == expected
+
+
+@pytest.mark.parametrize("point", [
+    "计算",
+    "圆的面积计算",
+    "长方形周长",
+    "百分数加减法",
+    "分数的意义",
+    "分数大小比较",
+    "二元一次方程组",
+    "认识乘法",
+    "乘法分配律",
+    "加法交换律",
+    "用乘法解决问题",
+    "小数乘法",
+    "分数除法",
+    "时间单位换算",
+])
+def test_match_topic_ignores_substrings(point):
+    assert match_topic(point) is None
+
+
+def test_unsupported_point_falls_back_to_model():
+    generator = LocalQuestionGenerator()
+    assert generator.generate("数学", "三年级", ["加法", "圆的面积计算"], "choice", 5) is None
+    assert generator.generate("语文", None, ["加法"], "choice", 5) is None
+    # 年级超出模板适用范围
+    assert generator.generate("数学", "一年级", ["解方程"], "fill", 5) is None
+    assert parse_grade("初一") == 7
+
+
+_STEM_PATTERNS = [re.compile(r"^计算：(.+) = \?$"), re.compile(r"^方程 (.+) 的解是（  ）$"),
+                  re.compile(r"^(.+) 的结果是（  ）$")]
+
+
+def _option_value(option: str):
+    option = option[len("x = "):] if option.startswith("x = ") else option
+    return option if "……" in option else Fraction(option)
+
+
+@pytest.mark.parametrize("topic", TOPICS, ids=TOPIC_NAMES)
+def test_choice_options_contain_answer_exactly_once(topic):
+    generator = LocalQuestionGenerator()
+    planned = [(topic, topic.label)]
+    for seed in range(20):
+        questions = generator._generate(planned, None, "choice", 10, seed % 5 + 1, seed)
+        assert questions
+        for question in questions:
+            options = question["options"]
+            assert len(options) == 4
+            correct = options[CHOICE_LETTERS.index(question["answer"])]
+            expression = next(m.group(1) for m in (p.match(question["content"]) for p in _STEM_PATTERNS) if m)
+            _check_answer(topic.name, expression, correct[len("x = "):] if topic.name == "equation" else correct)
+            # 数值相等的写法（如 2/4 与 1/2）也只能出现一次
+            values = [_option_value(option) for option in options]
+            assert values.count(_option_value(correct)) == 1, options
+            assert len(set(values)) == 4, options
@@ -0,0 +1,58 @@
+from services.near_duplicate import (
+    LSH_BANDS, NearDuplicateIndex, decode_signature, encode_signature, estimated_similarity, signature
+)
+
+ORIGINAL = "小明有12个苹果，吃了5个，还剩几个苹果？"
+
+
+def index_of(*texts) -> NearDuplicateIndex:
+    index = NearDuplicateIndex()
+    for i, text in enumerate(texts):
+        index.add(i, signature(text))
+    return index
+
+
+def test_reworded_duplicate_with_same_numbers_is_caught():
+    index = index_of(ORIGINAL, "计算：35 × 4 = ____")
+    for reworded in (
+        "小明有12个苹果，他吃了5个，还剩几个苹果?",
+        "小明有 12 个苹果，吃了 5 个。还剩几个苹果",
+        "小明有12个苹果，吃掉了5个，还剩几个苹果？",
+    ):
+        assert index.find(signature(reworded)) == 0, reworded
+
+
+def test_same_text_with_different_numbers_is_not_duplicate():
+    index = index_of(ORIGINAL)
+    variant = "小明有15个苹果，吃了7个，还剩几个苹果？"
+    assert estimated_similarity(signature(ORIGINAL)[0], signature(variant)[0]) >= index.threshold
+    assert not index.contains(signature(variant))
+
+
+def test_unrelated_question_is_not_duplicate():
+    index = index_of(ORIGINAL)
+    assert not index.contains(signature("一本故事书有12页，小红读了5页，还有几页没读？"))
+
+
+def test_bucket_count_stays_bounded():
+    index = NearDuplicateIndex()
+    texts = [f"小明有{n}个苹果，吃了{n % 7 + 1}个，还剩几个苹果？" for n in range(10, 310)]
+    for i, text in enumerate(texts):
+        index.add(i, signature(text))
+    # 重复加入同一个键不会增加桶中的条目
+    for i, text in enumerate(texts[:50]):
+        index.add(i, signature(text))
+
+    assert len(index) == len(texts)
+    assert len(index._buckets) == LSH_BANDS
+    for band in index._buckets:
+        assert len(band) <= len(texts)
+        assert sum(len(keys) for keys in band.values()) == len(texts)
+    # 同型题的签名大量落入相同的桶，桶数明显少于条目数
+    assert sum(len(band) for band in index._buckets) < LSH_BANDS * len(texts)
+
+
+def test_signature_round_trip():
+    sig = signature("3.5 + 2 = ____")
+    assert decode_signature(encode_signature(sig)) == sig
+    assert decode_signature(encode_signature(signature(""))) == signature("")
@@ -0,0 +1,80 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlalchemy.orm import sessionmaker
+
+from database.models import Exercise, ExerciseDemand, User, UserRole
+from services import pregeneration
+from services.pregeneration import PregenerationPool, combo_key
+
+
+def _user(db):
+    user = User(username="teacher", email="t@example.com", real_name="老师",
+                hashed_password="x", role=UserRole.teacher)
+    db.add(user)
+    db.commit()
+    return user
+
+
+def _exercise(db, user, points, days_ago=0, subject="数学", question_type="choice", count=5):
+    questions = [{"content": f"题目{i}", "knowledge_point": points[i % len(points)]} for i in range(count)]
+    db.add(Exercise(
+        user_id=user.id, title="练习", subject=subject, question_type=question_type,
+        question_count=count, difficulty_level=1, generated_content={"questions": questions},
+        created_at=datetime.utcnow() - timedelta(days=days_ago)
+    ))
+    db.commit()
+
+
+def test_seed_groups_recent_exercises(db):
+    user = _user(db)
+    for _ in range(3):
+        _exercise(db, user, ["分数加法", "分数减法"])
+    _exercise(db, user, ["分数减法", "分数加法"], days_ago=1)
+    _exercise(db, user, ["一元一次方程"], question_type="fill")
+    _exercise(db, user, ["很久以前"], days_ago=pregeneration.PREGEN_SEED_DAYS + 1)
+
+    pool = PregenerationPool()
+    assert pool.seed_demand(db) == 2
+
+    rows = {row.combo_key: row for row in db.query(ExerciseDemand)}
+    fractions = rows[combo_key("数学", None, ["分数减法", "分数加法"], "choice", 5, 1)]
+    assert fractions.request_count == 4
+    assert fractions.knowledge_points == ["分数减法", "分数加法"]
+    # 一天前的记录按半衰期衰减后计入
+    assert 3.5 < fractions.score < 4
+    assert rows[combo_key("数学", None, ["一元一次方程"], "fill", 5, 1)].request_count == 1
+    assert all("很久以前" not in row.knowledge_points for row in rows.values())
+
+
+def test_seed_runs_once_and_skips_existing_demand(db):
+    user = _user(db)
+    _exercise(db, user, ["分数加法"])
+
+    pool = PregenerationPool()
+    assert pool.seed_demand(db) == 1
+    assert pool.seed_demand(db) == 0
+    # 新进程启动时热度表已有数据，不再重复估算
+    assert PregenerationPool().seed_demand(db) == 0
+    assert db.query(ExerciseDemand).count() == 1
+    assert db.query(ExerciseDemand).one().request_count == 1
+
+
+def test_seeded_demand_is_planned_in_first_cycle(db, monkeypatch):
+    user = _user(db)
+    for _ in range(int(pregeneration.PREGEN_MIN_SCORE) + 1):
+        _exercise(db, user, ["分数加法"])
+
+    pool = PregenerationPool()
+    pool._session_factory = sessionmaker(bind=db.get_bind())
+    planned = []
+
+    async def fake_replenish(session):
+        planned.extend(pool._plan(session))
+        return 0
+
+    monkeypatch.setattr(pool, "replenish", fake_replenish)
+    asyncio.run(pool.run_cycle(force=True))
+
+    assert [demand.knowledge_points for demand, _ in planned] == [["分数加法"]]
+    assert planned[0][1] == pregeneration.PREGEN_POOL_SIZE
@@ -0,0 +1,29 @@
+from database.models import QuestionBankItem
+from services.question_bank import QuestionBank
+
+
+def fill(content, knowledge_point):
+    return {"type": "fill", "content": content, "answer": "1", "knowledge_point": knowledge_point}
+
+
+def test_ingest_files_items_under_requested_knowledge_points(db):
+    bank = QuestionBank()
+    questions = [
+        fill("计算：3/4 + 1/4 = ____", "同分母分数加法"),
+        fill("一个长方形长5厘米宽3厘米，面积是多少？", "长方形面积"),
+        fill("0.5 + 0.25 = ____", "小数加法"),
+    ]
+    added = bank.ingest(db, questions, "数学", "五年级", ["分数加法", "小数加法"], "fill", 2)
+    assert added == 2
+    assert bank.stats["unmatched"] == 1
+    assert sorted(item.knowledge_point for item in db.query(QuestionBankItem)) == ["分数加法", "小数加法"]
+
+    drawn = bank.draw(db, "数学", "五年级", ["分数加法"], "fill", 2, 5)
+    assert [q["content"] for q in drawn] == ["计算：3/4 + 1/4 = ____"]
+
+
+def test_single_requested_knowledge_point_takes_unlabeled_questions(db):
+    bank = QuestionBank()
+    added = bank.ingest(db, [fill("计算：12 + 9 = ____", "")], "数学", "二年级", ["进位加法"], "fill", 1)
+    assert added == 1
+    assert db.query(QuestionBankItem).one().knowledge_point == "进位加法"
@@ -0,0 +1,99 @@
+import math
+
+import pytest
+
+from services.near_duplicate import NearDuplicateIndex, question_signature
+from services.question_utils import (
+    FANOUT_CHUNK_SIZE, MAX_QUESTION_COUNT, MIXED_TYPES, chunk_capacity, estimate_max_tokens,
+    merge_question_sets, parse_questions, plan_exercise_chunks, FANOUT_MAX_TOKENS
+)
+
+POINTS = ["加法", "减法", "乘法", "除法", "分数", "小数", "方程", "面积"]
+
+
+def capacity(question_type):
+    types = MIXED_TYPES if question_type == "mixed" else [question_type]
+    return min(chunk_capacity(t) for t in types)
+
+
+def counts_under_test(question_type):
+    cap = capacity(question_type)
+    # 1 题、刚好一组、刚超过一组（开始拆分）、50 题、上限
+    return [1, cap, cap + 1, 50, MAX_QUESTION_COUNT]
+
+
+@pytest.mark.parametrize("question_type", ["choice", "fill", "solve", "mixed"])
+def test_chunk_counts_scale_with_question_count(question_type):
+    cap = capacity(question_type)
+    for count in counts_under_test(question_type):
+        chunks = plan_exercise_chunks(POINTS[:3], question_type, count)
+        assert len(chunks) == math.ceil(count / cap), count
+        assert sum(chunk.question_count for chunk in chunks) == count
+        assert all(1 <= chunk.question_count <= cap for chunk in chunks)
+        # 每组的估算输出都在 max_tokens 上限内
+        assert all(estimate_max_tokens(chunk.question_type, chunk.question_count) <= FANOUT_MAX_TOKENS
+                   for chunk in chunks)
+
+
+def test_single_chunk_keeps_request_unchanged():
+    chunks = plan_exercise_chunks(POINTS[:2], "mixed", 1)
+    assert len(chunks) == 1
+    assert chunks[0].question_type == "mixed"
+    assert chunks[0].knowledge_points == POINTS[:2]
+
+
+def test_chunks_cover_every_knowledge_point_and_rotate_types():
+    chunks = plan_exercise_chunks(POINTS, "mixed", 50)
+    covered = {point for chunk in chunks for point in chunk.knowledge_points}
+    assert covered == set(POINTS)
+    assert [chunk.question_type for chunk in chunks[:3]] == MIXED_TYPES
+    assert [chunk.index for chunk in chunks] == list(range(len(chunks)))
+    assert all(chunk.total == len(chunks) for chunk in chunks)
+
+
+def test_chunk_sizes_differ_by_at_most_one():
+    counts = [chunk.question_count for chunk in plan_exercise_chunks(POINTS, "choice", 50)]
+    assert max(counts) - min(counts) <= 1
+    assert FANOUT_CHUNK_SIZE >= max(counts)
+
+
+def question(content, answer="1"):
+    return {"type": "fill", "content": content, "answer": answer}
+
+
+def test_merge_dedupes_and_keeps_exactly_count():
+    first = [question(f"计算：{n} + {n + 3} = ____") for n in range(10, 16)]
+    second = [
+        question("计算：10 + 13 = ____"),          # 完全重复
+        question("计算 10 + 13 =  ____ 。"),       # 仅标点空白不同
+        question("计算：12 × 4 = ____"),
+        question("计算：13 × 4 = ____"),
+        {"type": "fill", "content": "", "answer": ""},
+    ]
+    merged = merge_question_sets([first, second], limit=7)
+    assert len(merged) == 7
+    assert [q["id"] for q in merged] == list(range(1, 8))
+    contents = [q["content"] for q in merged]
+    assert contents[:6] == [q["content"] for q in first]
+    assert contents[6] == "计算：12 × 4 = ____"
+
+
+def test_merge_without_limit_keeps_all_unique_and_does_not_mutate_input():
+    source = [question("计算：7 + 8 = ____"), question("计算：7 + 8 = ____"), question("计算：7 + 9 = ____")]
+    merged = merge_question_sets([source])
+    assert len(merged) == 2
+    assert "id" not in source[0]
+
+
+def test_merge_skips_questions_from_student_history():
+    done = question("计算：25 + 17 = ____")
+    history = NearDuplicateIndex()
+    history.add(1, question_signature(done))
+    merged = merge_question_sets([[done, question("计算：26 + 17 = ____")]], limit=5, history=history)
+    assert [q["content"] for q in merged] == ["计算：26 + 17 = ____"]
+
+
+def test_parse_questions_keeps_complete_questions_from_truncated_output():
+    content = '{"questions": [{"content": "1+1", "answer": "2"}, {"content": "2+'
+    assert parse_questions(content) == [{"content": "1+1", "answer": "2"}]
+    assert parse_questions("not json") is None
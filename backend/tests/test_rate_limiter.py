@@ -0,0 +1,131 @@
+import time
+import asyncio
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from database.models import User
+from services.model_registry import ModelSnapshot
+from services.rate_limiter import (
+    ModelLimiter, RateLimiter, DEFAULT_RATE_LIMIT_OPTIONS, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND,
+    RateLimitExceeded, parse_retry_after, tenant_key
+)
+
+
+def make_limiter(**overrides) -> ModelLimiter:
+    options = {**DEFAULT_RATE_LIMIT_OPTIONS, "requests_per_minute": 60000, "burst": 100,
+               "max_concurrency": 1, **overrides}
+    return ModelLimiter("test-model", options)
+
+
+async def admission_order(limiter: ModelLimiter, requests):
+    """先占满并发，再按给定顺序排队，返回放行顺序"""
+    order = []
+    await limiter.acquire(PRIORITY_INTERACTIVE, "holder")
+
+    async def request(label, priority, tenant):
+        await limiter.acquire(priority, tenant)
+        order.append(label)
+        await asyncio.sleep(0)
+        limiter.release()
+
+    tasks = []
+    for label, priority, tenant in requests:
+        tasks.append(asyncio.create_task(request(label, priority, tenant)))
+        await asyncio.sleep(0)
+    limiter.release()
+    await asyncio.gather(*tasks)
+    return order
+
+
+def test_interactive_requests_jump_background_queue():
+    order = asyncio.run(admission_order(make_limiter(), [
+        ("bg1", PRIORITY_BACKGROUND, "user:1"),
+        ("bg2", PRIORITY_BACKGROUND, "user:2"),
+        ("ui", PRIORITY_INTERACTIVE, "user:3"),
+    ]))
+    assert order == ["ui", "bg1", "bg2"]
+
+
+def test_round_robin_between_tenants():
+    order = asyncio.run(admission_order(make_limiter(), [
+        ("a1", PRIORITY_INTERACTIVE, "institution:一中"),
+        ("a2", PRIORITY_INTERACTIVE, "institution:一中"),
+        ("a3", PRIORITY_INTERACTIVE, "institution:一中"),
+        ("b1", PRIORITY_INTERACTIVE, "user:9"),
+        ("c1", PRIORITY_INTERACTIVE, "institution:二中"),
+    ]))
+    assert order == ["a1", "b1", "c1", "a2", "a3"]
+
+
+def test_throttle_pauses_admission_for_retry_after():
+    async def scenario():
+        limiter = make_limiter(max_concurrency=4)
+        limiter.throttle(0.2)
+        assert limiter.tokens == 0
+        started = time.monotonic()
+        await limiter.acquire(PRIORITY_INTERACTIVE, "user:1")
+        return time.monotonic() - started, limiter.stats["throttled"]
+
+    waited, throttled = asyncio.run(scenario())
+    assert waited >= 0.19
+    assert throttled == 1
+
+
+def test_queue_full_rejects_with_retry_after():
+    async def scenario():
+        limiter = make_limiter(max_queue=1)
+        await limiter.acquire(PRIORITY_INTERACTIVE, "user:1")
+        waiter = asyncio.create_task(limiter.acquire(PRIORITY_INTERACTIVE, "user:2"))
+        await asyncio.sleep(0)
+        with pytest.raises(RateLimitExceeded) as excinfo:
+            await limiter.acquire(PRIORITY_INTERACTIVE, "user:3")
+        limiter.release()
+        await waiter
+        return excinfo.value.retry_after
+
+    assert asyncio.run(scenario()) > 0
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("7") == 7.0
+    assert parse_retry_after("-3") == 0.0
+    assert parse_retry_after("99999") == 300.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
+    later = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+    assert 25 <= parse_retry_after(later) <= 30
+
+
+def test_tenant_key_prefers_institution():
+    assert tenant_key(5, "实验小学") == "institution:实验小学"
+    assert tenant_key(5, "  ") == "user:5"
+    assert tenant_key(5, None) == "user:5"
+
+
+def test_upstream_429_throttles_model_and_uses_institution_tenant(db, monkeypatch):
+    from services import ai_service as module
+
+    db.add_all([
+        User(id=1, username="a", email="a@x", real_name="甲", hashed_password="x", school="实验小学"),
+        User(id=2, username="b", email="b@x", real_name="乙", hashed_password="x"),
+    ])
+    db.commit()
+    limiter = RateLimiter()
+    monkeypatch.setattr(module, "rate_limiter", limiter)
+    model = ModelSnapshot(id=1, model_name="tongyi", display_name="通义", api_endpoint="https://x", api_key="k")
+
+    async def fake_call(model_config, messages, function_type, user_id):
+        return {"success": False, "status": 429, "retry_after": 12.0, "error": "rate limited"}
+
+    service = module.AIService(db)
+    monkeypatch.setattr(service, "call_tongyi_api", fake_call)
+    assert service.tenant_for(1) == "institution:实验小学"
+    assert service.tenant_for(2) == "user:2"
+
+    result = asyncio.run(service._dispatch_model_call(model, [], "generate_exercise", 1))
+    assert result["status"] == 429
+    stats = limiter.get_stats()["tongyi"]
+    assert stats["throttled"] == 1
+    assert 11 <= stats["paused_for"] <= 12
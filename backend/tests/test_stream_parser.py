@@ -0,0 +1,64 @@
+import json
+
+from services.stream_parser import IncrementalQuestionParser
+
+
+QUESTIONS = [
+    {"id": 1, "type": "fill", "content": "计算：12 + 7 = ____", "answer": "19"},
+    {"id": 2, "type": "choice", "content": "下列说法正确的是（  ）",
+     "options": {"A": "1", "B": "2"}, "answer": "B"},
+]
+
+
+def feed_in_chunks(parser, text, size):
+    parsed = []
+    for start in range(0, len(text), size):
+        parsed.extend(parser.feed(text[start:start + size]))
+    return parsed
+
+
+def test_questions_split_across_deltas():
+    text = json.dumps({"title": "练习", "questions": QUESTIONS}, ensure_ascii=False)
+    for size in (1, 3, 7, len(text)):
+        assert feed_in_chunks(IncrementalQuestionParser(), text, size) == QUESTIONS
+
+
+def test_question_emitted_as_soon_as_object_closes():
+    parser = IncrementalQuestionParser()
+    first = json.dumps(QUESTIONS[0], ensure_ascii=False)
+    assert parser.feed('{"questions": [' + first[:-1]) == []
+    assert parser.feed("}") == [QUESTIONS[0]]
+    assert parser.feed(", {") == []
+
+
+def test_escaped_quotes_and_braces_inside_strings():
+    question = {"content": '他说："答案是 {x}" \\ 还有 } 和 ]', "answer": "{1}"}
+    text = json.dumps({"questions": [question, QUESTIONS[0]]}, ensure_ascii=False)
+    assert feed_in_chunks(IncrementalQuestionParser(), text, 2) == [question, QUESTIONS[0]]
+
+
+def test_truncated_final_object_is_not_emitted():
+    text = json.dumps({"questions": QUESTIONS}, ensure_ascii=False)
+    truncated = text[:text.rindex('"answer"')]
+    parser = IncrementalQuestionParser()
+    assert feed_in_chunks(parser, truncated, 5) == [QUESTIONS[0]]
+    assert parser.feed("") == []
+
+
+def test_malformed_object_is_skipped():
+    parser = IncrementalQuestionParser()
+    text = '{"questions": [{"content": 1,}, ' + json.dumps(QUESTIONS[0], ensure_ascii=False) + "]}"
+    assert parser.feed(text) == [QUESTIONS[0]]
+
+
+def test_line_comments_copied_from_prompt_are_skipped():
+    parser = IncrementalQuestionParser()
+    text = '{"questions": [ // 示例\n' + json.dumps(QUESTIONS[0], ensure_ascii=False) + "]}"
+    assert feed_in_chunks(parser, text, 1) == [QUESTIONS[0]]
+
+
+def test_custom_array_key_and_content_after_array_ignored():
+    parser = IncrementalQuestionParser(array_key="corrections")
+    text = '{"corrections": [{"question": "1+1", "is_correct": true}], "extra": [{"x": 1}]}'
+    assert parser.feed(text) == [{"question": "1+1", "is_correct": True}]
+    assert parser.feed('{"y": 2}') == []
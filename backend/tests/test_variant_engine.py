@@ -0,0 +1,136 @@
+import random
+from fractions import Fraction
+
+import pytest
+
+from services.variant_engine import VariantEngine, arithmetic_steps, find_numbers
+
+
+def _value(text: str) -> Fraction:
+    numbers = find_numbers(text)
+    assert len(numbers) == 1, text
+    return numbers[0][2]
+
+
+def _variants(engine, template, count=30):
+    variants = [engine.instantiate(template, random.Random(seed)) for seed in range(count)]
+    assert any(variants)
+    return [variant for variant in variants if variant]
+
+
+def _slot_values(content: str):
+    return [number[2] for number in find_numbers(content)]
+
+
+def test_template_from_explanation():
+    engine = VariantEngine()
+    question = {"type": "solve", "content": "小明有24个苹果，又买了15个，现在一共有多少个苹果？",
+                "answer": "39个", "explanation": "24+15=39（个）"}
+    template = engine.extract(question)
+    assert template.method == "explanation"
+    assert [slot.value for slot in template.slots] == [24, 15]
+
+    for variant in _variants(engine, template):
+        a, b = _slot_values(variant["content"])
+        assert (a, b) != (24, 15)
+        assert variant["answer"] == f"{a + b}个"
+        # 讲解中的算式同步换数
+        assert variant["explanation"] == f"{a}+{b}={a + b}（个）"
+        assert "小明" not in variant["content"]
+
+
+def test_template_from_search_without_explanation():
+    engine = VariantEngine()
+    question = {"type": "fill", "content": "一本书有120页，每天看8页，____天能看完。", "answer": "15"}
+    template = engine.extract(question)
+    assert template.method == "search"
+
+    for variant in _variants(engine, template):
+        pages, per_day = _slot_values(variant["content"])
+        # 原题整除，变式也必须整除
+        assert pages % per_day == 0
+        assert variant["answer"] == str(pages // per_day)
+        assert variant["explanation"].startswith("列式：")
+
+
+def test_search_rejects_ambiguous_expression():
+    # 12 + 12 与 12 × 2 都无法唯一确定（重复数字不参与穷举）
+    question = {"type": "fill", "content": "两个班各有12人，一共有____人。", "answer": "24"}
+    assert VariantEngine().extract(question) is None
+
+
+def test_choice_distractors_fall_back_to_answer_difference():
+    engine = VariantEngine()
+    question = {"type": "choice", "content": "一箱苹果有48个，平均分给6个班，每班分到几个？",
+                "options": ["A. 7", "B. 8", "C. 9", "D. 10"], "answer": "B",
+                "explanation": "48÷6=8（个）"}
+    template = engine.extract(question)
+    rules = [option.rule for option in template.options]
+    assert rules == [Fraction(-1), None, Fraction(1), Fraction(2)]
+
+    for variant in _variants(engine, template):
+        total, classes = _slot_values(variant["content"])
+        answer = total / classes
+        assert variant["answer"] == "B"
+        assert [_value(option) for option in variant["options"]] == [answer - 1, answer, answer + 1, answer + 2]
+        assert all(option.startswith(letter) for option, letter in zip(variant["options"], "ABCD"))
+
+
+def test_choice_distractor_keeps_wrong_operation():
+    engine = VariantEngine()
+    question = {"type": "choice", "content": "学校有36名男生和28名女生，一共有多少名学生？",
+                "options": ["A. 64", "B. 8", "C. 54", "D. 74"], "answer": "A",
+                "explanation": "36+28=64（名）"}
+    template = engine.extract(question)
+    # B 对应 “用减法” 的错误解法，C、D 保持与答案的差
+    assert template.options[1].rule == ("-", ("slot", 0), ("slot", 1))
+    assert template.options[2].rule == Fraction(-10)
+
+    for variant in _variants(engine, template):
+        boys, girls = _slot_values(variant["content"])
+        values = [_value(option) for option in variant["options"]]
+        assert values[0] == boys + girls
+        assert values[2:] == [boys + girls - 10, boys + girls + 10]
+        # 减法结果为负时改用差值规则，选项不重复
+        assert values[1] in (boys - girls, boys + girls - 56)
+        assert len(set(values)) == 4
+
+
+@pytest.mark.parametrize("question", [
+    {"type": "fill", "content": "3时15分到3时45分经过了多少分钟？", "answer": "30分钟",
+     "explanation": "45-15=30（分钟）"},
+    {"type": "fill", "content": "电影8时开始，10时30分结束，放映了多少分钟？", "answer": "150分钟"},
+    {"type": "fill", "content": "5月1日到5月8日，一共是多少天？", "answer": "7天",
+     "explanation": "8-1=7（天）"},
+])
+def test_clock_and_date_questions_yield_no_variants(question):
+    engine = VariantEngine()
+    assert engine.extract(question) is None
+    assert engine.expand([question], 4, subject="数学", seed=1) == []
+
+
+@pytest.mark.parametrize("question, limited", [
+    ({"type": "solve", "content": "小红跑步用了1小时20分钟，又走路用了25分钟，一共用了多少分钟？",
+      "answer": "105分钟", "explanation": "60+20+25=105（分钟）"}, 1),
+    ({"type": "fill", "content": "小刚跳绳用了2分钟30秒，又休息了45秒，一共用了多少秒？",
+      "answer": "195秒", "explanation": "2×60=120（秒），120+30+45=195（秒）"}, 1),
+])
+def test_sexagesimal_slot_is_capped(question, limited):
+    engine = VariantEngine()
+    template = engine.extract(question)
+    assert template is not None
+    assert template.slots[limited].limit == 60
+    for seed in range(200):
+        value = engine._sample(random.Random(seed), template.slots[limited])
+        assert 0 < value < 60
+    for variant in _variants(engine, template):
+        assert _slot_values(variant["content"])[limited] < 60
+
+
+def test_wrong_calculation_in_explanation_is_rejected():
+    question = {"type": "solve", "content": "小明有24个苹果，又买了15个，现在一共有多少个苹果？",
+                "answer": "40个", "explanation": "24+15=40（个）"}
+    assert arithmetic_steps(question["explanation"]) is None
+    assert VariantEngine().extract(question) is None
+    # 讲解有误时也不按题干数字穷举
+    assert VariantEngine().extract({**question, "answer": "39个"}) is None
@@ -4,6 +4,7 @@ from datetime import datetime, timedelta
 from typing import Optional
 from jose import jwt
 from cryptography.fernet import Fernet
+from functools import lru_cache
 import os
 import base64
 
@@ -51,13 +52,18 @@ def get_encryption_key() -> bytes:
     key = base64.urlsafe_b64encode(ENCRYPTION_KEY.encode()[:32].ljust(32, b'0'))
     return key
 
+@lru_cache(maxsize=1)
+def get_fernet() -> Fernet:
+    """获取复用的Fernet实例（加密密钥在进程生命周期内不变）"""
+    return Fernet(get_encryption_key())
+
 def encrypt_api_key(api_key: str) -> str:
     """加密API密钥"""
     if not api_key or api_key.startswith("your-"):
         return api_key  # 不加密占位符
     
     try:
-        f = Fernet(get_encryption_key())
+        f = get_fernet()
         encrypted = f.encrypt(api_key.encode())
         return base64.urlsafe_b64encode(encrypted).decode()
     except Exception:
@@ -69,7 +75,7 @@ def decrypt_api_key(encrypted_api_key: str) -> str:
         return encrypted_api_key  # 不解密占位符
     
     try:
-        f = Fernet(get_encryption_key())
+        f = get_fernet()
         encrypted_bytes = base64.urlsafe_b64decode(encrypted_api_key.encode())
         decrypted = f.decrypt(encrypted_bytes)
         return decrypted.decode()